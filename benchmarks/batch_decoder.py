@@ -0,0 +1,61 @@
+##
+# @file benchmarks/batch_decoder.py
+# @brief Compares numpy batch decoding of fixed-size records against the per-record decoder.
+# @details usage: python benchmarks/batch_decoder.py [--fields F] [--records N] [--repeat R]
+#          One message of a synthetic protocol is decoded from N concatenated records, with
+#          transmute.runtime.decodeBatch and with a loop over the compiled class of the message.
+#          Requires numpy.
+#
+import time
+import argparse
+import random
+import synthetic
+from   transmute.plugins import base, wireshark
+from   transmute         import runtime
+
+##
+# @name best_of
+# @brief Time a callable.
+# @param fxn [in] The callable
+# @param repeat [in] The number of runs
+# @return float The fastest run, in seconds
+def best_of(fxn, repeat):
+   best = None
+   for r in range(repeat):
+      start = time.perf_counter()
+      fxn()
+      elapsed = time.perf_counter() - start
+      best = elapsed if best is None else min(best, elapsed)
+   return best
+
+def main():
+   args_parser = argparse.ArgumentParser(description="Compare numpy batch decoding of fixed-size records against the per-record decoder.")
+   args_parser.add_argument('--fields',  type=int, default=100,    help="The number of fields of the message (default is 100).")
+   args_parser.add_argument('--records', type=int, default=100000, help="The number of records (default is 100000).")
+   args_parser.add_argument('--repeat',  type=int, default=3,      help="The number of timed runs (default is 3).")
+   ns = args_parser.parse_args()
+
+   protocol = synthetic.load(synthetic.spec(1, ns.fields), [base, wireshark])
+   message  = next(iter(protocol.messages.values()))
+   cls      = runtime.compile(protocol).classes[message.abbreviation]
+   layout   = runtime.batchLayout(message)
+   buf      = random.Random(2463534242).getrandbits(8 * cls.size * ns.records).to_bytes(cls.size * ns.records, 'little')
+
+   columns = runtime.decodeBatch(layout, buf)
+   record  = cls.decode(buf, cls.size * (ns.records // 2))
+   for name, column in columns.items():
+      value = column[ns.records // 2]
+      if (bytes(value) if column.ndim == 2 else value.item()) != getattr(record, name):
+         raise SystemExit("{} decodes differently: {!r} != {!r}".format(name, value, getattr(record, name)))
+
+   decode  = cls.decode
+   size    = cls.size
+   batched = best_of(lambda: runtime.decodeBatch(layout, buf), ns.repeat)
+   looped  = best_of(lambda: [decode(buf, i) for i in range(0, size * ns.records, size)], ns.repeat)
+   print("batch decoder: {} records of {} fields ({} bytes each), best of {}".format(ns.records, ns.fields, size, ns.repeat))
+   for name, elapsed in (('numpy decodeBatch', batched), ('per-record classes', looped)):
+      print("   {:<20} {:8.3f} s {:14,.0f} records/s {:10.1f} MB/s".format(name, elapsed, ns.records / elapsed, len(buf) / elapsed / 1e6))
+   print("   speedup              {:8.2f}x".format(looped / batched))
+
+if __name__ == '__main__':
+   main()
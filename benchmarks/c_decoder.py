@@ -0,0 +1,55 @@
+##
+# @file benchmarks/c_decoder.py
+# @brief Builds the C decoder of a large synthetic protocol and measures its decoding rate.
+# @details usage: python benchmarks/c_decoder.py [--messages M] [--fields F] [--iterations N] [--cc CC] [--cflags FLAGS]
+#          The decoder and its benchmark main() are generated into a temporary folder, compiled
+#          with the local compiler, and run. Each message type is decoded N times from
+#          pseudo-random buffers.
+#
+import os
+import subprocess
+import tempfile
+import time
+import argparse
+import synthetic
+from   transmute.Output  import Sink
+from   transmute.plugins import base, wireshark, cdecoder
+
+def main():
+   args_parser = argparse.ArgumentParser(description="Build the C decoder of a large synthetic protocol and measure its decoding rate.")
+   args_parser.add_argument('--messages',   type=int, default=100,     help="The number of messages (default is 100).")
+   args_parser.add_argument('--fields',     type=int, default=100,     help="The number of fields per message (default is 100).")
+   args_parser.add_argument('--iterations', type=int, default=1000000, help="The number of decodes of each message type (default is 1000000).")
+   args_parser.add_argument('--cc',                   default='gcc',   help="The C compiler (default is gcc).")
+   args_parser.add_argument('--cflags',               default='-std=c99 -O2 -Wall', help="The compiler flags (default is '-std=c99 -O2 -Wall').")
+   ns = args_parser.parse_args()
+
+   with tempfile.TemporaryDirectory() as folder:
+      protocol = synthetic.load(synthetic.spec(ns.messages, ns.fields), [base, wireshark, cdecoder], ['-c', '--c-out', folder])
+      sink  = Sink.create('buffered')
+      start = time.perf_counter()
+      cdecoder.dispatch(protocol, sink)
+      sink.close()
+      emitted = time.perf_counter() - start
+      build   = os.path.join(folder, protocol.abbreviation)
+      program = os.path.join(build, 'bench')
+      start   = time.perf_counter()
+      subprocess.check_call([ns.cc] + ns.cflags.split() + ['-o', program] + [os.path.join(build, '{}_{}.c'.format(protocol.abbreviation, f)) for f in ('bench', 'decoder')])
+      compiled = time.perf_counter() - start
+      output   = subprocess.check_output([program, str(ns.iterations)], universal_newlines=True).splitlines()
+
+   rates = [(line.split()[0], float(line.split()[1])) for line in output[1:] if line.split()[-1] == 'messages/s']
+   per_message = [r for r in rates if r[0] != 'all']
+   print("C decoder: {} messages x {} fields, {} decodes each".format(ns.messages, ns.fields, ns.iterations))
+   print("   emitted in {:.3f} s, compiled in {:.3f} s ({} {})".format(emitted, compiled, ns.cc, ns.cflags))
+   if per_message:
+      slowest = min(per_message, key=lambda r: r[1])
+      fastest = max(per_message, key=lambda r: r[1])
+      print("   slowest {:<12} {:14,.0f} messages/s".format(slowest[0], slowest[1]))
+      print("   fastest {:<12} {:14,.0f} messages/s".format(fastest[0], fastest[1]))
+   for name, rate in rates:
+      if name == 'all':
+         print("   overall {:<12} {:14,.0f} messages/s".format('', rate))
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,86 @@
+##
+# @file benchmarks/capture_decode.py
+# @brief Measures the rate at which transmute.capture decodes a synthetic capture.
+# @details usage: python benchmarks/capture_decode.py [--messages M] [--fields F] [--packets N] [--repeat R] [--jobs J]
+#          A pcap capture of N Ethernet/IPv4/UDP packets is written to a temporary file. Each
+#          packet carries one message of a synthetic protocol, selected by the type field of the
+#          protocol header. The capture is then decoded to JSON lines and to CSV, discarding the
+#          output, by one process and by a pool of J worker processes.
+#
+import os
+import random
+import struct
+import tempfile
+import time
+import argparse
+import synthetic
+from   transmute.plugins import base, wireshark, pydecoder
+from   transmute         import capture
+
+##
+# @name udp_frame
+# @brief Wrap a payload in Ethernet, IPv4 and UDP headers.
+# @param data [in] The payload
+# @param port [in] The UDP destination port
+# @return bytes The frame
+def udp_frame(data, port):
+   udp = struct.pack('>HHHH', 49152, port, 8 + len(data), 0)
+   ip  = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(udp) + len(data), 0, 0x4000, 64, 17, 0, b'\x0a\x00\x00\x01', b'\x0a\x00\x00\x02')
+   return b'\x00\x00\x5e\x00\x53\x01\x00\x00\x5e\x00\x53\x02\x08\x00' + ip + udp + data
+
+##
+# @name write_pcap
+# @brief Write frames to a pcap file.
+# @param stream [in] The binary stream
+# @param frames [in] The Ethernet frames
+def write_pcap(stream, frames):
+   stream.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+   for i, frame in enumerate(frames):
+      stream.write(struct.pack('<IIII', 1500000000 + i // 1000, (i % 1000) * 1000, len(frame), len(frame)))
+      stream.write(frame)
+
+def main():
+   args_parser = argparse.ArgumentParser(description="Measure the rate at which transmute.capture decodes a synthetic capture.")
+   args_parser.add_argument('--messages', type=int, default=10,     help="The number of messages (default is 10).")
+   args_parser.add_argument('--fields',   type=int, default=20,     help="The number of fields per message (default is 20).")
+   args_parser.add_argument('--packets',  type=int, default=100000, help="The number of packets (default is 100000).")
+   args_parser.add_argument('--repeat',   type=int, default=3,      help="The number of timed runs (default is 3).")
+   args_parser.add_argument('--jobs',     type=int, default=os.cpu_count(), help="The number of worker processes of the parallel runs (default is the number of processors).")
+   ns = args_parser.parse_args()
+
+   protocol = synthetic.load(synthetic.spec(ns.messages, ns.fields), [base, wireshark, pydecoder])
+   sizes    = [pydecoder.c_section_size(m) for m in protocol.messages.values()]
+   rng      = random.Random(2463534242)
+   bodies   = [bytes(rng.getrandbits(8) for b in range(max(sizes))) for i in range(256)]
+   frames   = []
+   for i in range(ns.packets):
+      kind = i % ns.messages
+      frames.append(udp_frame(struct.pack('>HH', kind, sizes[kind]) + bodies[i % len(bodies)][:sizes[kind]], 9000))
+
+   handle, path = tempfile.mkstemp(suffix='.pcap')
+   try:
+      with os.fdopen(handle, 'wb') as stream:
+         write_pcap(stream, frames)
+      size = os.path.getsize(path)
+      print("capture decoder: {} packets of {} messages x {} fields, {:.1f} MB, best of {}".format(ns.packets, ns.messages, ns.fields, size / 1e6, ns.repeat))
+      for fmt in capture.formats:
+         serial = None
+         for jobs in sorted(set([1, ns.jobs])):
+            best = None
+            for r in range(ns.repeat):
+               with open(os.devnull, 'w', newline='') as out:
+                  start = time.perf_counter()
+                  stats = capture.decodeCapture(protocol, path, out, fmt, jobs=jobs)
+                  elapsed = time.perf_counter() - start
+               best = elapsed if best is None else min(best, elapsed)
+            if stats['records'] != ns.packets:
+               raise SystemExit("{} of {} packets decoded".format(stats['records'], ns.packets))
+            serial = best if jobs == 1 else serial
+            print("   {:<6} {:>2} jobs {:8.3f} s {:12,.0f} packets/s {:8.1f} MB/s {:6.2f}x".format(fmt, jobs, best, ns.packets / best, size / best / 1e6, serial / best))
+            for pid, worker in stats.get('workers', {}).items():
+               print("      worker {:<8} {:3} shards {:12,.0f} packets/s {:8.1f} MB/s".format(pid, worker['shards'], worker['packets'] / worker['elapsed'], worker['bytes'] / worker['elapsed'] / 1e6))
+   finally:
+      os.remove(path)
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,58 @@
+##
+# @file benchmarks/capture_stats.py
+# @brief Measures the rate at which transmute.capture collects field statistics over a synthetic capture.
+# @details usage: python benchmarks/capture_stats.py [--messages M] [--fields F] [--packets N] [--repeat R] [--batch B]
+#          The capture of benchmarks/capture_decode.py is written to a temporary file, and the
+#          statistics of every field are collected with transmute.capture.captureStats, decoding
+#          B records of a message at a time. numpy is required.
+#
+import os
+import random
+import struct
+import tempfile
+import time
+import argparse
+import synthetic
+from   capture_decode    import udp_frame, write_pcap
+from   transmute.plugins import base, wireshark, pydecoder
+from   transmute         import capture
+
+def main():
+   args_parser = argparse.ArgumentParser(description="Measure the rate at which transmute.capture collects field statistics over a synthetic capture.")
+   args_parser.add_argument('--messages', type=int, default=10,     help="The number of messages (default is 10).")
+   args_parser.add_argument('--fields',   type=int, default=20,     help="The number of fields per message (default is 20).")
+   args_parser.add_argument('--packets',  type=int, default=100000, help="The number of packets (default is 100000).")
+   args_parser.add_argument('--repeat',   type=int, default=3,      help="The number of timed runs (default is 3).")
+   args_parser.add_argument('--batch',    type=int, default=4096,   help="The number of records of a message decoded at a time (default is 4096).")
+   ns = args_parser.parse_args()
+
+   protocol = synthetic.load(synthetic.spec(ns.messages, ns.fields), [base, wireshark, pydecoder])
+   sizes    = [pydecoder.c_section_size(m) for m in protocol.messages.values()]
+   rng      = random.Random(2463534242)
+   bodies   = [bytes(rng.getrandbits(8) for b in range(max(sizes))) for i in range(256)]
+   frames   = []
+   for i in range(ns.packets):
+      kind = i % ns.messages
+      frames.append(udp_frame(struct.pack('>HH', kind, sizes[kind]) + bodies[i % len(bodies)][:sizes[kind]], 9000))
+
+   handle, path = tempfile.mkstemp(suffix='.pcap')
+   try:
+      with os.fdopen(handle, 'wb') as stream:
+         write_pcap(stream, frames)
+      size = os.path.getsize(path)
+      print("capture statistics: {} packets of {} messages x {} fields, {:.1f} MB, batches of {}, best of {}".format(ns.packets, ns.messages, ns.fields, size / 1e6, ns.batch, ns.repeat))
+      best = None
+      for r in range(ns.repeat):
+         start   = time.perf_counter()
+         report  = capture.captureStats(protocol, path, batch=ns.batch)
+         elapsed = time.perf_counter() - start
+         best = elapsed if best is None else min(best, elapsed)
+      messages = sum(s['records'] for a, s in report.items() if a in protocol.messages)
+      if messages != ns.packets:
+         raise SystemExit("{} of {} packets counted".format(messages, ns.packets))
+      print("   {:8.3f} s {:12,.0f} packets/s {:8.1f} MB/s".format(best, ns.packets / best, size / best / 1e6))
+   finally:
+      os.remove(path)
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,77 @@
+##
+# @file benchmarks/classifier.py
+# @brief Compares classifying records by message type against decoding them.
+# @details usage: python benchmarks/classifier.py [--messages M] [--fields F] [--records N] [--repeat R]
+#          Records of a synthetic protocol, a header and one of M messages each, are classified
+#          with transmute.runtime.compileClassifier, with transmute.runtime.classifyBatch when
+#          numpy is installed, and by decoding the header and the message the way the capture
+#          decoder does. All three must agree.
+#
+import time
+import argparse
+import random
+import struct
+import synthetic
+from   transmute.plugins import base, wireshark, pydecoder
+from   transmute         import runtime, capture
+
+##
+# @name best_of
+# @brief Time a callable.
+# @param fxn [in] The callable
+# @param repeat [in] The number of runs
+# @return (float, object) The fastest run, in seconds, and the result of the last run
+def best_of(fxn, repeat):
+   best = None
+   for r in range(repeat):
+      start   = time.perf_counter()
+      result  = fxn()
+      elapsed = time.perf_counter() - start
+      best = elapsed if best is None else min(best, elapsed)
+   return best, result
+
+def main():
+   args_parser = argparse.ArgumentParser(description="Compare classifying records by message type against decoding them.")
+   args_parser.add_argument('--messages', type=int, default=50,     help="The number of messages (default is 50).")
+   args_parser.add_argument('--fields',   type=int, default=20,     help="The number of fields per message (default is 20).")
+   args_parser.add_argument('--records',  type=int, default=100000, help="The number of records (default is 100000).")
+   args_parser.add_argument('--repeat',   type=int, default=3,      help="The number of timed runs (default is 3).")
+   ns = args_parser.parse_args()
+
+   protocol = synthetic.load(synthetic.spec(ns.messages, ns.fields), [base, wireshark])
+   header   = pydecoder.c_section_size(protocol.header)
+   stride   = header + max(pydecoder.c_section_size(m) for m in protocol.messages.values())
+   rng      = random.Random(2463534242)
+   buf      = bytearray(rng.getrandbits(8 * stride * ns.records).to_bytes(stride * ns.records, 'little'))
+   for i in range(ns.records):
+      #a few records have no registered type
+      struct.pack_into('>H', buf, i * stride, rng.randrange(ns.messages + ns.messages // 10))
+   buf      = bytes(buf)
+   classify = runtime.compileClassifier(protocol)
+   router   = capture.Router(protocol)
+
+   def routed():
+      rv = []
+      for i in range(0, stride * ns.records, stride):
+         last = router.route(buf[i:i + stride], protocol, {})
+         rv.append(last.abbreviation if last is not protocol else None)
+      return rv
+
+   runs = [('compiled classifier', lambda: [classify(buf, i) for i in range(0, stride * ns.records, stride)], list),
+           ('decode and route',    routed,                                                              list)]
+   if runtime.numpy is not None:
+      names = tuple(protocol.messages.keys())
+      runs.insert(1, ('numpy classifyBatch', lambda: runtime.classifyBatch(protocol, buf, stride=stride)[0],
+                      lambda codes: [names[c] if c >= 0 else None for c in codes.tolist()]))
+   print("classifier: {} records of {} messages x {} fields ({} bytes each), best of {}".format(ns.records, ns.messages, ns.fields, stride, ns.repeat))
+   expected = None
+   for name, fxn, convert in runs:
+      elapsed, result = best_of(fxn, ns.repeat)
+      result = convert(result)
+      if expected is not None and result != expected:
+         raise SystemExit("{} classifies differently".format(name))
+      expected = result
+      print("   {:<20} {:8.3f} s {:14,.0f} records/s".format(name, elapsed, ns.records / elapsed))
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,122 @@
+##
+# @file benchmarks/py_decoder.py
+# @brief Measures the decoding rate of the generated Python decoder module of a large synthetic protocol.
+# @details usage: python benchmarks/py_decoder.py [--messages M] [--fields F] [--iterations N] [--touch K]
+#          The generated classes are compared against a naive decoder that slices every field
+#          out of the buffer and converts it with int.from_bytes. Both decoders first decode the
+#          same buffers, and must agree. Finally, the eager classes are compared against the lazy
+#          views of transmute.runtime when a filter reads only a few fields of each message.
+#
+import os
+import random
+import struct
+import time
+import argparse
+import operator
+import synthetic
+from   transmute.Output.Sink import MemorySink
+from   transmute.plugins     import base, wireshark, pydecoder
+from   transmute             import runtime
+
+##
+# @name naive_field
+# @brief Build the naive decoder of one field.
+# @param layout [in] The FieldLayout of the field
+# @return callable Decodes the field from a buffer
+def naive_field(layout):
+   start, end = layout.byteoffset, layout.byteoffset + layout.bytelength
+   def decode(buf):
+      raw = buf[start:end]
+      if layout.kind == 'undecoded':
+         return bytes(raw)
+      if layout.kind in ('float', 'double'):
+         return struct.unpack(('>' if layout.endian == 'big' else '<') + layout.kind[0], raw)[0]
+      value = (int.from_bytes(raw, layout.endian) & layout.mask) >> layout.shift
+      if layout.signed and value >= 1 << (layout.bits - 1):
+         value -= 1 << layout.bits
+      if layout.kind == 'weighted':
+         value = value * layout.lsb + layout.offset
+      elif layout.kind == 'bool':
+         value = value != 0
+      return value
+   return decode
+
+##
+# @name naive_section
+# @brief Build the naive decoder of a message, header or trailer.
+# @param section [in] The section
+# @return callable Decodes the section from a buffer into a dict
+def naive_section(section):
+   members = pydecoder.py_members(section)
+   fields  = [(members[a], naive_field(base.fieldLayout(f))) for a, f in section.fields.items()]
+   parts   = [(s, naive_section(getattr(section, s))) for s in ('header', 'trailer') if getattr(section, s, None) is not None]
+   def decode(buf):
+      rv = dict((name, fxn(buf)) for name, fxn in parts)
+      for name, fxn in fields:
+         rv[name] = fxn(buf)
+      return rv
+   return decode
+
+##
+# @name as_dict
+# @brief Convert a decoded object to the dict the naive decoder produces.
+def as_dict(obj):
+   return dict((n, as_dict(getattr(obj, n)) if n in ('header', 'trailer') else getattr(obj, n)) for n in obj._fields)
+
+##
+# @name rate
+# @brief Time a decoder over a list of buffers.
+# @return float The number of messages decoded per second
+def rate(decode, buffers, iterations):
+   count = len(buffers)
+   start = time.perf_counter()
+   for i in range(iterations):
+      decode(buffers[i % count])
+   return iterations / (time.perf_counter() - start)
+
+def main():
+   args_parser = argparse.ArgumentParser(description="Measure the decoding rate of the generated Python decoder of a large synthetic protocol.")
+   args_parser.add_argument('--messages',   type=int, default=20,    help="The number of messages (default is 20).")
+   args_parser.add_argument('--fields',     type=int, default=100,   help="The number of fields per message (default is 100).")
+   args_parser.add_argument('--iterations', type=int, default=20000, help="The number of decodes of each message type (default is 20000).")
+   args_parser.add_argument('--touch',      type=int, default=3,     help="The number of fields a filter reads from each message (default is 3).")
+   ns = args_parser.parse_args()
+
+   protocol = synthetic.load(synthetic.spec(ns.messages, ns.fields), [base, wireshark, pydecoder], ['-py', '--python-out', '.'])
+   sink = MemorySink()
+   pydecoder.dispatch(protocol, sink)
+   path, text = next(iter(sink.files.items()))
+   module = {'__name__': os.path.splitext(os.path.basename(path))[0]}
+   exec(compile(text, path, 'exec'), module)
+
+   rng     = random.Random(2463534242)
+   size    = max(cls.size for cls in module['messages'])
+   buffers = [bytes(rng.getrandbits(8) for b in range(size)) for i in range(256)]
+   print("python decoder: {} messages x {} fields, {} decodes each".format(ns.messages, ns.fields, ns.iterations))
+   generated_total = naive_total = 0
+   for message, cls in zip(protocol.messages.values(), module['messages']):
+      naive = naive_section(message)
+      for buf in buffers:
+         if as_dict(cls.decode(buf)) != naive(buf):
+            raise SystemExit("{} decodes differently: {!r} != {!r}".format(message.abbreviation, cls.decode(buf), naive(buf)))
+      generated_total += ns.iterations / rate(cls.decode, buffers, ns.iterations)
+      naive_total     += ns.iterations / rate(naive,      buffers, ns.iterations)
+   count = ns.messages * ns.iterations
+   print("   generated struct.Struct {:12,.0f} messages/s".format(count / generated_total))
+   print("   naive int.from_bytes    {:12,.0f} messages/s".format(count / naive_total))
+   print("   speedup                 {:12.2f}x".format(naive_total / generated_total))
+
+   views = runtime.compile(protocol, lazy=True)
+   eager_total = lazy_total = 0
+   for cls, view in zip(module['messages'], views.messages):
+      #read fields spread across the message
+      touched = operator.attrgetter(*cls._fields[::max(1, len(cls._fields) // ns.touch)][:ns.touch])
+      eager_total += ns.iterations / rate(lambda buf: touched(cls.decode(buf)),  buffers, ns.iterations)
+      lazy_total  += ns.iterations / rate(lambda buf: touched(view.decode(buf)), buffers, ns.iterations)
+   print("reading {} fields of each message:".format(ns.touch))
+   print("   eager classes           {:12,.0f} messages/s".format(count / eager_total))
+   print("   lazy views              {:12,.0f} messages/s".format(count / lazy_total))
+   print("   speedup                 {:12.2f}x".format(eager_total / lazy_total))
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,100 @@
+##
+# @file benchmarks/synthetic.py
+# @brief Helpers shared by the benchmarks: synthetic protocol specifications and plugin setup.
+#
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from transmute.Parsing import Parser
+
+##
+# @brief The namespace used for wireshark elements in synthetic specifications
+ws_namespace = 'urn:transmute:wireshark'
+
+##
+# @name field_xml
+# @brief Build the XML of one synthetic field.
+# @param abbr [in] The field abbreviation
+# @param kind [in] Selects the field type and layout
+# @param index [in] The first chunk of the field
+# @return (str, int) The XML, and the number of chunks the field occupies
+def field_xml(abbr, kind, index):
+   description = '<description name="{0}" abbreviation="{0}"><brief>{0}</brief></description>'.format(abbr)
+   kind = kind % 6
+   if   kind == 0:
+      return ('<field type="unsigned int">{}<position index="{}"><chunks length="2"/></position></field>'.format(description, index), 2)
+   elif kind == 1:
+      return (''.join(['<field type="int">{}<position index="{}"><bits start="0" end="3"/></position></field>'.format(description, index),
+                       '<field type="unsigned int">{}<position index="{}"><bits start="4" end="7"/></position></field>'.format(description.replace(abbr, abbr + '_hi'), index)
+                      ]), 1)
+   elif kind == 2:
+      return ('<field type="weighted">{}<position index="{}"><chunks length="2"/></position><weight lsb="0.25" offset="-3"/></field>'.format(description, index), 2)
+   elif kind == 3:
+      return ('<field type="enum">{}<position index="{}"><chunks length="1"/></position><values><value name="{n}_OFF" int="0"/><value name="{n}_ON" int="1"/><value name="{n}_AUTO" int="2"/></values></field>'.format(description, index, n=abbr.replace('.', '_').upper()), 1)
+   elif kind == 4:
+      return ('<field type="unsigned weighted">{}<position index="{}"><chunks length="4"/></position><weight lsb="0.001"/></field>'.format(description, index), 4)
+   else:
+      return ('<field type="undecoded">{}<position index="{}"><chunks length="3"/></position></field>'.format(description, index), 3)
+
+##
+# @name spec
+# @brief Build a synthetic protocol specification.
+# @param messages [in] The number of messages
+# @param fields [in] The number of fields in each message
+# @param abbr [in] The protocol abbreviation
+# @return str The XML specification
+def spec(messages, fields, abbr='syn'):
+   xml = ['<protocol endian="big" bit0="LSb" chunksize="8">',
+          '<description name="Synthetic" abbreviation="{0}"><brief>Synthetic protocol</brief></description>'.format(abbr),
+          '<version major="1" minor="0" micro="0" extra="0"/>',
+          '<header><description name="Header" abbreviation="{0}.hdr"><brief>Header</brief></description>'.format(abbr),
+          '<field type="unsigned int"><description name="Type" abbreviation="{0}.hdr.type"><brief>Type</brief></description><position index="0"><chunks length="2"/></position></field>'.format(abbr),
+          '<field type="unsigned int"><description name="Length" abbreviation="{0}.hdr.len"><brief>Length</brief></description><position index="2"><chunks length="2"/></position></field>'.format(abbr),
+          '</header>',
+          '<ws:expose xmlns:ws="{}" field="{}.hdr.type"/>'.format(ws_namespace, abbr)
+         ]
+   for m in range(messages):
+      mabbr = '{}.m{}'.format(abbr, m)
+      xml.append('<message><description name="Message {0}" abbreviation="{1}"><brief>Message {0}</brief></description>'.format(m, mabbr))
+      xml.append('<ws:register xmlns:ws="{}" table="{}.hdr.type" value="{}"/>'.format(ws_namespace, abbr, m))
+      index = 0
+      for f in range(fields):
+         text, length = field_xml('{}.f{}'.format(mabbr, f), f + m, index)
+         xml.append(text)
+         index += length
+      xml.append('</message>')
+   xml.append('</protocol>')
+   return '\n'.join(xml)
+
+##
+# @name load
+# @brief Register the given plugins and parse a specification.
+# @param text [in] The XML specification
+# @param plugins [in] The plugin modules to register
+# @param argv [in] The plugin command line arguments
+# @return The validated Protocol
+def load(text, plugins, argv=()):
+   args_parser = argparse.ArgumentParser(add_help=False)
+   args_parser.add_argument('protofile')
+   args_parser.add_argument('-n', '--dry-run', default=False, action='store_true')
+   args_parser.add_argument('-j', '--jobs',    default=1,     type=int)
+   xml_parser = Parser.Parser()
+   saved, sys.argv = sys.argv, ['benchmark', 'synthetic.xml'] + list(argv)
+   try:
+      for plugin in plugins:
+         plugin.register(args_parser, xml_parser)
+   finally:
+      sys.argv = saved
+   protocol = next(xml_parser.parseString(text))
+   protocol.Validate(None)
+   return protocol
+
+if __name__ == '__main__':
+   args_parser = argparse.ArgumentParser(description="Write a synthetic protocol specification to stdout.")
+   args_parser.add_argument('--messages', type=int, default=100, help="The number of messages (default is 100).")
+   args_parser.add_argument('--fields',   type=int, default=100, help="The number of fields per message (default is 100).")
+   ns = args_parser.parse_args()
+   print(spec(ns.messages, ns.fields))
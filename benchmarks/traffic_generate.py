@@ -0,0 +1,57 @@
+##
+# @file benchmarks/traffic_generate.py
+# @brief Measures the rate at which transmute.traffic generates messages of a synthetic protocol.
+# @details usage: python benchmarks/traffic_generate.py [--messages M] [--fields F] [--records N] [--repeat R]
+#          N random messages of a synthetic protocol are written as raw records and as a pcap
+#          capture, discarding the output, with numpy batches when numpy is installed and with the
+#          compiled encoders. The pcap capture is then decoded with transmute.capture, which must
+#          find every message.
+#
+import os
+import tempfile
+import time
+import argparse
+import synthetic
+from   transmute.plugins import base, wireshark, pydecoder
+from   transmute         import capture, traffic
+
+def main():
+   args_parser = argparse.ArgumentParser(description="Measure the rate at which transmute.traffic generates messages of a synthetic protocol.")
+   args_parser.add_argument('--messages', type=int, default=10,     help="The number of messages (default is 10).")
+   args_parser.add_argument('--fields',   type=int, default=20,     help="The number of fields per message (default is 20).")
+   args_parser.add_argument('--records',  type=int, default=100000, help="The number of records (default is 100000).")
+   args_parser.add_argument('--repeat',   type=int, default=3,      help="The number of timed runs (default is 3).")
+   ns = args_parser.parse_args()
+
+   protocol = synthetic.load(synthetic.spec(ns.messages, ns.fields), [base, wireshark, pydecoder])
+   engines  = [('numpy', traffic.numpy), ('encoders', None)] if traffic.numpy is not None else [('encoders', None)]
+   numpy    = traffic.numpy
+   print("traffic generator: {} records of {} messages x {} fields, best of {}".format(ns.records, ns.messages, ns.fields, ns.repeat))
+   try:
+      for engine, module in engines:
+         traffic.numpy = module
+         for fmt in traffic.formats:
+            best = None
+            for r in range(ns.repeat):
+               with open(os.devnull, 'wb') as out:
+                  start   = time.perf_counter()
+                  stats   = traffic.generateTraffic(protocol, out, ns.records, fmt, seed=r, port=9000)
+                  elapsed = time.perf_counter() - start
+               best = elapsed if best is None else min(best, elapsed)
+            print("   {:<8} {:<4} {:8.3f} s {:12,.0f} records/s {:8.1f} MB/s".format(engine, fmt, best, ns.records / best, stats['bytes'] / best / 1e6))
+   finally:
+      traffic.numpy = numpy
+
+   handle, path = tempfile.mkstemp(suffix='.pcap')
+   try:
+      with os.fdopen(handle, 'wb') as stream:
+         traffic.generateTraffic(protocol, stream, ns.records, 'pcap', seed=0, port=9000)
+      with open(os.devnull, 'w', newline='') as out:
+         stats = capture.decodeCapture(protocol, path, out, ports=[9000])
+      if stats['records'] != ns.records or stats['short']:
+         raise SystemExit("{} of {} generated messages decoded".format(stats['records'], ns.records))
+   finally:
+      os.remove(path)
+
+if __name__ == '__main__':
+   main()
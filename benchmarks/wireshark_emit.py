@@ -0,0 +1,67 @@
+##
+# @file benchmarks/wireshark_emit.py
+# @brief Times Wireshark dissector emission for a large synthetic protocol.
+# @details usage: python benchmarks/wireshark_emit.py [--messages M] [--fields F] [--repeat R] [--jobs J]
+#          The default protocol has 100 messages of 100 fields (10k fields). The
+#          compiled templates are also compared against str.format on the same text.
+#
+import time
+import argparse
+import synthetic
+from   transmute.Output.Sink import MemorySink
+from   transmute.plugins     import base, wireshark
+
+##
+# @name best_of
+# @brief Time a callable.
+# @param fxn [in] The callable
+# @param repeat [in] The number of runs
+# @return float The fastest run, in seconds
+def best_of(fxn, repeat):
+   best = None
+   for r in range(repeat):
+      start = time.perf_counter()
+      fxn()
+      elapsed = time.perf_counter() - start
+      best = elapsed if best is None else min(best, elapsed)
+   return best
+
+##
+# @name bench_templates
+# @brief Compare the per-field templates against str.format on the same text.
+# @param count [in] The number of renders per template
+def bench_templates(count):
+   constants = {'indent':wireshark._ws_indent, 'transmute_version':wireshark.transmute_version, 'plugin_version':wireshark.version_string}
+   samples = {'field_item'   : {'name':'syn_m0_f0', 'endian':'BIG', 'length':2, 'offset':0},
+              'header_field' : {'name':'syn_m0_f0', 'brief':'syn.m0.f0', 'abbreviation':'syn.m0.f0', 'ftype':'UINT16', 'btype':'HEX', 'VALS':'NULL', 'mask':0, 'detail':'syn.m0.f0'},
+              'field_bits'   : {'width':32, 'source':'chunk_0_16', 'andv':'0xffff', 'shift':0}
+             }
+   for name, fields in samples.items():
+      template = wireshark._ws_templates[name]
+      text     = template.text
+      formatted = best_of(lambda: [text.format(**dict(constants, **fields)) for i in range(count)], 3)
+      compiled  = best_of(lambda: [template(**fields) for i in range(count)], 3)
+      print("   {:<14} str.format {:8.1f} ms   template {:8.1f} ms   ({:.2f}x)".format(name, formatted * 1e3, compiled * 1e3, formatted / compiled))
+
+def main():
+   args_parser = argparse.ArgumentParser(description="Time Wireshark dissector emission for a large synthetic protocol.")
+   args_parser.add_argument('--messages', type=int, default=100, help="The number of messages (default is 100).")
+   args_parser.add_argument('--fields',   type=int, default=100, help="The number of fields per message (default is 100).")
+   args_parser.add_argument('--repeat',   type=int, default=3,   help="The number of timed runs (default is 3).")
+   args_parser.add_argument('--jobs',     type=int, default=1,   help="The number of worker processes (default is 1).")
+   ns = args_parser.parse_args()
+
+   protocol = synthetic.load(synthetic.spec(ns.messages, ns.fields), [base, wireshark], ['-ws', '--wireshark-out', '.', '--jobs', str(ns.jobs)])
+   sinks = []
+   def emit():
+      sinks.append(MemorySink())
+      wireshark.dispatch(protocol, sinks[-1])
+   elapsed = best_of(emit, ns.repeat)
+   size = sum(len(text) for text in sinks[-1].files.values())
+   print("wireshark emission: {} messages x {} fields, {} jobs".format(ns.messages, ns.fields, ns.jobs))
+   print("   best of {}: {:.3f} s, {:.1f} KiB of output".format(ns.repeat, elapsed, size / 1024))
+   print("templates ({} renders each):".format(ns.messages * ns.fields))
+   bench_templates(ns.messages * ns.fields)
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,123 @@
+##
+# @file tests/rich.py
+# @brief The specification and random records that the decoder tests share.
+# @details The specification is MSb and little endian, with a header ending in a bit field,
+#          bit fields, one of them sharing its chunk with a boolean, weighted fields, 24-bit
+#          integers and enumerations with ranges. The value every decoder must give for a field
+#          is decoded straight from the field's FieldLayout.
+#
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from   transmute.Parsing import Parser
+from   transmute.plugins import base, wireshark, pydecoder, cdecoder
+from   transmute         import runtime
+
+##
+# @brief The specification every decoder is generated from
+spec = '''<protocol endian="little" bit0="MSb" chunksize="8">
+<description name="Rich" abbreviation="rich"><brief>Rich</brief></description>
+<version major="1" minor="0" micro="0" extra="0"/>
+<values name="switch"><value name="OFF" int="0"/><value name="ON" int="1"/></values>
+<header><description name="Header" abbreviation="rich.hdr"><brief>Header</brief></description>
+<field type="unsigned int"><description name="Type" abbreviation="rich.hdr.type"><brief>Type</brief></description><position index="0"><chunks length="1"/></position></field>
+<field type="unsigned int"><description name="Flags" abbreviation="rich.hdr.flags"><brief>Flags</brief></description><position index="1"><bits start="0" end="3"/></position></field>
+</header>
+<ws:expose xmlns:ws="urn:transmute:wireshark" field="rich.hdr.type"/>
+<message><description name="M0" abbreviation="rich.m0"><brief>M0</brief></description>
+<ws:register xmlns:ws="urn:transmute:wireshark" table="rich.hdr.type" value="0"/>
+<field type="enum"><description name="Range" abbreviation="rich.m0.r"><brief>Range</brief></description><position index="0"><chunks length="1"/></position>
+<values><value name="LOW" int="0" last="9"/><value name="MID" int="10" last="19"/><value name="HIGH" int="20"/></values></field>
+<field type="unsigned int"><description name="U24" abbreviation="rich.m0.u24"><brief>U24</brief></description><position index="1"><chunks length="3"/></position></field>
+<field type="int"><description name="S24" abbreviation="rich.m0.s24"><brief>S24</brief></description><position index="4"><chunks length="3"/></position></field>
+<field type="weighted"><description name="W" abbreviation="rich.m0.w"><brief>W</brief></description><position index="7"><chunks length="2"/></position><weight lsb="0.25" offset="-3"/></field>
+<field type="unsigned int"><description name="A" abbreviation="rich.m0.a"><brief>A</brief></description><position index="9"><bits start="0" end="2"/></position></field>
+<field type="int"><description name="B" abbreviation="rich.m0.b"><brief>B</brief></description><position index="9"><bits start="3" end="7"/></position></field>
+<field type="bool"><description name="G" abbreviation="rich.m0.g"><brief>G</brief></description><position index="10"><bits start="0" end="0"/></position></field>
+<field type="unsigned int"><description name="C" abbreviation="rich.m0.c"><brief>C</brief></description><position index="10"><bits start="1" end="7"/></position></field>
+<field type="enum"><description name="Power" abbreviation="rich.m0.p"><brief>Power</brief></description><position index="11"><chunks length="1"/></position><values name="switch"/></field>
+</message>
+<message><description name="M1" abbreviation="rich.m1"><brief>M1</brief></description>
+<ws:register xmlns:ws="urn:transmute:wireshark" table="rich.hdr.type" value="1"/>
+<header><description name="Message Header" abbreviation="rich.m1.hdr"><brief>Message Header</brief></description>
+<field type="unsigned int"><description name="Seq" abbreviation="rich.m1.hdr.seq"><brief>Seq</brief></description><position index="0"><chunks length="2"/></position></field>
+</header>
+<field type="enum"><description name="Light" abbreviation="rich.m1.light"><brief>Light</brief></description><position index="2"><chunks length="1"/></position>
+<values><value name="OFF" int="0"/><value name="ON" int="1"/><value name="Not set" int="2"/><value name="x-y" int="3"/></values></field>
+<field type="unsigned weighted"><description name="V" abbreviation="rich.m1.v"><brief>V</brief></description><position index="3"><bits start="2" end="7"/></position><weight lsb="0.5"/></field>
+<trailer><description name="Message Trailer" abbreviation="rich.m1.trl"><brief>Message Trailer</brief></description>
+<field type="unsigned int"><description name="CRC" abbreviation="rich.m1.trl.crc"><brief>CRC</brief></description><position index="5"><chunks length="2"/></position></field>
+</trailer>
+</message>
+</protocol>
+'''
+
+##
+# @name load
+# @brief Registers the plugins and parses the specification
+# @param argv [in] The plugin command line arguments
+# @param text [in] The specification
+# @return The validated Protocol
+def load(argv, text=spec):
+   args_parser = argparse.ArgumentParser(add_help=False)
+   args_parser.add_argument('protofile')
+   xml_parser = Parser.Parser()
+   saved, sys.argv = sys.argv, ['test', 'rich.xml'] + list(argv)
+   try:
+      for plugin in (base, wireshark, pydecoder, cdecoder):
+         plugin.register(args_parser, xml_parser)
+   finally:
+      sys.argv = saved
+   protocol = next(xml_parser.parseString(text))
+   protocol.Validate(None)
+   return protocol
+
+##
+# @name expected
+# @brief Decodes a field straight from its FieldLayout
+# @param layout [in] The FieldLayout
+# @param buf [in] The record
+# @return The value of the field
+def expected(layout, buf):
+   raw   = int.from_bytes(buf[layout.byteoffset:layout.byteoffset + layout.bytelength], layout.endian)
+   value = (raw & layout.mask) >> layout.shift
+   if layout.signed and value >> (layout.bits - 1):
+      value -= 1 << layout.bits
+   if layout.kind == 'bool':
+      return bool(value)
+   if layout.kind == 'weighted':
+      return value * layout.lsb + layout.offset
+   return value
+
+##
+# @class RichCase
+# @brief Loads the specification, with C decoder output to a temporary folder, and draws random records
+# @details records holds 500 records the size of the largest section.
+class RichCase(unittest.TestCase):
+   @classmethod
+   def setUpClass(cls):
+      cls.folder   = tempfile.mkdtemp()
+      cls.protocol = load(['-c', '--c-out', cls.folder])
+      cls.sections = cdecoder.c_sections(cls.protocol)
+      cls.size     = max(base.sectionSize(s) for s in cls.sections)
+      rng          = random.Random(2463534242)
+      cls.records  = [bytes(rng.getrandbits(8) for b in range(cls.size)) for i in range(500)]
+
+   @classmethod
+   def tearDownClass(cls):
+      shutil.rmtree(cls.folder, ignore_errors=True)
+
+   def expectedValues(self, section, buf):
+      return [expected(c.layout, buf) for c in runtime.sectionColumns(section)]
+
+   def decodedValues(self, section, decoded):
+      values = []
+      for c in runtime.sectionColumns(section):
+         value = decoded
+         for part in c.name.split('.'):
+            value = getattr(value, part)
+         values.append(value)
+      return values
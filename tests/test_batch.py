@@ -0,0 +1,45 @@
+##
+# @file tests/test_batch.py
+# @brief Checks that the numpy batch decoder agrees with each field's layout.
+# @details usage: python -m pytest tests
+#          The random records of rich.py are decoded into columns, also from an offset into the
+#          buffer and from records laid out with a larger stride.
+#
+import unittest
+from   transmute import runtime
+from   rich      import RichCase, expected
+
+try:
+   import numpy
+except ImportError:
+   numpy = None
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class BatchDecoding(RichCase):
+   def test_batch(self):
+      raw = b''.join(self.records)
+      for section in self.sections:
+         columns = runtime.decodeBatch(section, raw, stride=self.size)
+         for c in runtime.sectionColumns(section):
+            self.assertEqual(columns[c.name].tolist(), [expected(c.layout, buf) for buf in self.records], c.abbreviation)
+
+   def test_stride(self):
+      #each record is followed by three bytes the decoder skips, and the first record by none
+      raw = b'\xff' * 5 + b''.join(buf + b'\xee' * 3 for buf in self.records)
+      for section in self.sections:
+         columns = runtime.decodeBatch(section, raw, count=100, offset=5, stride=self.size + 3)
+         for c in runtime.sectionColumns(section):
+            self.assertEqual(columns[c.name].tolist(), [expected(c.layout, buf) for buf in self.records[:100]], c.abbreviation)
+
+   def test_layout(self):
+      raw = bytearray(b''.join(self.records))
+      for section in self.sections:
+         layout  = runtime.batchLayout(section, self.size)
+         columns = runtime.decodeBatch(layout, memoryview(raw))
+         self.assertEqual([c.name for c, key in layout.columns], [c.name for c in runtime.sectionColumns(section)])
+         self.assertEqual([len(column) for column in columns.values()], [len(self.records)] * len(columns))
+         with self.assertRaises(ValueError):
+            runtime.batchLayout(section, 1)
+
+if __name__ == '__main__':
+   unittest.main()
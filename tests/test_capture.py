@@ -0,0 +1,282 @@
+##
+# @file tests/test_capture.py
+# @brief Checks that the packets and payloads of pcap and pcapng captures are read correctly.
+# @details usage: python -m pytest tests
+#          Captures are written by hand in both byte orders, with microsecond and nanosecond pcap
+#          timestamps and pcapng interfaces of their own resolution and link type. Their payloads
+#          are then decoded against a specification routed by UDP port and message type, serially
+#          and by worker processes that decode shards of the capture, whose records are merged by
+#          time or as each shard is decoded.
+#
+import argparse
+import io
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+from   transmute.Parsing import Parser
+from   transmute.plugins import base, wireshark
+from   transmute         import capture
+
+##
+# @brief The specification the payloads are decoded against
+_spec = '''<protocol endian="big" bit0="MSb" chunksize="8">
+<description name="Ping" abbreviation="ping"><brief>Ping</brief></description>
+<version major="1" minor="0" micro="0" extra="0"/>
+<ws:register xmlns:ws="urn:transmute:wireshark" table="udp.port" value="9000"/>
+<header><description name="Header" abbreviation="ping.hdr"><brief>Header</brief></description>
+<field type="unsigned int"><description name="Type" abbreviation="ping.hdr.type"><brief>Type</brief></description><position index="0"><chunks length="1"/></position></field>
+</header>
+<ws:expose xmlns:ws="urn:transmute:wireshark" field="ping.hdr.type"/>
+<message><description name="Request" abbreviation="ping.request"><brief>Request</brief></description>
+<ws:register xmlns:ws="urn:transmute:wireshark" table="ping.hdr.type" value="1"/>
+<field type="unsigned int"><description name="Sequence" abbreviation="ping.request.seq"><brief>Sequence</brief></description><position index="0"><chunks length="2"/></position></field>
+</message>
+<message><description name="Reply" abbreviation="ping.reply"><brief>Reply</brief></description>
+<ws:register xmlns:ws="urn:transmute:wireshark" table="ping.hdr.type" value="2"/>
+<field type="unsigned int"><description name="Sequence" abbreviation="ping.reply.seq"><brief>Sequence</brief></description><position index="0"><chunks length="2"/></position></field>
+<field type="weighted"><description name="Delay" abbreviation="ping.reply.delay"><brief>Delay</brief></description><position index="2"><chunks length="2"/></position><weight lsb="0.5"/></field>
+</message>
+</protocol>
+'''
+
+##
+# @name load
+# @brief Registers the plugins and parses the specification
+# @return The validated Protocol
+def load():
+   args_parser = argparse.ArgumentParser(add_help=False)
+   args_parser.add_argument('protofile')
+   xml_parser = Parser.Parser()
+   saved, sys.argv = sys.argv, ['test', 'ping.xml']
+   try:
+      for plugin in (base, wireshark):
+         plugin.register(args_parser, xml_parser)
+   finally:
+      sys.argv = saved
+   protocol = next(xml_parser.parseString(_spec))
+   protocol.Validate(None)
+   return protocol
+
+##
+# @name udp4
+# @brief Wraps a payload in the Ethernet, IPv4 and UDP headers of a datagram
+# @param data [in] The payload
+# @param source [in] The UDP source port
+# @param destination [in] The UDP destination port
+# @param vlan [in] True to tag the frame with a VLAN
+# @return bytes The frame
+def udp4(data, source=1024, destination=9000, vlan=False):
+   udp = struct.pack('>HHHH', source, destination, 8 + len(data), 0) + data
+   ip  = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0x4000, 64, 17, 0, bytes([10, 0, 0, 1]), bytes([10, 0, 0, 2])) + udp
+   tag = struct.pack('>HH', 0x8100, 7) if vlan else b''
+   #the frame is padded like short ethernet frames are
+   return b'\x00' * 12 + tag + b'\x08\x00' + ip + b'\x00' * 4
+
+##
+# @name tcp6
+# @brief Wraps a payload in the Ethernet, IPv6 and TCP headers of a segment
+# @param data [in] The payload
+# @param source [in] The TCP source port
+# @param destination [in] The TCP destination port
+# @return bytes The frame
+def tcp6(data, source=9000, destination=2048):
+   tcp = struct.pack('>HHIIBBHHH', source, destination, 0, 0, 5 << 4, 0x18, 1024, 0, 0) + data
+   ip  = struct.pack('>IHBB16s16s', 6 << 28, len(tcp), 6, 64, b'\x00' * 16, b'\x00' * 16) + tcp
+   return b'\x00' * 12 + b'\x86\xdd' + ip
+
+##
+# @name pcap
+# @brief Writes a pcap capture
+# @param frames [in] The (seconds, fraction, data) of each packet
+# @param order [in] '<' or '>'
+# @param nano [in] True for nanosecond timestamps
+# @param linktype [in] The LINKTYPE_ of the capture
+# @return bytes The capture
+def pcap(frames, order='<', nano=False, linktype=1):
+   rv = [struct.pack(order + 'IHHiIII', 0xa1b23c4d if nano else 0xa1b2c3d4, 2, 4, 0, 0, 65535, linktype)]
+   for seconds, fraction, data in frames:
+      rv.append(struct.pack(order + 'IIII', seconds, fraction, len(data), len(data)) + data)
+   return b''.join(rv)
+
+##
+# @name block
+# @brief Writes a pcapng block, padding its body to 32 bits
+# @param order [in] '<' or '>'
+# @param kind [in] The block type
+# @param body [in] The block body
+# @return bytes The block
+def block(order, kind, body):
+   body  += b'\x00' * (-len(body) % 4)
+   length = 12 + len(body)
+   return struct.pack(order + 'II', kind, length) + body + struct.pack(order + 'I', length)
+
+##
+# @name section
+# @brief Writes a pcapng section header block
+# @param order [in] '<' or '>'
+# @return bytes The block
+def section(order):
+   return block(order, 0x0a0d0d0a, struct.pack(order + 'IHHq', 0x1a2b3c4d, 1, 0, -1))
+
+##
+# @name interface
+# @brief Writes a pcapng interface description block
+# @param order [in] '<' or '>'
+# @param linktype [in] The LINKTYPE_ of the interface
+# @param tsresol [in] The if_tsresol option, or None for microseconds
+# @return bytes The block
+def interface(order, linktype, tsresol=None):
+   options = b''
+   if tsresol is not None:
+      options = struct.pack(order + 'HHB3x', 9, 1, tsresol) + struct.pack(order + 'HH', 0, 0)
+   return block(order, 1, struct.pack(order + 'HHI', linktype, 0, 65535) + options)
+
+##
+# @name enhanced
+# @brief Writes a pcapng enhanced packet block
+# @param order [in] '<' or '>'
+# @param interface [in] The index of the interface
+# @param timestamp [in] The timestamp, in units of the interface's resolution
+# @param data [in] The captured bytes
+# @return bytes The block
+def enhanced(order, interface, timestamp, data):
+   return block(order, 6, struct.pack(order + 'IIIII', interface, timestamp >> 32, timestamp & 0xffffffff, len(data), len(data)) + data)
+
+class CaptureTests(unittest.TestCase):
+   def test_pcap(self):
+      frames = [(1600000000, 250000, udp4(b'\x01\x02')), (1600000001, 500000, udp4(b'\x03', vlan=True))]
+      for order in ('<', '>'):
+         read = list(capture.packets(pcap(frames, order)))
+         self.assertEqual([(p.linktype, bytes(p.data)) for p in read], [(1, f[2]) for f in frames])
+         self.assertAlmostEqual(read[0].timestamp, 1600000000.25, places=6)
+         self.assertAlmostEqual(read[1].timestamp, 1600000001.5, places=6)
+         self.assertEqual([bytes(capture.payload(p).data) for p in read], [b'\x01\x02', b'\x03'])
+
+   def test_pcap_nanoseconds(self):
+      read = list(capture.packets(pcap([(10, 5, b'\x45')], '>', nano=True, linktype=101)))
+      self.assertAlmostEqual(read[0].timestamp, 10.000000005, places=9)
+      self.assertEqual(read[0].linktype, 101)
+
+   def test_pcap_truncated(self):
+      with self.assertRaises(capture.CaptureError):
+         list(capture.packets(pcap([(0, 0, udp4(b'\x01'))])[:-3]))
+      with self.assertRaises(capture.CaptureError):
+         list(capture.packets(b'\x00' * 64))
+
+   def test_pcapng(self):
+      frames = [udp4(b'\x01\x02', destination=9000), tcp6(b'\x03\x04\x05'), udp4(b'\x06', destination=9001)]
+      for order in ('<', '>'):
+         buf  = b''.join([section(order), interface(order, 1), interface(order, 1, tsresol=9),
+                          enhanced(order, 0, 1500000, frames[0]),
+                          enhanced(order, 1, 2 * 10**9 + 7, frames[1]),
+                          block(order, 3, struct.pack(order + 'I', len(frames[2])) + frames[2]),
+                          block(order, 5, b'\x00' * 8)])
+         read = list(capture.packets(buf))
+         self.assertEqual([bytes(p.data) for p in read], frames)
+         self.assertAlmostEqual(read[0].timestamp, 1.5, places=6)
+         self.assertAlmostEqual(read[1].timestamp, 2.000000007, places=9)
+         self.assertIsNone(read[2].timestamp)
+         found = [capture.payload(p) for p in read]
+         self.assertEqual([(bytes(f.data), f.transport, f.source, f.destination) for f in found],
+                          [(b'\x01\x02', 'udp', 1024, 9000), (b'\x03\x04\x05', 'tcp', 9000, 2048), (b'\x06', 'udp', 1024, 9001)])
+         self.assertEqual([capture.payload(p, ports=[9000]) is not None for p in read], [True, True, False])
+
+   def test_pcapng_sections(self):
+      #each section has its own byte order and interfaces
+      buf  = b''.join([section('<'), interface('<', 1), enhanced('<', 0, 1, udp4(b'\x01')),
+                       section('>'), interface('>', 101), enhanced('>', 0, 2, b'\x45\x00')])
+      read = list(capture.packets(buf))
+      self.assertEqual([(p.linktype, bytes(p.data)) for p in read], [(1, udp4(b'\x01')), (101, b'\x45\x00')])
+      with self.assertRaises(capture.CaptureError):
+         list(capture.packets(section('<') + enhanced('<', 0, 1, b'\x01')))
+
+   def test_payload_offset(self):
+      packet = capture.Packet(0, 147, memoryview(b'\x00\x01\x02\x03'))
+      self.assertEqual(bytes(capture.payload(packet, offset=1).data), b'\x01\x02\x03')
+      self.assertIsNone(capture.payload(packet, offset=5))
+      self.assertIsNone(capture.payload(packet))
+
+   def test_decode(self):
+      frames = [(100, 0, udp4(b'\x01\x00\x07')),
+                (101, 0, udp4(b'\x02\x00\x07\x00\x05')),
+                (102, 0, udp4(b'\x02\x00\x08')),
+                (103, 0, udp4(b'\x01\x00\x09', destination=9001)),
+                (104, 0, udp4(b'\x03'))]
+      folder = tempfile.mkdtemp()
+      try:
+         path = os.path.join(folder, 'ping.pcap')
+         with open(path, 'wb') as pcapfile:
+            pcapfile.write(pcap(frames))
+         out   = io.StringIO()
+         stats = capture.decodeCapture(load(), path, out)
+      finally:
+         shutil.rmtree(folder, ignore_errors=True)
+      self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()],
+                       [{'frame' : 1, 'time' : 100.0, 'message' : 'ping.request', 'ping.hdr.type' : 1, 'ping.request.seq' : 7},
+                        {'frame' : 2, 'time' : 101.0, 'message' : 'ping.reply', 'ping.hdr.type' : 2, 'ping.reply.seq' : 7, 'ping.reply.delay' : 2.5},
+                        {'frame' : 5, 'time' : 104.0, 'message' : 'ping', 'ping.hdr.type' : 3}])
+      self.assertEqual((stats['packets'], stats['records'], stats['skipped'], stats['short']), (5, 3, 1, 1))
+
+class ParallelDecode(unittest.TestCase):
+   @classmethod
+   def setUpClass(cls):
+      cls.folder   = tempfile.mkdtemp()
+      cls.protocol = load()
+      payloads     = [bytes([1 + i % 3, i >> 8 & 0xff, i & 0xff, i % 7, 0]) for i in range(3000)]
+      cls.pcap     = os.path.join(cls.folder, 'ping.pcap')
+      with open(cls.pcap, 'wb') as pcapfile:
+         pcapfile.write(pcap([(1000 + i // 10, i % 10 * 1000, udp4(data)) for i, data in enumerate(payloads)]))
+      #every tenth packet is a simple packet block, without a timestamp
+      cls.pcapng   = os.path.join(cls.folder, 'ping.pcapng')
+      with open(cls.pcapng, 'wb') as pcapngfile:
+         pcapngfile.write(b''.join([section('<'), interface('<', 1)] +
+                                   [enhanced('<', 0, 1000000 + i, udp4(data)) if i % 10 else block('<', 3, struct.pack('<I', len(udp4(data))) + udp4(data))
+                                    for i, data in enumerate(payloads)]))
+      cls.minimum           = capture.shard_minimum
+      capture.shard_minimum = 4096
+
+   @classmethod
+   def tearDownClass(cls):
+      capture.shard_minimum = cls.minimum
+      shutil.rmtree(cls.folder, ignore_errors=True)
+
+   def decode(self, path, **kwargs):
+      out   = io.StringIO()
+      stats = capture.decodeCapture(self.protocol, path, out, **kwargs)
+      return (out.getvalue(), stats)
+
+   def test_shards(self):
+      for path in (self.pcap, self.pcapng):
+         with open(path, 'rb') as capturefile:
+            buf = capturefile.read()
+         whole = [(p.timestamp, bytes(p.data)) for p in capture.packets(buf)]
+         parts = capture.shards(buf, 7)
+         self.assertGreater(len(parts), 1)
+         self.assertEqual([(p.timestamp, bytes(p.data)) for s in parts for p in capture.packets(buf, s)], whole)
+         counts = [sum(1 for p in capture.packets(buf, s)) for s in parts]
+         self.assertEqual([s.frame for s in parts], [1 + sum(counts[:i]) for i in range(len(parts))])
+
+   def test_time(self):
+      for path in (self.pcap, self.pcapng):
+         for fmt in capture.formats:
+            serial, expected = self.decode(path, fmt=fmt)
+            merged, stats    = self.decode(path, fmt=fmt, jobs=3, order='time')
+            self.assertGreater(stats['shards'], 1)
+            self.assertEqual(merged, serial)
+            self.assertEqual(dict((k, stats[k]) for k in expected if k != 'elapsed'), dict((k, v) for k, v in expected.items() if k != 'elapsed'))
+            self.assertEqual(sum(w['shards'] for w in stats['workers'].values()), stats['shards'])
+
+   def test_unordered(self):
+      for path in (self.pcap, self.pcapng):
+         serial, expected = self.decode(path)
+         merged, stats    = self.decode(path, jobs=3, order='unordered')
+         self.assertGreater(stats['shards'], 1)
+         self.assertEqual(sorted(merged.splitlines()), sorted(serial.splitlines()))
+         self.assertEqual(stats['records'], expected['records'])
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,56 @@
+##
+# @file tests/test_classify.py
+# @brief Checks that the classifiers name the message of each record like the routes do.
+# @details usage: python -m pytest tests
+#          The protocol header of rich.py exposes its type, which routes 0 to rich.m0 and 1 to
+#          rich.m1. The scalar classifier, and the numpy batch classifier when numpy is installed,
+#          must classify the random records of rich.py by their first byte.
+#
+import unittest
+from   transmute.plugins import wireshark
+from   transmute         import runtime
+from   rich              import RichCase, load, spec
+
+try:
+   import numpy
+except ImportError:
+   numpy = None
+
+class Classification(RichCase):
+   def messageOf(self, buf):
+      return {0 : 'rich.m0', 1 : 'rich.m1'}.get(buf[0])
+
+   def test_header_advance(self):
+      self.assertEqual(runtime.routeGraph(self.protocol)[self.protocol].advance, 2)
+      self.assertEqual(wireshark.ws_extent(self.protocol), 2)
+
+   def test_classify(self):
+      classify = runtime.compileClassifier(self.protocol)
+      self.assertEqual([classify(buf) for buf in self.records], [self.messageOf(buf) for buf in self.records])
+      self.assertIs(runtime.compileClassifier(self.protocol), classify)
+      with self.assertRaises(ValueError):
+         classify(b'')
+
+   def test_classify_offsets(self):
+      classify = runtime.compileClassifier(self.protocol, offsets=True)
+      #records that route to no message stay at the protocol
+      self.assertEqual([classify(b'\x00\x00' + buf, 2) for buf in self.records],
+                       [(self.messageOf(buf), 4 if self.messageOf(buf) else 2) for buf in self.records])
+
+   @unittest.skipIf(numpy is None, "numpy is not installed")
+   def test_classify_batch(self):
+      classes, names = runtime.classifyBatch(self.protocol, b''.join(self.records), stride=self.size)
+      self.assertEqual([names[c] if c >= 0 else None for c in classes.tolist()], [self.messageOf(buf) for buf in self.records])
+
+   @unittest.skipIf(numpy is None, "numpy is not installed")
+   def test_classify_batch_unregistered(self):
+      #the header flags are exposed first, and no message registers in their table
+      protocol = load([], spec.replace('<ws:expose xmlns:ws="urn:transmute:wireshark" field="rich.hdr.type"/>',
+                                       '<ws:expose xmlns:ws="urn:transmute:wireshark" field="rich.hdr.flags"/><ws:expose xmlns:ws="urn:transmute:wireshark" field="rich.hdr.type"/>'))
+      classify       = runtime.compileClassifier(protocol)
+      classes, names = runtime.classifyBatch(protocol, b''.join(self.records), stride=self.size)
+      self.assertEqual([names[c] if c >= 0 else None for c in classes.tolist()], [classify(buf) for buf in self.records])
+      self.assertIn('rich.m0', [classify(buf) for buf in self.records])
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,128 @@
+##
+# @file tests/test_decoders.py
+# @brief Checks that the generated decoders agree on one specification.
+# @details usage: python -m pytest tests
+#          Random records of the specification in rich.py must decode to the same values with
+#          the Python decoders, the Wireshark value expressions and the C decoder (when a C
+#          compiler is installed).
+#
+import os
+import shutil
+import subprocess
+import unittest
+from   transmute.Dispatch.Dispatchable import DispatchError
+from   transmute.Output.Sink           import BufferedSink
+from   transmute.plugins               import base, wireshark, pydecoder, cdecoder
+from   transmute                       import runtime
+from   rich                            import RichCase, load, expected, spec
+
+##
+# @name wireshark_value
+# @brief Evaluates the value expression of a Wireshark dissector over a record
+# @details The tvb reads and the helpers of transmute_ws_runtime.h are evaluated in Python.
+# @param f [in] The field
+# @param buf [in] The record
+# @return The value the dissector computes
+def wireshark_value(f, buf):
+   def bits(chunk, mask, shift):
+      return (chunk & mask) >> shift
+   def sign(value, bits):
+      value &= (1 << bits) - 1
+      return value - (1 << bits) if value >> (bits - 1) else value
+   names = {'tvb'               : buf,
+            'ENC_BIG_ENDIAN'    : 'big',
+            'ENC_LITTLE_ENDIAN' : 'little',
+            'transmute_bits32'  : bits,
+            'transmute_bits64'  : bits,
+            'transmute_sign32'  : sign,
+            'transmute_sign64'  : sign,
+            'transmute_scale'   : lambda value, lsb, offset: value * lsb + offset
+           }
+   for width in range(8, 72, 8):
+      names['tvb_get_guint{}'.format(width)] = lambda tvb, offset, enc='big', n=width // 8: int.from_bytes(tvb[offset:offset + n], enc)
+   return eval(wireshark.ws_field_value(f).split(' = ', 1)[1], names)
+
+##
+# @name harness
+# @brief Writes a C program printing every field each decode_ function decodes from a file of records
+# @param protocol [in] The protocol
+# @param size [in] The size of each record
+# @return str The C source
+def harness(protocol, size):
+   lines = ['#include <stdio.h>', '#include "rich_decoder.h"', '', 'int main(int argc, char **argv)', '{',
+            '   uint8_t buf[{}];'.format(size),
+            '   FILE *f = fopen(argv[1], "rb");',
+            '   (void)argc;',
+            '   while(fread(buf, 1, sizeof(buf), f) == sizeof(buf))',
+            '   {']
+   for section in cdecoder.c_sections(protocol):
+      name    = cdecoder.c_name(section.abbreviation)
+      members = cdecoder.c_members(section)
+      lines.append('      {{ struct {0} out; decode_{0}(buf, sizeof(buf), &out);'.format(name))
+      for a, f in section.fields.items():
+         ctype = cdecoder.c_member_type(base.fieldLayout(f))
+         if ctype in ('double', 'float'):
+            lines.append('         printf("%.17g\\n", (double)out.{});'.format(members[a]))
+         else:
+            lines.append('         printf("%lld\\n", (long long)out.{});'.format(members[a]))
+      lines.append('      }')
+   lines.extend(['   }', '   fclose(f);', '   return 0;', '}', ''])
+   return '\n'.join(lines)
+
+class DecoderAgreement(RichCase):
+   def test_python(self):
+      decoders = runtime.compile(self.protocol)
+      for section in self.sections:
+         for buf in self.records:
+            self.assertEqual(self.decodedValues(section, decoders.classes[section.abbreviation].decode(buf)), self.expectedValues(section, buf), section.abbreviation)
+
+   def test_enum_names(self):
+      decoders = runtime.compile(self.protocol)
+      for section in self.sections:
+         enums   = decoders.classes[section.abbreviation].enums
+         members = pydecoder.py_members(section)
+         for a, f in ((a, f) for a, f in section.fields.items() if base.fieldLayout(f).kind == 'enum'):
+            values = base.fieldValues(f)
+            for value in range(-1, 1 << base.fieldLayout(f).bits):
+               names = [v for v in values.values if int(values.values[v].ival, 0) <= value <= int(values.values[v].last, 0)]
+               self.assertEqual(enums[members[a]].get(value), names[0] if names else None, a)
+
+   def test_module_names(self):
+      for name in ('struct', 'messages', '_Values'):
+         protocol = load([], spec.replace('"switch"', '"{}"'.format(name)))
+         with self.assertRaises(DispatchError):
+            runtime.compile(protocol)
+
+   def test_wireshark(self):
+      for section in self.sections:
+         for f in (f for f in section.fields.values() if wireshark.ws_field_cached(f)):
+            layout = base.fieldLayout(f)
+            for buf in self.records:
+               self.assertEqual(wireshark_value(f, buf), expected(layout, buf), f.abbreviation)
+
+   def test_wireshark_bit_groups(self):
+      groups = dict((g.offset, g) for g in wireshark.ws_bit_groups(self.protocol.messages['rich.m0']))
+      self.assertEqual([f.abbreviation for f in groups[10].fields], ['rich.m0.g', 'rich.m0.c'])
+      self.assertEqual(groups[10].ftype, 'UINT8')
+      self.assertIn('FT_BOOLEAN, 8, NULL, 0x80,', wireshark.ws_header_field(self.protocol.messages['rich.m0'].fields['rich.m0.g']))
+
+   @unittest.skipIf(shutil.which('gcc') is None, "gcc is not installed")
+   def test_c(self):
+      cdecoder.dispatch(self.protocol, BufferedSink())
+      folder = os.path.join(self.folder, self.protocol.abbreviation)
+      with open(os.path.join(folder, 'harness.c'), 'w') as source:
+         source.write(harness(self.protocol, self.size))
+      with open(os.path.join(folder, 'records'), 'wb') as records:
+         records.write(b''.join(self.records))
+      program = os.path.join(folder, 'harness')
+      subprocess.check_call(['gcc', '-std=c99', '-Wall', '-Wextra', '-Werror', '-o', program, os.path.join(folder, 'harness.c'), os.path.join(folder, 'rich_decoder.c')])
+      lines = iter(subprocess.check_output([program, os.path.join(folder, 'records')]).decode().split())
+      for buf in self.records:
+         for section in self.sections:
+            for f in section.fields.values():
+               layout = base.fieldLayout(f)
+               value  = next(lines)
+               self.assertEqual(float(value) if layout.kind == 'weighted' else int(value), expected(layout, buf), f.abbreviation)
+
+if __name__ == '__main__':
+   unittest.main()
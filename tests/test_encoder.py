@@ -0,0 +1,81 @@
+##
+# @file tests/test_encoder.py
+# @brief Checks that the encoders round-trip decoded values, and that generated traffic decodes.
+# @details usage: python -m pytest tests
+#          The random records of rich.py are decoded, encoded and decoded again, a record at a time
+#          and, when numpy is installed, a batch at a time. Captures generated from the
+#          specification must then decode to the messages asked for, with enumerated fields
+#          within the ranges of their values.
+#
+import io
+import json
+import os
+import unittest
+from   transmute.plugins import base
+from   transmute         import capture, runtime, traffic
+from   rich              import RichCase
+
+try:
+   import numpy
+except ImportError:
+   numpy = None
+
+class Encoding(RichCase):
+   def test_encoder(self):
+      decoders = runtime.compile(self.protocol)
+      for section in self.sections:
+         encode = runtime.compileEncoder(section)
+         for buf in self.records:
+            values = self.expectedValues(section, buf)
+            self.assertEqual(self.decodedValues(section, decoders.classes[section.abbreviation].decode(encode(values))), values, section.abbreviation)
+
+   @unittest.skipIf(numpy is None, "numpy is not installed")
+   def test_batch_encoder(self):
+      raw = b''.join(self.records)
+      for section in self.sections:
+         columns = runtime.decodeBatch(section, raw, stride=self.size)
+         again   = runtime.decodeBatch(section, runtime.encodeBatch(section, columns))
+         for name in columns:
+            self.assertEqual(again[name].tolist(), columns[name].tolist(), name)
+
+   ##
+   # @name generate
+   # @brief Generates a capture and decodes it
+   # @param count [in] The number of records
+   # @param messages [in] The abbreviations of the messages to generate (default is every message)
+   # @param seed [in] The seed of the random values
+   # @return list The decoded records, without their timestamps
+   def generate(self, count, messages=None, seed=1):
+      path = os.path.join(self.folder, 'traffic.pcap')
+      traffic.generateTraffic(self.protocol, path, count, messages=messages, seed=seed, port=9000)
+      out = io.StringIO()
+      capture.decodeCapture(self.protocol, path, out, ports=[9000])
+      records = [json.loads(line) for line in out.getvalue().splitlines()]
+      for record in records:
+         del record['time']
+      return records
+
+   def test_traffic(self):
+      records = self.generate(400)
+      self.assertEqual(len(records), 400)
+      self.assertEqual(set(r['message'] for r in records), set(['rich.m0', 'rich.m1']))
+      self.assertEqual(self.generate(400), records)
+      self.assertNotEqual(self.generate(400, seed=2), records)
+      self.assertEqual(set(r['message'] for r in self.generate(50, messages=['rich.m1'])), set(['rich.m1']))
+      #every enumerated value is named by one of its values
+      fields = dict((f.abbreviation, f) for s in self.sections for f in s.fields.values() if base.fieldLayout(f).kind == 'enum')
+      for record in records:
+         for abbreviation, f in ((a, fields[a]) for a in record if a in fields):
+            values = base.fieldValues(f).values
+            self.assertTrue(any(int(values[v].ival, 0) <= record[abbreviation] <= int(values[v].last, 0) for v in values), abbreviation)
+
+   def test_traffic_arguments(self):
+      path = os.path.join(self.folder, 'unrouted.pcap')
+      with self.assertRaises(ValueError):
+         traffic.generateTraffic(self.protocol, path, 10)
+      with self.assertRaises(ValueError):
+         traffic.generateTraffic(self.protocol, path, 10, messages=['rich.m2'], port=9000)
+      self.assertFalse(os.path.exists(path))
+
+if __name__ == '__main__':
+   unittest.main()
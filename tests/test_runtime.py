@@ -0,0 +1,43 @@
+##
+# @file tests/test_runtime.py
+# @brief Checks the in-process decoder compiler.
+# @details usage: python -m pytest tests
+#          Protocols are compiled once per digest, and their decoders check the length of the
+#          buffer, decode from an offset and name the classes of every section.
+#
+import unittest
+from   transmute import runtime
+from   rich      import RichCase, load, spec
+
+class Compiler(RichCase):
+   def test_cache(self):
+      decoders = runtime.compile(self.protocol)
+      self.assertIs(runtime.compile(self.protocol), decoders)
+      self.assertIs(runtime.compile(load([])), decoders)
+      self.assertIsNot(runtime.compile(self.protocol, lazy=True), decoders)
+      #the ranges of values are part of the digest
+      other = load([], spec.replace('<value name="MID" int="10" last="19"/>', '<value name="MID" int="10" last="18"/>'))
+      self.assertNotEqual(runtime.specDigest(other), decoders.digest)
+      self.assertIsNone(runtime.compile(other).classes['rich.m0'].enums['r'].get(19))
+
+   def test_sections(self):
+      decoders = runtime.compile(self.protocol)
+      self.assertEqual(list(decoders.classes), [s.abbreviation for s in self.sections])
+      self.assertEqual([cls.__name__ for cls in decoders.messages], ['rich_m0', 'rich_m1'])
+      self.assertEqual([cls.__name__ for cls in decoders.headers], ['rich_hdr'])
+      self.assertEqual(decoders.classes['rich.m1'].size, 7)
+      self.assertIn('class rich_m0(_Section)', decoders.source)
+
+   def test_decode(self):
+      for lazy in (False, True):
+         decode = runtime.compile(self.protocol, lazy=lazy).decode['rich.m1']
+         for buf in self.records[:50]:
+            self.assertEqual(self.decodedValues(self.protocol.messages['rich.m1'], decode(b'\x00' * 3 + buf, 3)),
+                             self.expectedValues(self.protocol.messages['rich.m1'], buf))
+         with self.assertRaises(ValueError):
+            decode(self.records[0][:6])
+         with self.assertRaises(ValueError):
+            decode(self.records[0], len(self.records[0]) - 6)
+
+if __name__ == '__main__':
+   unittest.main()
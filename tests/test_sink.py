@@ -0,0 +1,117 @@
+##
+# @file tests/test_sink.py
+# @brief Checks that the output sinks only write the files whose contents change.
+# @details usage: python -m pytest tests
+#          Files are written twice into a temporary folder. An unchanged file must keep its
+#          modification time, and a dry run must write nothing and report the files that would
+#          change. The streaming sink must behave like the buffered one, and the zip sink must
+#          archive every file relative to the folder they share.
+#
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from   transmute.Output.Sink import BufferedSink, StreamingSink, MemorySink, create
+
+class SinkTests(unittest.TestCase):
+   def setUp(self):
+      self.folder = tempfile.mkdtemp()
+      self.path   = os.path.join(self.folder, 'out', 'file.c')
+
+   def tearDown(self):
+      shutil.rmtree(self.folder, ignore_errors=True)
+
+   ##
+   # @name age
+   # @brief Moves the modification time of a file an hour back
+   # @param path [in] The file
+   # @return int The new modification time, in nanoseconds
+   def age(self, path):
+      mtime = os.stat(path).st_mtime_ns - 3600 * 10**9
+      os.utime(path, ns=(mtime, mtime))
+      return mtime
+
+   def test_unchanged_keeps_mtime(self):
+      sink = BufferedSink()
+      sink.write(self.path, ['int a;\n', 'int b;\n'])
+      mtime = self.age(self.path)
+      again = BufferedSink()
+      again.write(self.path, ['int a;\nint b;\n'])
+      self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+      self.assertEqual((again.changed, again.unchanged), ([], [self.path]))
+      again.write(self.path, ['int c;\n'])
+      self.assertNotEqual(os.stat(self.path).st_mtime_ns, mtime)
+      with open(self.path) as written:
+         self.assertEqual(written.read(), 'int c;\n')
+      self.assertEqual(again.changed, [self.path])
+
+   def test_dry_run(self):
+      other = os.path.join(self.folder, 'out', 'other.c')
+      BufferedSink().write(self.path, ['int a;\n'])
+      mtime = self.age(self.path)
+      sink  = BufferedSink(dry_run=True)
+      sink.write(self.path, ['int a;\n'])
+      sink.write(other, ['int b;\n'])
+      with sink.open(os.path.join(self.folder, 'new', 'file.h')) as header:
+         header.write('#define B 1\n')
+      self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+      self.assertFalse(os.path.exists(other))
+      self.assertFalse(os.path.exists(os.path.join(self.folder, 'new')))
+      self.assertEqual(sink.report(), ['2 of 3 files would be changed',
+                                       '   would change: {}'.format(other),
+                                       '   would change: {}'.format(os.path.join(self.folder, 'new', 'file.h'))])
+
+   def test_streaming(self):
+      sink = StreamingSink()
+      with sink.open(self.path) as outfile:
+         for i in range(1000):
+            outfile.write('int a{};\r\n'.format(i))
+      mtime = self.age(self.path)
+      again = StreamingSink()
+      again.write(self.path, ('int a{};\r\n'.format(i) for i in range(1000)))
+      self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+      self.assertEqual(again.commit(self.path, 'int c;\n'), True)
+      with open(self.path, newline='') as written:
+         self.assertEqual(written.read(), 'int c;\n')
+      self.assertEqual((again.changed, again.unchanged), ([self.path], [self.path]))
+      #the temporary files are all gone
+      self.assertEqual(os.listdir(os.path.dirname(self.path)), ['file.c'])
+
+   def test_streaming_discards_on_error(self):
+      sink = StreamingSink()
+      with self.assertRaises(RuntimeError):
+         with sink.open(self.path) as outfile:
+            outfile.write('int a;\n')
+            raise RuntimeError()
+      self.assertEqual(os.listdir(os.path.dirname(self.path)), [])
+      self.assertEqual(sink.changed, [])
+
+   def test_streaming_dry_run(self):
+      sink = StreamingSink(dry_run=True)
+      sink.write(self.path, ['int a;\n'])
+      self.assertFalse(os.path.exists(os.path.dirname(self.path)))
+      self.assertEqual(sink.report(), ['1 of 1 files would be changed', '   would change: {}'.format(self.path)])
+
+   def test_zip(self):
+      other = os.path.join(self.folder, 'out', 'sub', 'file.h')
+      sink  = create('zip', zip_path=os.path.join(self.folder, 'files.zip'))
+      sink.write(self.path, ['int a;\n'])
+      with sink.open(other) as header:
+         header.write('#define B 1\n')
+      self.assertEqual(sink.getvalue(other), '#define B 1\n')
+      self.assertFalse(os.path.exists(os.path.dirname(self.path)))
+      sink.close()
+      with zipfile.ZipFile(os.path.join(self.folder, 'files.zip')) as zfile:
+         self.assertEqual(sorted(zfile.namelist()), ['file.c', 'sub/file.h'])
+         self.assertEqual(zfile.read('file.c'), b'int a;\n')
+      stream = io.BytesIO()
+      rooted = MemorySink(root=self.folder)
+      rooted.write(self.path, ['int a;\n'])
+      rooted.archive(stream)
+      with zipfile.ZipFile(stream) as zfile:
+         self.assertEqual(zfile.namelist(), ['out/file.c'])
+
+if __name__ == '__main__':
+   unittest.main()
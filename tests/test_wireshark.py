@@ -0,0 +1,96 @@
+##
+# @file tests/test_wireshark.py
+# @brief Checks that the Wireshark dissector does not depend on how it was rendered.
+# @details usage: python -m pytest tests
+#          The message functions rendered by worker processes (--jobs) must assemble into the
+#          same files, byte for byte, as the ones rendered serially.
+#
+import argparse
+import shutil
+import sys
+import tempfile
+import unittest
+from   transmute.Parsing     import Parser
+from   transmute.Output.Sink import MemorySink
+from   transmute.plugins     import base, wireshark
+
+##
+# @brief The number of messages in the specification
+_messages = 8
+
+##
+# @name spec
+# @brief Writes a specification whose messages are routed by the type in the protocol header
+# @return str The XML specification
+def spec():
+   xml = ['<protocol endian="big" bit0="MSb" chunksize="8">',
+          '<description name="Many" abbreviation="many"><brief>Many</brief></description>',
+          '<version major="1" minor="0" micro="0" extra="0"/>',
+          '<header><description name="Header" abbreviation="many.hdr"><brief>Header</brief></description>',
+          '<field type="unsigned int"><description name="Type" abbreviation="many.hdr.type"><brief>Type</brief></description><position index="0"><chunks length="1"/></position></field>',
+          '</header>',
+          '<ws:expose xmlns:ws="urn:transmute:wireshark" field="many.hdr.type"/>']
+   #anonymous values are numbered by every specification parsed so far, so the values are named
+   for m in range(_messages):
+      xml.append('<values name="level{0}"><value name="LOW" int="0" last="{0}"/><value name="HIGH" int="{1}"/></values>'.format(m, m + 1))
+   for m in range(_messages):
+      xml.extend(['<message><description name="M{0}" abbreviation="many.m{0}"><brief>M{0}</brief></description>'.format(m),
+                  '<ws:register xmlns:ws="urn:transmute:wireshark" table="many.hdr.type" value="{}"/>'.format(m),
+                  '<field type="unsigned int"><description name="A" abbreviation="many.m{}.a"><brief>A</brief></description><position index="0"><chunks length="2"/></position></field>'.format(m),
+                  '<field type="unsigned int"><description name="B" abbreviation="many.m{}.b"><brief>B</brief></description><position index="2"><bits start="0" end="2"/></position></field>'.format(m),
+                  '<field type="bool"><description name="C" abbreviation="many.m{}.c"><brief>C</brief></description><position index="2"><bits start="3" end="3"/></position></field>'.format(m),
+                  '<field type="enum"><description name="D" abbreviation="many.m{0}.d"><brief>D</brief></description><position index="3"><chunks length="1"/></position><values name="level{0}"/></field>'.format(m),
+                  '<field type="weighted"><description name="E" abbreviation="many.m{}.e"><brief>E</brief></description><position index="4"><chunks length="2"/></position><weight lsb="0.5"/></field>'.format(m),
+                  '</message>'])
+   xml.append('</protocol>')
+   return '\n'.join(xml)
+
+##
+# @name render
+# @brief Renders the dissector of the specification
+# @param argv [in] The plugin command line arguments
+# @return OrderedDict The text of each file, keyed by path
+def render(argv):
+   args_parser = argparse.ArgumentParser(add_help=False)
+   args_parser.add_argument('protofile')
+   args_parser.add_argument('-j', '--jobs', default=1, type=int)
+   xml_parser = Parser.Parser()
+   saved, sys.argv = sys.argv, ['test', 'many.xml'] + list(argv)
+   try:
+      for plugin in (base, wireshark):
+         plugin.register(args_parser, xml_parser)
+   finally:
+      sys.argv = saved
+   protocol = next(xml_parser.parseString(spec()))
+   protocol.Validate(None)
+   sink = MemorySink()
+   wireshark.dispatch(protocol, sink)
+   return sink.files
+
+class ParallelRendering(unittest.TestCase):
+   def setUp(self):
+      self.folder = tempfile.mkdtemp()
+
+   def tearDown(self):
+      shutil.rmtree(self.folder, ignore_errors=True)
+
+   def assertSameFiles(self, argv):
+      argv   = ['-ws', '--wireshark-out', self.folder] + argv
+      serial = render(argv)
+      for jobs in (2, 3):
+         parallel = render(argv + ['--jobs', str(jobs)])
+         self.assertEqual(list(parallel), list(serial))
+         for path, text in serial.items():
+            self.assertEqual(parallel[path].encode(), text.encode(), path)
+
+   def test_jobs(self):
+      self.assertSameFiles([])
+
+   def test_jobs_lazy(self):
+      self.assertSameFiles(['--wireshark-registration', 'lazy'])
+
+   def test_jobs_shards(self):
+      self.assertSameFiles(['--wireshark-shards', '3'])
+
+if __name__ == '__main__':
+   unittest.main()
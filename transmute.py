@@ -23,13 +23,79 @@
 # <tr><td>-V</td><td>--verbose</td><td></td><td>Show detailed information during processing</td></tr>
 # <tr><td>-VV</td><td>--extra-verbose</td><td></td><td>Show extra detailed information during processing</td></tr>
 # <tr><td>-v</td><td>--version</td><td></td><td>show program's version number and exit</td></tr>
+# <tr><td>-n</td><td>--dry-run</td><td></td><td>Render output without writing files, and list the files that would change</td></tr>
+# <tr><td></td><td>--sink</td><td>KIND</td><td>How output files are written. One of buffered, streaming, zip (default is buffered)</td></tr>
+# <tr><td></td><td>--sink-zip</td><td>PATH</td><td>The archive written by the zip sink (default is - for stdout)</td></tr>
+# <tr><td>-j</td><td>--jobs</td><td>N</td><td>The number of worker processes plugins may use (default is 1)</td></tr>
+# </table>
+# capture decoding optional arguments
+# <table>
+# <tr><td>short option</td><td>long option</td><td>argument(s)</td><td>summary</td></tr>
+# <tr><td></td><td>--decode</td><td>CAPTURE</td><td>Decode the payloads of a pcap or pcapng capture with the protocol</td></tr>
+# <tr><td></td><td>--decode-port</td><td>N</td><td>Decode the payloads of UDP or TCP port N. May be repeated (default is the ports registered by the protocol, or any port)</td></tr>
+# <tr><td></td><td>--decode-offset</td><td>N</td><td>Decode from a fixed offset in each packet instead of after its UDP or TCP header</td></tr>
+# <tr><td></td><td>--decode-format</td><td>FORMAT</td><td>The format of the decoded records. One of jsonl, csv (default is jsonl)</td></tr>
+# <tr><td></td><td>--decode-out</td><td>PATH</td><td>The file that receives the decoded records (default is - for stdout)</td></tr>
+# <tr><td></td><td>--decode-order</td><td>ORDER</td><td>How the records of shards decoded in parallel (with --jobs) are merged. One of time, unordered (default is time)</td></tr>
+# <tr><td></td><td>--stats</td><td></td><td>Write the distribution of every field of the decoded messages instead of the records. Requires numpy</td></tr>
+# <tr><td></td><td>--stats-format</td><td>FORMAT</td><td>The format of the field statistics. One of text, json (default is text)</td></tr>
+# </table>
+# traffic generation optional arguments
+# <table>
+# <tr><td>short option</td><td>long option</td><td>argument(s)</td><td>summary</td></tr>
+# <tr><td></td><td>--generate</td><td>N</td><td>Write N random messages of the protocol</td></tr>
+# <tr><td></td><td>--generate-format</td><td>FORMAT</td><td>The format of the generated messages. One of raw, pcap (default is pcap)</td></tr>
+# <tr><td></td><td>--generate-out</td><td>PATH</td><td>The file that receives the generated messages (default is - for stdout)</td></tr>
+# <tr><td></td><td>--generate-message</td><td>ABBREVIATION</td><td>Generate the message ABBREVIATION. May be repeated (default is every message)</td></tr>
+# <tr><td></td><td>--generate-port</td><td>N</td><td>The destination port of the generated packets (default is the port the protocol is registered on)</td></tr>
+# <tr><td></td><td>--generate-seed</td><td>N</td><td>The seed of the random values, for repeatable output</td></tr>
 # </table>
 # wireshark optional arguments
 # <table>
 # <tr><td>short option</td><td>long option</td><td>argument(s)</td><td>summary</td></tr>
 # <tr><td>-ws</td><td>--wireshark</td><td></td><td>Enable wireshark output</td></tr>
 # <tr><td></td><td>--wireshark-out</td><td>PATH</td><td>Change the wireshark output folder (default is the current working directory)</td></tr>
+# <tr><td></td><td>--wireshark-shards</td><td>N</td><td>Split the dissector into registration, handoff and N dissector source files (default is 1, a single source file)</td></tr>
+# <tr><td></td><td>--wireshark-share</td><td></td><td>Emit identical message headers and trailers once, shared by their messages. Their filter fields are then named after the first message using them</td></tr>
+# <tr><td></td><td>--wireshark-registration</td><td>MODE</td><td>When header fields are registered. One of eager (at startup), lazy (on first use) (default is eager)</td></tr>
+# </table>
+# c decoder optional arguments
+# <table>
+# <tr><td>short option</td><td>long option</td><td>argument(s)</td><td>summary</td></tr>
+# <tr><td>-c</td><td>--c-decoder</td><td></td><td>Enable C decoder output: a C99 decoder library, a benchmark program and a Makefile</td></tr>
+# <tr><td></td><td>--c-out</td><td>PATH</td><td>Change the C decoder output folder (default is the current working directory)</td></tr>
+# </table>
+# python decoder optional arguments
+# <table>
+# <tr><td>short option</td><td>long option</td><td>argument(s)</td><td>summary</td></tr>
+# <tr><td>-py</td><td>--python</td><td></td><td>Enable Python decoder output: a module with one class per header, trailer and message</td></tr>
+# <tr><td></td><td>--python-out</td><td>PATH</td><td>Change the Python decoder output folder (default is the current working directory)</td></tr>
+# <tr><td></td><td>--python-mode</td><td>MODE</td><td>How the generated classes decode. One of eager (every field up front), lazy (views that decode each field on first access) (default is eager)</td></tr>
 # </table>
+# @section Runtime
+# Tools that load specifications at runtime can skip the generation step. After validating a
+# protocol, @ref transmute.runtime.compile "transmute.runtime.compile" returns the classes of the
+# Python decoder plugin, compiled in-process and memoized per specification. With lazy=True, the
+# classes are views that decode each field on first access.
+# @ref transmute.runtime.compileClassifier "transmute.runtime.compileClassifier" names the message
+# of a buffer from the fields its <ws:expose> elements route on, reading nothing else.
+# @section Captures
+# With --decode, the protocol decodes the payloads of a pcap or pcapng capture after any enabled
+# output is generated. The capture is memory-mapped and read one packet at a time, and each
+# payload is routed through the protocol with its <ws:expose> and <ws:register> elements. With
+# --jobs, the capture is split into record-aligned shards that are decoded in parallel, and the
+# records are merged by timestamp (or written as each shard completes, with --decode-order
+# unordered). With --stats, the records are not written; each message is decoded in numpy batches
+# instead, and the minimum, maximum, mean and standard deviation of numeric fields, the histogram
+# of enumerated fields and the frequency of each bit of unsigned fields are reported. See
+# @ref transmute.capture "transmute.capture" and @ref transmute.stats "transmute.stats".
+# @section Traffic
+# With --generate, random messages of the protocol are written before any capture is decoded,
+# back to back or as the UDP or TCP payloads of a pcap capture. Every field holds a valid value:
+# one of its <values>, or any value of its bits, and the fields that <ws:expose> elements route on
+# hold the values registered for the message, so that the packets decode as that message. See
+# @ref transmute.traffic "transmute.traffic", and
+# @ref transmute.runtime.compileEncoder "transmute.runtime.compileEncoder" for the encoders.
 # @page Design
 # @dotfile design.graph High-Level Design
 # @section From XML To Anything
@@ -43,13 +109,17 @@
 # -# Direct fully-parsed entities using the main @ref transmute.Dispatch.Dispatcher.Dispatcher "Dispatcher"
 #    - Each plugin will have set up its dispatching behavior according to its arguments
 #    - At this point, any plugin with enabled output will generate that output
+#    - Plugins write their output through the @ref transmute.Output.Sink.Sink "Sink" selected with --sink
 import argparse
 import logging
+import sys
 import transmute
 from   sys                import argv
 from   os                 import path
 from   transmute.Dispatch import Dispatcher
 from   transmute.Parsing  import Parser
+from   transmute.Output   import Sink
+from   transmute          import capture, stats, traffic
 
 ##
 # @brief Configures the application's verbosity.
@@ -65,6 +135,66 @@ def SetVerbosity(quiet, verbose, extra_verbose):
    else:
       logging.basicConfig(level=logging.WARNING)
 
+##
+# @name jobs_type
+# @brief An argparse type for worker process counts
+# @param text [in] The specified count
+# @return int The count
+# @throws ArgumentTypeError When text is not a positive integer
+def jobs_type(text):
+   try:
+      jobs = int(text)
+   except ValueError:
+      raise argparse.ArgumentTypeError("'{}' is not a number of jobs".format(text))
+   if jobs < 1:
+      raise argparse.ArgumentTypeError("At least one job is required")
+   return jobs
+
+##
+# @name Generate
+# @brief Writes random messages of a protocol, as selected by the --generate arguments
+# @param protocol [in] The validated protocol
+# @param ns [in] The parsed command line arguments
+def Generate(protocol, ns):
+   log = logging.getLogger("main")
+   log.info("Generating {} messages of {}".format(ns.generate, protocol.description.abbreviation))
+   try:
+      #the output file is only created once the arguments are checked, so a bad run leaves it as it was
+      stream = sys.stdout.buffer if ns.generate_out == '-' else ns.generate_out
+      traffic.generateTraffic(protocol, stream, ns.generate, ns.generate_format, ns.generate_message, ns.generate_seed, ns.generate_port)
+   except ValueError as ve:
+      log.error("Unable to generate messages: {}".format(ve))
+   except IOError as ioe:
+      log.error("Unable to write '{}': {}".format(ns.generate_out, ioe))
+
+##
+# @name Decode
+# @brief Decodes a capture with a protocol, as selected by the --decode arguments
+# @param protocol [in] The validated protocol
+# @param ns [in] The parsed command line arguments
+def Decode(protocol, ns):
+   log = logging.getLogger("main")
+   log.info("Decoding {} with {}".format(ns.decode, protocol.description.abbreviation))
+   def write(stream):
+      if ns.stats:
+         stats.reportFormats[ns.stats_format](capture.captureStats(protocol, ns.decode, ns.decode_port, ns.decode_offset), stream)
+      else:
+         return capture.decodeCapture(protocol, ns.decode, stream, ns.decode_format, ns.decode_port, ns.decode_offset, ns.jobs, ns.decode_order)
+   try:
+      if ns.decode_out == '-':
+         counts = write(sys.stdout)
+      else:
+         with open(ns.decode_out, 'w', newline='') as stream:
+            counts = write(stream)
+      #the summary, with the throughput of each worker, stays out of records written to stdout
+      if counts is not None and not ns.quiet:
+         for line in capture.summaryLines(counts):
+            print(line, file=sys.stderr if ns.decode_out == '-' else sys.stdout)
+   except capture.CaptureError as ce:
+      log.error("Unable to decode capture: {}".format(ce))
+   except ImportError as ie:
+      log.error("Unable to collect field statistics: {}".format(ie))
+
 ##
 # @brief The main routine.
 # @details Parses arguments and drives the application accordingly.
@@ -79,6 +209,24 @@ def main():
    vrbos_group.add_argument('-V',  '--verbose',  default=False,       action='store_true',                                                help="Show detailed information during processing.")
    vrbos_group.add_argument('-VV', '--extra-verbose', default=False,  action='store_true',                                                help="Show extra detailed information during processing.")
    args_parser.add_argument('-v',  '--version',                       action='version',    version='%(prog)s {}'.format(transmute.version_string))
+   args_parser.add_argument('-n',  '--dry-run',  default=False,       action='store_true',                                                help="Render output without writing files, and list the files that would change.")
+   args_parser.add_argument(       '--sink',     default='buffered',  choices=list(Sink.kinds.keys()),                                   help="How output files are written (default is buffered).")
+   args_parser.add_argument(       '--sink-zip', default=None,        metavar='PATH',                                                     help="The archive written by the zip sink (default is - for stdout).")
+   args_parser.add_argument('-j',  '--jobs',     default=1,           type=jobs_type,      metavar='N',                                    help="The number of worker processes plugins may use (default is 1).")
+   args_parser.add_argument(       '--decode',   default=None,        metavar='CAPTURE',                                                  help="Decode the payloads of a pcap or pcapng capture with the protocol.")
+   args_parser.add_argument(       '--decode-port', default=None,     type=int,            action='append', metavar='N',                   help="Decode the payloads of UDP or TCP port N. May be repeated (default is the ports registered by the protocol, or any port).")
+   args_parser.add_argument(       '--decode-offset', default=None,   type=int,            metavar='N',                                    help="Decode from a fixed offset in each packet instead of after its UDP or TCP header.")
+   args_parser.add_argument(       '--decode-format', default='jsonl', choices=list(capture.formats.keys()),                             help="The format of the decoded records (default is jsonl).")
+   args_parser.add_argument(       '--decode-out', default='-',       metavar='PATH',                                                     help="The file that receives the decoded records (default is - for stdout).")
+   args_parser.add_argument(       '--decode-order', default='time',  choices=list(capture.orders),                                      help="How the records of shards decoded in parallel (with --jobs) are merged (default is time).")
+   args_parser.add_argument(       '--stats',    default=False,       action='store_true',                                                help="Write the distribution of every field of the decoded messages instead of the records. Requires numpy.")
+   args_parser.add_argument(       '--stats-format', default='text',  choices=list(stats.reportFormats.keys()),                         help="The format of the field statistics (default is text).")
+   args_parser.add_argument(       '--generate', default=None,        type=int,            metavar='N',                                    help="Write N random messages of the protocol.")
+   args_parser.add_argument(       '--generate-format', default='pcap', choices=list(traffic.formats.keys()),                            help="The format of the generated messages (default is pcap).")
+   args_parser.add_argument(       '--generate-out', default='-',     metavar='PATH',                                                     help="The file that receives the generated messages (default is - for stdout).")
+   args_parser.add_argument(       '--generate-message', default=None, action='append',    metavar='ABBREVIATION',                         help="Generate the message ABBREVIATION. May be repeated (default is every message).")
+   args_parser.add_argument(       '--generate-port', default=None,   type=int,            metavar='N',                                    help="The destination port of the generated packets (default is the port the protocol is registered on).")
+   args_parser.add_argument(       '--generate-seed', default=None,   type=int,            metavar='N',                                    help="The seed of the random values, for repeatable output.")
    ns,argv = args_parser.parse_known_args()
    #configure the output mode
    SetVerbosity(ns.quiet, ns.verbose, ns.extra_verbose)
@@ -87,7 +235,8 @@ def main():
    xml_parser = Parser.Parser()
    #load and register all plugins
    log.debug("Initializing dispatcher for {} folder".format(path.join('transmute', 'plugins')))
-   dispatcher = Dispatcher.Dispatcher('plugins')
+   sink = Sink.create(ns.sink, dry_run=ns.dry_run, zip_path=ns.sink_zip)
+   dispatcher = Dispatcher.Dispatcher('plugins', sink=sink)
    dispatcher.register_all(args_parser, xml_parser)
    
    #this here to catch -h/--help arguments (and any others that must only be processed after all plugins are loaded)
@@ -104,11 +253,21 @@ def main():
             log.info("Starting validation...")
             element.Validate(None)
             dispatcher.push(element)
+            if ns.generate is not None:
+               Generate(element, ns)
+            if ns.decode is not None:
+               Decode(element, ns)
    except Parser.ParseError as pe:
       log.warning("Invalid XML Input: {}".format(pe))
    except IOError as ioe:
       log.error("Unable to open file '{}'".format(ns.protofile))
    log.info("Parser stopped.")
+   sink.close()
+   #keep stdout clean when the output itself goes there
+   report_stream = sys.stderr if getattr(sink, 'zip_path', None) == '-' or (ns.decode is not None and ns.decode_out == '-') or (ns.generate is not None and ns.generate_out == '-') else sys.stdout
+   if ns.dry_run or not ns.quiet:
+      for line in sink.report():
+         print(line, file=report_stream)
 
 if __name__ == '__main__':
    main()
@@ -31,8 +31,10 @@ class Dispatcher(object):
    # @brief Load modules for dispatch
    # @param package [in] The directory from which to load modules
    # @param relative_to [in] The path in which package resides
-   def __init__(self, package, relative_to='transmute'):
+   # @param sink [in] The @ref transmute.Output.Sink.Sink "Sink" that receives the output of every module
+   def __init__(self, package, relative_to='transmute', sink=None):
       self.log = logging.getLogger('transmute.Dispatch.Dispatcher')
+      self.sink = sink
       self.log.debug("Setting up Dispatcher for {}".format(os.path.join(relative_to, package)))
       pkg = ['transmute'] + package.split(os.path.sep)
       self._pmod   = [importlib.import_module(''.join(['.', pkg[pivot]]), '.'.join(pkg[:pivot])) for pivot in range(1, len(pkg))]
@@ -52,9 +54,10 @@ class Dispatcher(object):
    ##
    # @name push
    # @brief Push a @ref transmute.Dispatch.Dispatchable.Dispatchable "Dispatchable" to every loaded module.
+   # @details Each module writes its output through this Dispatcher's sink.
    def push(self, dispatchable_obj):
       for mod in self.modules:
-         mod.dispatch(dispatchable_obj)
+         mod.dispatch(dispatchable_obj, self.sink)
    
    ##
    # @name getModules
@@ -0,0 +1,370 @@
+##
+# @file transmute/Output/Sink.py
+# @brief Contains the output sinks used by plugins to write generated files.
+# @details Plugins never open output files themselves. Instead, they open files through
+#          the @ref transmute.Output.Sink.Sink "Sink" given to them by the
+#          @ref transmute.Dispatch.Dispatcher.Dispatcher "Dispatcher", which decides
+#          where (and whether) the generated text ends up:
+#          - @ref transmute.Output.Sink.BufferedSink "BufferedSink" renders each file to
+#            memory and flushes it with a single write.
+#          - @ref transmute.Output.Sink.StreamingSink "StreamingSink" streams each file
+#            straight to a temporary file, for low-memory operation.
+#          - @ref transmute.Output.Sink.MemorySink "MemorySink" keeps every file in
+#            memory, and can archive them as a zip file.
+#
+#          The on-disk sinks only replace a file (atomically, through a temporary file
+#          and a rename) when its contents differ, so that unchanged outputs keep their
+#          modification time and do not trigger downstream rebuilds.
+#
+import io
+import os
+import sys
+import logging
+import filecmp
+import tempfile
+import zipfile
+from   abc                     import ABCMeta, abstractmethod
+from   collections             import OrderedDict
+from   ..Dispatch.Dispatchable import DispatchError
+
+##
+# @brief All of the items exported by this module
+__all__ = ["Sink", "BufferedSink", "StreamingSink", "MemorySink", "OutputFile", "OutputError", "create"]
+
+##
+# @brief The module's top-level logger
+_logger = logging.getLogger('transmute.Output')
+
+##
+# @class OutputError
+# @brief The error emitted when an output file cannot be committed.
+# @details Descends from DispatchError
+class OutputError(DispatchError):
+   pass
+
+##
+# @class OutputFile
+# @brief An in-memory text file that is committed through its Sink when closed.
+# @details Behaves like a file opened with mode 'w', including the name attribute.
+#          When used as a context manager, the contents are discarded if the block
+#          raises an exception.
+class OutputFile(io.StringIO):
+   ##
+   # @name __init__
+   # @brief Create an empty in-memory output file
+   # @param sink [in] The Sink that will commit the file
+   # @param name [in] The path of the file
+   def __init__(self, sink, name):
+      super().__init__()
+      self.name     = name
+      self._sink    = sink
+      self._discard = False
+
+   ##
+   # @name close
+   # @brief Commit the rendered contents and close the file.
+   def close(self):
+      if not self.closed and not self._discard:
+         self._sink.commit(self.name, self.getvalue())
+      super().close()
+
+   def __exit__(self, exc_type, exc_value, traceback):
+      if exc_type is not None:
+         self._discard = True
+      return super().__exit__(exc_type, exc_value, traceback)
+
+##
+# @class StreamFile
+# @brief A text file that streams to a temporary file and is committed through its Sink when closed.
+# @details Used by @ref transmute.Output.Sink.StreamingSink "StreamingSink".
+class StreamFile(io.TextIOWrapper):
+   ##
+   # @name __init__
+   # @brief Open a temporary file next to path
+   # @param sink [in] The Sink that will commit the file
+   # @param name [in] The path of the file
+   def __init__(self, sink, name):
+      folder = sink.folder(os.path.dirname(os.path.abspath(name)))
+      #a dry run does not create folders, so stream somewhere else when there is none yet
+      fd, self.tmpname = tempfile.mkstemp(dir=folder if os.path.isdir(folder) else None, prefix='.{}.'.format(os.path.basename(name)), suffix='.tmp')
+      super().__init__(io.FileIO(fd, 'w'))
+      self._name    = name
+      self._sink    = sink
+      self._discard = False
+      self.changed  = False
+
+   @property
+   def name(self):
+      return self._name
+
+   ##
+   # @name close
+   # @brief Commit the streamed contents and close the file.
+   def close(self):
+      if self.closed:
+         return
+      super().close()
+      if self._discard:
+         remove_quietly(self.tmpname)
+      else:
+         self.changed = self._sink.commitFile(self._name, self.tmpname)
+
+   def __exit__(self, exc_type, exc_value, traceback):
+      if exc_type is not None:
+         self._discard = True
+      return super().__exit__(exc_type, exc_value, traceback)
+
+##
+# @class Sink
+# @brief Base class for the destinations of generated files.
+class Sink(metaclass = ABCMeta):
+   ##
+   # @name __init__
+   # @brief Construct a Sink
+   # @param dry_run [in] When True, nothing is written and the changes are only recorded.
+   def __init__(self, dry_run=False):
+      self.log       = logging.getLogger('transmute.Output.{}'.format(type(self).__name__))
+      self.dry_run   = dry_run
+      self.changed   = []
+      self.unchanged = []
+
+   ##
+   # @name open
+   # @brief Open a text file that will be committed to path when closed.
+   # @param path [in] The path of the file
+   # @return A writable file-like object with a name attribute
+   def open(self, path):
+      return OutputFile(self, path)
+
+   ##
+   # @name write
+   # @brief Write a file from a sequence of text fragments.
+   # @param path [in] The path of the file
+   # @param fragments [in] An iterable (e.g. a generator) of str
+   def write(self, path, fragments):
+      with self.open(path) as outfile:
+         for fragment in fragments:
+            outfile.write(fragment)
+
+   ##
+   # @name folder
+   # @brief Ensure a folder exists for the files of this Sink.
+   # @param path [in] The folder
+   # @return str path
+   # @throws OutputError When the folder cannot be created
+   def folder(self, path):
+      if not self.dry_run and not os.path.isdir(path):
+         try:
+            os.makedirs(path)
+         except OSError as ose:
+            raise OutputError("Cannot create directory '{}': {}".format(path, ose))
+      return path
+
+   ##
+   # @name commit
+   # @brief Store the complete contents of a file.
+   # @param path [in] The path of the file
+   # @param text [in] The rendered contents
+   # @return bool True when the file was (or, in dry-run mode, would be) changed
+   @abstractmethod
+   def commit(self, path, text):
+      return False
+
+   ##
+   # @name close
+   # @brief Finish all output. Called once, after every plugin has dispatched.
+   def close(self):
+      pass
+
+   ##
+   # @name report
+   # @brief Summarize the files handled by this Sink.
+   # @return list of str The lines of the report
+   def report(self):
+      total = len(self.changed) + len(self.unchanged)
+      lines = ["{} of {} files {}changed".format(len(self.changed), total, 'would be ' if self.dry_run else '')]
+      if self.dry_run:
+         lines.extend("   would change: {}".format(path) for path in self.changed)
+      return lines
+
+   def _record(self, path, changed):
+      (self.changed if changed else self.unchanged).append(path)
+      self.log.debug("{}: {}".format(('Would change' if self.dry_run else 'Changed') if changed else 'Unchanged', path))
+      return changed
+
+##
+# @class BufferedSink
+# @brief Renders each file to memory, then writes it (once) only when its contents change.
+class BufferedSink(Sink):
+   ##
+   # @name isCurrent
+   # @brief Check whether the file on disk already holds the given text.
+   # @param path [in] The path of the file on disk
+   # @param text [in] The rendered contents
+   # @return bool True when the file exists and its contents equal text
+   def isCurrent(self, path, text):
+      try:
+         #line endings are compared as written, not translated
+         with open(path, 'r', newline='') as existing:
+            return existing.read() == text
+      except (IOError, UnicodeDecodeError):
+         return False
+
+   def write(self, path, fragments):
+      self.commit(path, ''.join(fragments))
+
+   def commit(self, path, text):
+      if self.isCurrent(path, text):
+         return self._record(path, False)
+      if not self.dry_run:
+         fd, tmp = tempfile.mkstemp(dir=self.folder(os.path.dirname(os.path.abspath(path))), prefix='.{}.'.format(os.path.basename(path)), suffix='.tmp')
+         try:
+            with os.fdopen(fd, 'w', newline='') as tmpfile:
+               tmpfile.write(text)
+         except OSError as ose:
+            remove_quietly(tmp)
+            raise OutputError("Cannot write '{}': {}".format(path, ose))
+         replace(tmp, path)
+      return self._record(path, True)
+
+##
+# @class StreamingSink
+# @brief Streams each file to a temporary file, then moves it into place only when its contents change.
+# @details Nothing larger than the file object's buffer is held in memory.
+class StreamingSink(Sink):
+   def open(self, path):
+      return StreamFile(self, path)
+
+   def commit(self, path, text):
+      with self.open(path) as outfile:
+         outfile.write(text)
+      return outfile.changed
+
+   ##
+   # @name commitFile
+   # @brief Move a fully-written temporary file into place if it differs from path.
+   # @param path [in] The path of the file on disk
+   # @param tmp [in] The path of the temporary file
+   # @return bool True when the file was (or, in dry-run mode, would be) changed
+   def commitFile(self, path, tmp):
+      try:
+         current = os.path.isfile(path) and filecmp.cmp(tmp, path, shallow=False)
+      except OSError:
+         current = False
+      if current or self.dry_run:
+         remove_quietly(tmp)
+      else:
+         replace(tmp, path)
+      return self._record(path, not current)
+
+##
+# @class MemorySink
+# @brief Keeps every file in memory.
+# @details Intended for tests, and for piping results into other tools. Use
+#          @ref transmute.Output.Sink.MemorySink.archive "archive" to obtain the
+#          files as a zip archive.
+class MemorySink(Sink):
+   ##
+   # @name __init__
+   # @brief Construct an empty MemorySink
+   # @param dry_run [in] Ignored; nothing is ever written to disk.
+   # @param zip_path [in] When given, the files are archived to this path ('-' for stdout) when the Sink is closed.
+   # @param root [in] The folder that archive member names are relative to (default is the folder common to all files).
+   def __init__(self, dry_run=False, zip_path=None, root=None):
+      super().__init__(dry_run)
+      self.files    = OrderedDict()
+      self.zip_path = zip_path
+      self.root     = root
+
+   def folder(self, path):
+      return path
+
+   def commit(self, path, text):
+      self.files[path] = text
+      return self._record(path, True)
+
+   ##
+   # @name getvalue
+   # @brief Get the contents of a file.
+   # @param path [in] The path the file was opened with
+   # @return str
+   def getvalue(self, path):
+      return self.files[path]
+
+   ##
+   # @name archive
+   # @brief Write every file to a zip archive.
+   # @param file_or_stream [in] A path or a binary stream
+   def archive(self, file_or_stream):
+      root = self.root
+      if root is None and len(self.files):
+         #commonprefix works character by character, so compare folders with a trailing separator
+         root = os.path.dirname(os.path.commonprefix([os.path.join(os.path.dirname(os.path.abspath(path)), '') for path in self.files]))
+      with zipfile.ZipFile(file_or_stream, 'w', zipfile.ZIP_DEFLATED) as zfile:
+         for path, text in self.files.items():
+            zfile.writestr(os.path.relpath(os.path.abspath(path), root), text)
+
+   def close(self):
+      if self.zip_path == '-':
+         stream = io.BytesIO()
+         self.archive(stream)
+         sys.stdout.buffer.write(stream.getvalue())
+         sys.stdout.buffer.flush()
+      elif self.zip_path is not None:
+         self.archive(self.zip_path)
+
+##
+# @brief The available sinks, by command line name
+kinds = OrderedDict((('buffered',  BufferedSink),
+                     ('streaming', StreamingSink),
+                     ('zip',       MemorySink)
+                    ))
+
+##
+# @name create
+# @brief Construct a Sink by its command line name
+# @param kind [in] One of the keys of kinds
+# @param dry_run [in] When True, nothing is written and the changes are only recorded.
+# @param zip_path [in] The archive path used by the zip sink ('-' for stdout)
+# @return Sink
+def create(kind, dry_run=False, zip_path=None):
+   if kinds[kind] is MemorySink:
+      return MemorySink(dry_run, zip_path if zip_path is not None else '-')
+   return kinds[kind](dry_run)
+
+##
+# @name replace
+# @brief Atomically move a temporary file over path, keeping the permissions of path.
+# @param tmp [in] The temporary file
+# @param path [in] The destination
+# @throws OutputError When the file cannot be replaced
+def replace(tmp, path):
+   try:
+      os.chmod(tmp, file_mode(path))
+      os.replace(tmp, path)
+   except OSError as ose:
+      remove_quietly(tmp)
+      raise OutputError("Cannot write '{}': {}".format(path, ose))
+
+##
+# @name remove_quietly
+# @brief Remove a file, ignoring any error.
+# @param path [in] The file to remove
+def remove_quietly(path):
+   try:
+      os.remove(path)
+   except OSError:
+      pass
+
+##
+# @name file_mode
+# @brief Determine the permission bits to use for a (re)written file.
+# @param path [in] The path of the file on disk
+# @return int The mode of the existing file, or the default mode for new files
+def file_mode(path):
+   try:
+      return os.stat(path).st_mode & 0o7777
+   except OSError:
+      umask = os.umask(0)
+      os.umask(umask)
+      return 0o666 & ~umask
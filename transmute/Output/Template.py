@@ -0,0 +1,102 @@
+##
+# @file transmute/Output/Template.py
+# @brief Contains a small template engine for generated source code.
+# @details A @ref transmute.Output.Template.Template "Template" uses str.format syntax,
+#          but is compiled once (usually when a plugin is loaded) into a render function.
+#          Fields whose values are known ahead of time (indentation, version banners, ...)
+#          are folded into the literal text at compile time, so that rendering only joins
+#          the remaining pieces.
+#
+import logging
+import keyword
+from   string import Formatter
+
+##
+# @brief All of the items exported by this module
+__all__ = ["Template"]
+
+##
+# @brief The module's top-level logger
+_logger = logging.getLogger('transmute.Output.Template')
+
+##
+# @class Template
+# @brief A str.format-style template compiled into a render function.
+# @details Replacement fields must be plain identifiers, optionally with a conversion
+#          and a format spec (e.g. {name}, {name!r}, {value:>8}). Literal braces are
+#          written {{ and }}, as with str.format. Keywords that the template does not
+#          use are ignored, as with str.format.
+class Template(object):
+   ##
+   # @name __init__
+   # @brief Compile a template
+   # @param text [in] The template text, in str.format syntax
+   # @param constants [in] Values for fields that are folded into the template at compile time
+   # @throws ValueError When text is not a valid template
+   def __init__(self, text, **constants):
+      self.text   = text
+      self.pieces = []
+      for literal, name, spec, conversion in Formatter().parse(text):
+         if literal:
+            self._literal(literal)
+         if name is None:
+            continue
+         if not name.isidentifier() or keyword.iskeyword(name):
+            raise ValueError("Unsupported template field '{}'".format(name))
+         if name in constants:
+            self._literal(Formatter().format_field(Formatter().convert_field(constants[name], conversion), spec))
+         else:
+            self.pieces.append((name, spec, conversion))
+      self.fields = tuple(sorted(set(piece[0] for piece in self.pieces if isinstance(piece, tuple))))
+      self.render = self._compile()
+
+   def _literal(self, literal):
+      if len(self.pieces) and isinstance(self.pieces[-1], str):
+         self.pieces[-1] = ''.join((self.pieces[-1], literal))
+      else:
+         self.pieces.append(literal)
+
+   ##
+   # @name _compile
+   # @brief Build the render function from the template pieces.
+   # @return function A function accepting the template fields as keyword arguments
+   def _compile(self):
+      exprs = []
+      for piece in self.pieces:
+         if isinstance(piece, str):
+            exprs.append(repr(piece))
+         else:
+            name, spec, conversion = piece
+            value = {'r':'repr({})', 's':'str({})', 'a':'ascii({})'}.get(conversion, '{}').format(name)
+            exprs.append('format({}, {!r})'.format(value, spec) if spec else ('str({})'.format(value) if conversion is None else value))
+      if   len(exprs) == 0:
+         body = "''"
+      elif len(exprs) == 1:
+         body = exprs[0]
+      else:
+         body = "''.join(({},))".format(', '.join(exprs))
+      params = ''.join(['*, ' if self.fields else '', ''.join('{}, '.format(f) for f in self.fields), '**_unused'])
+      source = 'def render({}):\n   return {}\n'.format(params, body)
+      _logger.debug("Compiled template:\n{}".format(source))
+      scope = {}
+      exec(compile(source, '<template>', 'exec'), scope)
+      return scope['render']
+
+   ##
+   # @name __call__
+   # @brief Render the template
+   # @param fields [in] The values of the template fields
+   # @return str
+   def __call__(self, **fields):
+      return self.render(**fields)
+
+   ##
+   # @name format
+   # @brief Render the template (str.format compatibility)
+   # @param fields [in] The values of the template fields
+   # @return str
+   def format(self, **fields):
+      return self.render(**fields)
+
+   def __str__(self):
+      return self.text
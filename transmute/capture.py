@@ -0,0 +1,760 @@
+##
+# @file transmute/capture.py
+# @brief Decodes capture files against a protocol specification.
+# @details Captures are read through a memory-mapped file, one packet at a time, so that memory
+#          use does not grow with the size of the capture. Both the pcap and the pcapng formats
+#          are read. The payload of each packet is found by parsing its link, IP and UDP or TCP
+#          headers (or at a fixed offset), and is then routed through the protocol with the same
+#          <ws:expose> and <ws:register> elements the wireshark plugin uses:
+#          - The protocol, or a message, registered in the udp.port or tcp.port table receives the
+#            payloads of that port. Without such a registration, the protocol receives every
+#            payload.
+#          - The protocol header is decoded, and each field it exposes selects the message
+#            registered for its value. Messages are decoded from the bytes that follow the
+#            protocol header, and a message that exposes a field routes the bytes that follow its
+#            own header in turn.
+#
+#          TCP segments are decoded one at a time; streams are not reassembled, and neither are
+#          fragmented IP datagrams.
+#
+import array
+import contextlib
+import csv
+import heapq
+import json
+import logging
+import math
+import mmap
+import multiprocessing
+import operator
+import os
+import shutil
+import struct
+import tempfile
+import time
+import traceback
+from   collections       import OrderedDict, namedtuple
+from   .                 import runtime
+from   .                 import stats as field_stats
+from   .plugins.wireshark import Register, ws_route_nodes
+
+##
+# @brief All of the items exported by this module
+__all__ = ["CaptureError", "Packet", "Shard", "packets", "shards", "Payload", "payload", "portEntries", "Router", "formats",
+           "decodeCapture", "summaryLines", "captureStats"]
+
+##
+# @brief The module's top-level logger
+_logger = logging.getLogger('transmute.capture')
+
+##
+# @class CaptureError
+# @brief The error emitted when a capture file cannot be read.
+class CaptureError(ValueError):
+   pass
+
+##
+# @brief A packet of a capture
+# @details timestamp is in seconds since the epoch (None when the capture does not record one),
+#          linktype is the LINKTYPE_ value of the interface, and data is a memoryview of the
+#          captured bytes in the memory-mapped file.
+Packet = namedtuple('Packet', ['timestamp', 'linktype', 'data'])
+
+##
+# @brief The pcap magic numbers, with the byte order and timestamp resolution they imply
+_pcap_magics = {b'\xd4\xc3\xb2\xa1' : ('<', 1e-6), b'\xa1\xb2\xc3\xd4' : ('>', 1e-6),
+                b'\x4d\x3c\xb2\xa1' : ('<', 1e-9), b'\xa1\xb2\x3c\x4d' : ('>', 1e-9)}
+
+##
+# @brief The type of a pcapng section header block, which reads the same in both byte orders
+_pcapng_shb = b'\x0a\x0d\x0d\x0a'
+
+##
+# @brief A record-aligned part of a capture
+# @details format is 'pcap' or 'pcapng'. start and end are the byte offsets of the first record of
+#          the shard and of the record after its last, and frame is the number of its first packet.
+#          state is what a reader needs to know from the records before the shard: the byte order,
+#          timestamp resolution and link type of a pcap, or the byte order and the (linktype,
+#          resolution) of each interface of a pcapng section.
+Shard = namedtuple('Shard', ['format', 'start', 'end', 'frame', 'state'])
+
+##
+# @name _capture
+# @brief Identifies the format of a capture
+# @param buf [in] The capture
+# @return Shard The whole capture
+# @throws CaptureError When the capture is not in a known format
+def _capture(buf):
+   magic = bytes(buf[:4])
+   if len(buf) >= 24 and magic in _pcap_magics:
+      order, resolution = _pcap_magics[magic]
+      #the upper bits of the link type hold FCS information
+      linktype = struct.unpack_from(order + 'I', buf, 20)[0] & 0x0FFFFFFF
+      return Shard('pcap', 24, len(buf), 1, (order, resolution, linktype))
+   elif len(buf) >= 12 and magic == _pcapng_shb:
+      return Shard('pcapng', 0, len(buf), 1, ('<', ()))
+   raise CaptureError("Not a pcap or pcapng capture")
+
+##
+# @name packets
+# @brief Iterates over the packets of a pcap or pcapng capture
+# @param buf [in] The capture, usually a memory-mapped file
+# @param shard [in] The Shard of the capture to read (default is the whole capture)
+# @return generator The Packets
+# @throws CaptureError When the capture is not in a known format, or is truncated
+def packets(buf, shard=None):
+   shard = _capture(buf) if shard is None else shard
+   return _readers[shard.format](memoryview(buf), shard)
+
+def _pcap_packets(view, shard):
+   order, resolution, linktype = shard.state
+   record = struct.Struct(order + 'IIII')
+   offset = shard.start
+   while offset + record.size <= shard.end:
+      seconds, fraction, length, unused = record.unpack_from(view, offset)
+      offset += record.size
+      if offset + length > shard.end:
+         raise CaptureError("Truncated packet at offset {}".format(offset - record.size))
+      yield Packet(seconds + fraction * resolution, linktype, view[offset:offset + length])
+      offset += length
+   if offset < shard.end:
+      _logger.warning("Ignoring {} trailing bytes of a truncated packet header".format(shard.end - offset))
+
+def _pcapng_packets(view, shard):
+   order, interfaces = shard.state
+   interfaces = list(interfaces)
+   offset     = shard.start
+   while offset + 12 <= shard.end:
+      if bytes(view[offset:offset + 4]) == _pcapng_shb:
+         #a section header gives the byte order of the rest of the section
+         order      = '<' if bytes(view[offset + 8:offset + 12]) == b'\x4d\x3c\x2b\x1a' else '>'
+         interfaces = []
+      kind, length = struct.unpack_from(order + 'II', view, offset)
+      if length < 12 or offset + length > shard.end:
+         raise CaptureError("Truncated block at offset {}".format(offset))
+      body = view[offset + 8:offset + length - 4]
+      if   kind == 1:
+         interfaces.append((struct.unpack_from(order + 'H', body, 0)[0], _pcapng_resolution(body[8:], order)))
+      elif kind == 6:
+         interface, high, low, captured = struct.unpack_from(order + 'IIII', body, 0)
+         linktype, resolution = _pcapng_interface(interfaces, interface, offset)
+         yield Packet(((high << 32) | low) * resolution, linktype, body[20:20 + captured])
+      elif kind == 3:
+         linktype, resolution = _pcapng_interface(interfaces, 0, offset)
+         original = struct.unpack_from(order + 'I', body, 0)[0]
+         yield Packet(None, linktype, body[4:4 + min(original, len(body) - 4)])
+      elif kind == 2:
+         interface, drops, high, low, captured = struct.unpack_from(order + 'HHIII', body, 0)
+         linktype, resolution = _pcapng_interface(interfaces, interface, offset)
+         yield Packet(((high << 32) | low) * resolution, linktype, body[20:20 + captured])
+      offset += length
+   if offset < shard.end:
+      _logger.warning("Ignoring {} trailing bytes of a truncated block header".format(shard.end - offset))
+
+##
+# @brief The packet readers, by capture format
+_readers = {'pcap' : _pcap_packets, 'pcapng' : _pcapng_packets}
+
+##
+# @name shards
+# @brief Splits a capture into record-aligned shards of about the same size
+# @details Only the record headers are read: the length of each pcap record, and the type and
+#          length of each pcapng block, along with the section and interface blocks a reader needs.
+# @param buf [in] The capture, usually a memory-mapped file
+# @param count [in] The number of shards to aim for
+# @return list The Shards, in capture order
+# @throws CaptureError When the capture is not in a known format
+def shards(buf, count):
+   capture = _capture(buf)
+   return _scanners[capture.format](memoryview(buf), capture, max(1, (capture.end - capture.start) // max(1, count)))
+
+def _pcap_shards(view, capture, step):
+   length = struct.Struct(capture.state[0] + 'I').unpack_from
+   rv     = []
+   begin  = offset = capture.start
+   frame  = capture.frame
+   count  = 0
+   target = begin + step
+   last   = len(view) - 16
+   while offset <= last:
+      if offset >= target:
+         rv.append(capture._replace(start=begin, end=offset, frame=frame))
+         begin, frame, count, target = offset, frame + count, 0, offset + step
+      offset += 16 + length(view, offset + 8)[0]
+      count  += 1
+   rv.append(capture._replace(start=begin, frame=frame))
+   return rv
+
+def _pcapng_shards(view, capture, step):
+   order, interfaces = capture.state
+   interfaces = list(interfaces)
+   rv     = []
+   begin  = offset = capture.start
+   frame  = capture.frame
+   count  = 0
+   target = begin + step
+   state  = capture.state
+   last   = len(view) - 12
+   while offset <= last:
+      if offset >= target:
+         rv.append(capture._replace(start=begin, end=offset, frame=frame, state=state))
+         begin, frame, count, target, state = offset, frame + count, 0, offset + step, (order, tuple(interfaces))
+      if bytes(view[offset:offset + 4]) == _pcapng_shb:
+         order      = '<' if bytes(view[offset + 8:offset + 12]) == b'\x4d\x3c\x2b\x1a' else '>'
+         interfaces = []
+      kind, length = struct.unpack_from(order + 'II', view, offset)
+      if length < 12:
+         break
+      if   kind == 1 and offset + length <= len(view):
+         interfaces.append((struct.unpack_from(order + 'H', view, offset + 8)[0], _pcapng_resolution(view[offset + 16:offset + length - 4], order)))
+      elif kind in (2, 3, 6):
+         count += 1
+      offset += length
+   rv.append(capture._replace(start=begin, frame=frame, state=state))
+   return rv
+
+##
+# @brief The shard scanners, by capture format
+_scanners = {'pcap' : _pcap_shards, 'pcapng' : _pcapng_shards}
+
+def _pcapng_interface(interfaces, interface, offset):
+   try:
+      return interfaces[interface]
+   except IndexError:
+      raise CaptureError("Packet of undescribed interface {} at offset {}".format(interface, offset))
+
+##
+# @name _pcapng_resolution
+# @brief Reads the if_tsresol option of an interface description block
+# @param options [in] The options of the block
+# @param order [in] The byte order of the section
+# @return float The timestamp resolution, in seconds
+def _pcapng_resolution(options, order):
+   offset = 0
+   while offset + 4 <= len(options):
+      code, length = struct.unpack_from(order + 'HH', options, offset)
+      if code == 0:
+         break
+      if code == 9 and length >= 1:
+         value = options[offset + 4]
+         return 2.0 ** -(value & 0x7f) if value & 0x80 else 10.0 ** -value
+      offset += 4 + (length + 3) // 4 * 4
+   return 1e-6
+
+##
+# @brief The payload of a packet
+# @details transport is 'udp', 'tcp' or None (at a fixed offset), and the ports are None without
+#          a transport.
+Payload = namedtuple('Payload', ['data', 'transport', 'source', 'destination'])
+
+##
+# @brief The ethertypes of IPv4, IPv6 and VLAN tags
+_ethertypes = {0x0800 : 4, 0x86DD : 6, 0x8100 : 'vlan', 0x88A8 : 'vlan', 0x9100 : 'vlan'}
+
+##
+# @brief The IPv6 extension headers that can be skipped, with a function giving their length
+_ipv6_extensions = {0  : lambda h: (h[1] + 1) * 8,
+                    43 : lambda h: (h[1] + 1) * 8,
+                    60 : lambda h: (h[1] + 1) * 8,
+                    51 : lambda h: (h[1] + 2) * 4}
+
+##
+# @name payload
+# @brief Locates the UDP or TCP payload of a packet
+# @param packet [in] The Packet
+# @param ports [in] The UDP and TCP ports to accept (default is any)
+# @param offset [in] A fixed offset of the payload in the captured bytes, which skips the parsing
+# @return Payload The payload, or None when the packet has no UDP or TCP payload on those ports
+def payload(packet, ports=None, offset=None):
+   data = packet.data
+   if offset is not None:
+      return Payload(data[offset:], None, None, None) if len(data) >= offset else None
+   version, ip = _link(packet.linktype, data)
+   if version == 4 and len(ip) >= 20:
+      header = (ip[0] & 0x0F) * 4
+      #fragmented datagrams are not reassembled
+      if ip[6] & 0x3F or ip[7]:
+         return None
+      protocol, ip = ip[9], ip[header:(ip[2] << 8) | ip[3]]
+   elif version == 6 and len(ip) >= 40:
+      protocol, ip = ip[6], ip[40:40 + ((ip[4] << 8) | ip[5])]
+      while protocol in _ipv6_extensions and len(ip) >= 8:
+         protocol, ip = ip[0], ip[_ipv6_extensions[protocol](ip):]
+   else:
+      return None
+   if   protocol == 17 and len(ip) >= 8:
+      transport, data = 'udp', ip[8:(ip[4] << 8) | ip[5]]
+   elif protocol == 6 and len(ip) >= 20:
+      transport, data = 'tcp', ip[(ip[12] >> 4) * 4:]
+   else:
+      return None
+   source, destination = (ip[0] << 8) | ip[1], (ip[2] << 8) | ip[3]
+   if ports and source not in ports and destination not in ports:
+      return None
+   return Payload(data, transport, source, destination)
+
+##
+# @name _link
+# @brief Strips the link layer of a packet
+# @param linktype [in] The LINKTYPE_ value
+# @param data [in] The captured bytes
+# @return (int, memoryview) The IP version (None when not IP) and the IP datagram
+def _link(linktype, data):
+   if   linktype == 1 and len(data) >= 14:
+      #ethernet, possibly with VLAN tags
+      offset    = 12
+      ethertype = _ethertypes.get((data[offset] << 8) | data[offset + 1])
+      while ethertype == 'vlan' and len(data) >= offset + 6:
+         offset   += 4
+         ethertype = _ethertypes.get((data[offset] << 8) | data[offset + 1])
+      return (ethertype if ethertype != 'vlan' else None, data[offset + 2:])
+   elif linktype == 113 and len(data) >= 16:
+      return (_ethertypes.get((data[14] << 8) | data[15]), data[16:])
+   elif linktype == 276 and len(data) >= 20:
+      return (_ethertypes.get((data[0] << 8) | data[1]), data[20:])
+   elif linktype in (0, 108) and len(data) >= 4:
+      #BSD loopback: the address family is in host order for 0, network order for 108
+      family = struct.unpack_from('<I' if linktype == 0 and data[0] else '>I', data, 0)[0]
+      return ({2 : 4, 24 : 6, 28 : 6, 30 : 6}.get(family), data[4:])
+   elif linktype in (101, 228, 229, 12, 14) and len(data):
+      return (data[0] >> 4, data)
+   return (None, data)
+
+##
+# @name portEntries
+# @brief Lists the nodes of a protocol registered in the udp.port and tcp.port tables
+# @param protocol [in] The validated Protocol
+# @return dict The nodes, keyed by ('udp' or 'tcp', port)
+def portEntries(protocol):
+   entries = {}
+   for node in ws_route_nodes(protocol):
+      for j in (c for c in node.children if isinstance(c, Register) and c.table in ('udp.port', 'tcp.port')):
+         entries[(j.table[:3], int(j.value, 0))] = node
+   return entries
+
+def _entry(entries, payload, protocol):
+   for port in (payload.destination, payload.source):
+      node = entries.get((payload.transport, port))
+      if node is not None:
+         return node
+   return protocol
+
+##
+# @class Router
+# @brief Routes payloads through the headers and messages of a protocol
+# @details The protocol is compiled with @ref transmute.runtime.compile "runtime.compile", and
+#          routed along its @ref transmute.runtime.routeGraph "runtime.routeGraph". Each route node
+#          (the protocol and its messages) gets the getters of the fields it exposes, and the table
+#          of nodes registered for each value of those fields.
+class Router(object):
+   ##
+   # @name __init__
+   # @brief Compile a protocol for routing
+   # @param protocol [in] The validated Protocol
+   def __init__(self, protocol):
+      self.protocol = protocol
+      self.decoders = runtime.compile(protocol, views=False)
+      self.nodes    = {}
+      for route in runtime.routeGraph(protocol).values():
+         if route.section is None:
+            decode, columns = None, []
+         else:
+            decode  = self.decoders.decode[route.section.abbreviation]
+            columns = [(c.abbreviation, _getter(c)) for c in runtime.sectionColumns(route.section)]
+         exposed = [(operator.attrgetter(c.name), table) for c, table in route.exposed]
+         self.nodes[route.node] = (decode, route.advance, exposed, columns)
+      self.ports = portEntries(protocol)
+
+   ##
+   # @name entry
+   # @brief Returns the node that receives a payload
+   # @param payload [in] The Payload
+   # @return The protocol, or the node registered for the payload's port
+   def entry(self, payload):
+      return _entry(self.ports, payload, self.protocol)
+
+   ##
+   # @name route
+   # @brief Decodes a payload
+   # @param data [in] The payload bytes
+   # @param node [in] The node that receives the payload
+   # @param record [in,out] The OrderedDict that receives the value of each field, by abbreviation. Undecoded fields are in hexadecimal
+   # @return The last node that decoded the payload
+   # @throws ValueError When the payload is shorter than a section it is routed to
+   def route(self, data, node, record):
+      offset = 0
+      last   = node
+      for hop in range(len(self.nodes)):
+         decode, length, exposed, columns = self.nodes[node]
+         if decode is not None:
+            decoded = decode(data, offset)
+            for abbreviation, getter in columns:
+               record[abbreviation] = getter(decoded)
+         last = node
+         node = None
+         for getter, routes in exposed:
+            node = routes.get(getter(decoded))
+            if node is not None:
+               break
+         if node is None:
+            break
+         offset += length
+      return last
+
+##
+# @name _getter
+# @brief Builds the getter of a column of a decoded section
+# @param column [in] The runtime.Column
+# @return callable Reads the column's value from a decoded section, in hexadecimal for undecoded fields
+def _getter(column):
+   getter = operator.attrgetter(column.name)
+   if column.layout.kind == 'undecoded':
+      return lambda decoded: getter(decoded).hex()
+   return getter
+
+##
+# @class JsonWriter
+# @brief Writes one JSON object per record, per line
+class JsonWriter(object):
+   def __init__(self, stream, router, header=True):
+      self.stream = stream
+
+   def write(self, record):
+      self.stream.write(json.dumps(record))
+      self.stream.write('\n')
+
+##
+# @class CsvWriter
+# @brief Writes one CSV row per record
+# @details The columns are every field of the protocol, in specification order, so that the header
+#          is known before the first record. A record leaves the fields it does not hold empty.
+class CsvWriter(object):
+   def __init__(self, stream, router, header=True):
+      columns = ['frame', 'time', 'message']
+      for decode, length, exposed, fields in router.nodes.values():
+         columns.extend(abbreviation for abbreviation, getter in fields)
+      columns      = list(OrderedDict.fromkeys(columns))
+      self.index   = dict((c, i) for i, c in enumerate(columns))
+      self.writer  = csv.writer(stream)
+      if header:
+         self.writer.writerow(columns)
+
+   def write(self, record):
+      row = [''] * len(self.index)
+      for k, v in record.items():
+         row[self.index[k]] = v
+      self.writer.writerow(row)
+
+##
+# @brief The output formats, by name
+formats = OrderedDict([('jsonl', JsonWriter), ('csv', CsvWriter)])
+
+##
+# @brief The orders in which the records of a parallel decode are merged
+# @details time merges the shards by timestamp, keeping the capture order of the records of each
+#          shard. unordered writes the records of each shard as soon as it is decoded.
+orders = ('time', 'unordered')
+
+##
+# @brief The number of shards given to each worker process, which evens out their load
+shards_per_job = 4
+
+##
+# @brief The smallest shard worth a task, in bytes
+shard_minimum = 1 << 20
+
+##
+# @name decodeCapture
+# @brief Decodes every payload of a capture and writes one record per payload
+# @details Records hold the frame number, the timestamp, the abbreviation of the last message the
+#          payload was routed to, and the value of every field decoded on the way. Undecoded fields
+#          are written in hexadecimal. Payloads too short for the sections they are routed to are
+#          counted and skipped.
+#
+#          With more than one job, the capture is split into shards that a pool of worker processes
+#          decodes into temporary files, which are then merged into stream.
+# @param protocol [in] The validated Protocol
+# @param path [in] The path of the pcap or pcapng capture
+# @param stream [in] The text stream that receives the records
+# @param fmt [in] The output format, one of formats
+# @param ports [in] The UDP and TCP ports to decode (default is those registered by the protocol, or any port)
+# @param offset [in] A fixed offset of the payload in the captured bytes, which skips the parsing
+# @param jobs [in] The number of worker processes
+# @param order [in] How the records of a parallel decode are merged, one of orders
+# @return dict The number of packets, records, skipped and short payloads, and bytes, and the elapsed time.
+#              A parallel decode adds the number of shards, and the same counts for each worker, by process id
+# @throws CaptureError When the capture cannot be read
+def decodeCapture(protocol, path, stream, fmt='jsonl', ports=None, offset=None, jobs=1, order='time'):
+   router = Router(protocol)
+   ports  = set(ports) if ports else set(port for transport, port in router.ports)
+   with _mapped(path) as mapped:
+      parts = shards(mapped, min(jobs * shards_per_job, len(mapped) // shard_minimum)) if jobs > 1 else None
+      if parts is None or len(parts) <= 1:
+         stats = _decode(router, mapped, formats[fmt](stream, router), ports, offset)
+   if parts is not None and len(parts) > 1:
+      stats = _decode_parallel(protocol, router, path, parts, stream, fmt, ports, offset, jobs, order)
+   for line in summaryLines(stats):
+      _logger.debug(line)
+   return stats
+
+##
+# @name summaryLines
+# @brief Describes a decoding run
+# @details The counts and throughput of the run are followed by those of each worker of a parallel run.
+# @param stats [in] The dict returned by decodeCapture
+# @return list The lines of the summary
+def summaryLines(stats):
+   rate  = lambda counts: counts['bytes'] / max(counts['elapsed'], 1e-9) / 1e6
+   lines = ["Decoded {records} records from {packets} packets ({skipped} skipped, {short} short) of {bytes} bytes in {elapsed:.3f} s ({:.1f} MB/s)".format(rate(stats), **stats)]
+   for pid, worker in stats.get('workers', {}).items():
+      lines.append("Worker {}: {shards} shards, {packets} packets, {bytes} bytes in {elapsed:.3f} s ({:.1f} MB/s)".format(pid, rate(worker), **worker))
+   return lines
+
+##
+# @name _mapped
+# @brief Memory-maps a capture for reading
+# @param path [in] The path of the capture
+# @return The context manager of the mmap
+# @throws CaptureError When the capture cannot be read, or is empty
+@contextlib.contextmanager
+def _mapped(path):
+   try:
+      with open(path, 'rb') as capture:
+         try:
+            mapped = mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ)
+         except ValueError:
+            raise CaptureError("'{}' is empty".format(path))
+         try:
+            yield mapped
+         except BaseException as e:
+            #the frames of the traceback hold views of the mapped file, which cannot be closed under them
+            traceback.clear_frames(e.__traceback__)
+            raise
+         finally:
+            mapped.close()
+   except IOError as ioe:
+      raise CaptureError("Unable to read '{}': {}".format(path, ioe))
+
+##
+# @name _decode
+# @brief Decodes the payloads of a capture, or of one of its shards
+# @param router [in] The Router of the protocol
+# @param mapped [in] The capture
+# @param writer [in] The JsonWriter or CsvWriter of the records
+# @param ports [in] The set of UDP and TCP ports to decode, or an empty set for any
+# @param offset [in] A fixed offset of the payload in the captured bytes, or None
+# @param shard [in] The Shard to decode (default is the whole capture)
+# @param times [in] The _TimeLog of the records' timestamps, or None
+# @return dict The counts and elapsed time of decodeCapture
+def _decode(router, mapped, writer, ports, offset, shard=None, times=None):
+   shard = _capture(mapped) if shard is None else shard
+   stats = dict(packets=0, records=0, skipped=0, short=0, bytes=shard.end - shard.start)
+   start = time.perf_counter()
+   #the memoryviews of the mapped file are released on return, before it is closed
+   for frame, packet in enumerate(packets(mapped, shard), shard.frame):
+      stats['packets'] += 1
+      found = payload(packet, ports, offset)
+      if found is None:
+         stats['skipped'] += 1
+         continue
+      record  = OrderedDict([('frame', frame), ('time', packet.timestamp), ('message', None)])
+      try:
+         last = router.route(found.data, router.entry(found), record)
+      except ValueError:
+         stats['short'] += 1
+         continue
+      record['message'] = last.abbreviation
+      writer.write(record)
+      if times is not None:
+         times.append(packet.timestamp)
+      stats['records'] += 1
+   stats['elapsed'] = time.perf_counter() - start
+   return stats
+
+##
+# @class _TimeLog
+# @brief Writes the timestamps of the records of a shard, as doubles, for the merge
+# @details A record without a timestamp takes the timestamp of the record before it. The records
+#          before the first timestamp of the shard are written as NaN, and take the last timestamp
+#          of the shards before it when they are merged.
+class _TimeLog(object):
+   def __init__(self, stream):
+      self.stream = stream
+      self.times  = array.array('d')
+      self.last   = float('nan')
+
+   def append(self, timestamp):
+      self.last = self.last if timestamp is None else timestamp
+      self.times.append(self.last)
+      if len(self.times) >= 8192:
+         self.flush()
+
+   def flush(self):
+      self.times.tofile(self.stream)
+      del self.times[:]
+
+##
+# @brief The router, capture, output settings and temporary folder of the worker processes of a parallel decode.
+_pool_state = None
+
+##
+# @name _pool_init
+# @brief Initializes a worker process of a parallel decode.
+# @param protocol [in] The protocol being decoded
+# @param path [in] The path of the capture
+# @param fmt [in] The output format
+# @param ports [in] The set of UDP and TCP ports to decode
+# @param offset [in] A fixed offset of the payload in the captured bytes, or None
+# @param order [in] How the records are merged
+# @param folder [in] The folder of the shard outputs
+def _pool_init(protocol, path, fmt, ports, offset, order, folder):
+   global _pool_state
+   with open(path, 'rb') as capture:
+      mapped = mmap.mmap(capture.fileno(), 0, access=mmap.ACCESS_READ)
+   _pool_state = (Router(protocol), mapped, fmt, ports, offset, order, folder)
+
+##
+# @name _pool_decode
+# @brief Decodes one shard of the capture held by the worker process.
+# @param task [in] The index and Shard of the shard
+# @return dict The counts and elapsed time of the shard, with its index and the worker's process id
+def _pool_decode(task):
+   index, shard = task
+   router, mapped, fmt, ports, offset, order, folder = _pool_state
+   with open(_shard_path(folder, index, 'out'), 'w', newline='') as out:
+      if order == 'time':
+         with open(_shard_path(folder, index, 'time'), 'wb') as stream:
+            times = _TimeLog(stream)
+            stats = _decode(router, mapped, formats[fmt](out, router, header=False), ports, offset, shard, times)
+            times.flush()
+      else:
+         stats = _decode(router, mapped, formats[fmt](out, router, header=False), ports, offset, shard)
+   stats.update(index=index, pid=os.getpid())
+   return stats
+
+def _shard_path(folder, index, kind):
+   return os.path.join(folder, '{}.{}'.format(index, kind))
+
+##
+# @name _decode_parallel
+# @brief Decodes the shards of a capture in a pool of worker processes
+# @details Workers decode whole shards into files of a temporary folder, which are merged into the
+#          output by timestamp once every shard is decoded, or copied as each shard is decoded.
+# @return dict The counts and elapsed time of decodeCapture, with the shards and workers
+def _decode_parallel(protocol, router, path, parts, stream, fmt, ports, offset, jobs, order):
+   _logger.debug('Decoding {} shards with {} jobs'.format(len(parts), jobs))
+   start = time.perf_counter()
+   done  = []
+   formats[fmt](stream, router)
+   with tempfile.TemporaryDirectory(prefix='transmute-') as folder:
+      with multiprocessing.Pool(processes=jobs, initializer=_pool_init, initargs=(protocol, path, fmt, ports, offset, order, folder)) as pool:
+         for stats in pool.imap_unordered(_pool_decode, enumerate(parts)):
+            done.append(stats)
+            if order == 'unordered':
+               with open(_shard_path(folder, stats['index'], 'out'), 'r', newline='') as out:
+                  shutil.copyfileobj(out, stream)
+      if order == 'time':
+         opened = []
+         before = float('-inf')
+         try:
+            for index in range(len(parts)):
+               opened.append((open(_shard_path(folder, index, 'out'), 'r', newline=''), open(_shard_path(folder, index, 'time'), 'rb'), before))
+               before = _last_time(opened[-1][1], before)
+            #records of equal timestamps are merged in shard order
+            for timestamp, line in heapq.merge(*(_shard_lines(out, times, before) for out, times, before in opened), key=operator.itemgetter(0)):
+               stream.write(line)
+         finally:
+            for out, times, before in opened:
+               out.close()
+               times.close()
+   stats = dict((k, sum(s[k] for s in done)) for k in ('packets', 'records', 'skipped', 'short', 'bytes'))
+   stats.update(elapsed=time.perf_counter() - start, shards=len(parts), workers=OrderedDict())
+   for s in sorted(done, key=operator.itemgetter('pid')):
+      worker = stats['workers'].setdefault(s['pid'], dict(shards=0, packets=0, records=0, skipped=0, short=0, bytes=0, elapsed=0.0))
+      worker['shards'] += 1
+      for k in ('packets', 'records', 'skipped', 'short', 'bytes', 'elapsed'):
+         worker[k] += s[k]
+   return stats
+
+##
+# @name _last_time
+# @brief Reads the last timestamp of a decoded shard
+# @param times [in] The timestamps of the records, written by a _TimeLog
+# @param before [in] The last timestamp of the shards before
+# @return float The last timestamp of the shard, or before when the shard has none
+def _last_time(times, before):
+   last = array.array('d')
+   if times.seek(0, os.SEEK_END):
+      times.seek(-last.itemsize, os.SEEK_END)
+      last.frombytes(times.read(last.itemsize))
+   times.seek(0)
+   return before if not last or math.isnan(last[0]) else last[0]
+
+##
+# @name _shard_lines
+# @brief Iterates over the records of a decoded shard, with their timestamps
+# @param out [in] The records of the shard, one per line
+# @param times [in] The timestamps of the records, written by a _TimeLog
+# @param before [in] The timestamp of the records before the first timestamp of the shard
+# @return generator The (timestamp, line) of each record
+def _shard_lines(out, times, before):
+   while True:
+      chunk = array.array('d')
+      chunk.frombytes(times.read(8192 * chunk.itemsize))
+      if not chunk:
+         return
+      for timestamp in chunk:
+         yield (before if math.isnan(timestamp) else timestamp, out.readline())
+
+##
+# @name captureStats
+# @brief Accumulates the distribution of every field of the payloads of a capture
+# @details Payloads are classified with @ref transmute.runtime.compileClassifier "runtime.compileClassifier",
+#          which reads only the exposed fields, and the protocol header and the last message each
+#          payload is routed to are added to a @ref transmute.stats.Collector "stats.Collector".
+#          Messages that route on to another message are not counted themselves.
+# @param protocol [in] The validated Protocol
+# @param path [in] The path of the pcap or pcapng capture
+# @param ports [in] The UDP and TCP ports to decode (default is those registered by the protocol, or any port)
+# @param offset [in] A fixed offset of the payload in the captured bytes, which skips the parsing
+# @param batch [in] The number of records of a section decoded at a time
+# @return OrderedDict The report of each section, by abbreviation
+# @throws CaptureError When the capture cannot be read
+# @throws ImportError When numpy is not installed
+def captureStats(protocol, path, ports=None, offset=None, batch=4096):
+   entries   = portEntries(protocol)
+   ports     = set(ports) if ports else set(port for transport, port in entries)
+   collector = field_stats.Collector(protocol, batch)
+   with _mapped(path) as mapped:
+      counts = _collect(protocol, mapped, collector, entries, ports, offset)
+   report = collector.report()
+   _logger.info("Collected {records} records from {packets} packets ({skipped} skipped, {short} short) of {bytes} bytes in {elapsed:.3f} s".format(**counts))
+   return report
+
+def _collect(protocol, mapped, collector, entries, ports, offset):
+   counts      = dict(packets=0, records=0, skipped=0, short=0, bytes=len(mapped))
+   classifiers = {}
+   start       = time.perf_counter()
+   for packet in packets(mapped):
+      counts['packets'] += 1
+      found = payload(packet, ports, offset)
+      if found is None:
+         counts['skipped'] += 1
+         continue
+      node     = _entry(entries, found, protocol)
+      classify = classifiers.get(node)
+      if classify is None:
+         classify = classifiers[node] = runtime.compileClassifier(protocol, None if node is protocol else node.abbreviation, offsets=True)
+      try:
+         abbreviation, at = classify(found.data)
+      except ValueError:
+         counts['short'] += 1
+         continue
+      added = True
+      if node is protocol and protocol.header is not None:
+         added = collector.add(protocol.header, found.data)
+      if abbreviation is not None:
+         added = collector.add(protocol.messages[abbreviation], found.data, at) and added
+      counts['records' if added else 'short'] += 1
+   counts['elapsed'] = time.perf_counter() - start
+   return counts
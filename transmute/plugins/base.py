@@ -6,8 +6,10 @@
 import logging
 import itertools
 import operator
+import os
 from   abc                     import ABCMeta, abstractmethod
-from   collections             import OrderedDict
+from   argparse                import ArgumentTypeError
+from   collections             import OrderedDict, namedtuple
 from   ..Parsing.Parsable      import Parsable
 from   ..Parsing.Parser        import Parser, ParseError, ValidationError
 from   ..Dispatch.Dispatchable import Dispatchable
@@ -18,7 +20,9 @@ __all__  = ["register", "dispatch", "Protocol",  "Description",
             "Brief",    "Detail",   "Values",    "Value",
             "Message",  "Field",    "Position",  "Bits",
             "Chunks",   "Weight",                "Constants",
-            "Header",   "Trailer",  "Version"
+            "Header",   "Trailer",  "Version",
+            "FieldLayout", "fieldLayout", "sectionSize", "fieldValues",
+            "force_folder", "folder_type"
            ]
 
 ##
@@ -33,6 +37,36 @@ _prefix = ''
 # @brief A monotonically increasing counter to ensure anonymous Values types have a unique identifier
 _anon_counter = itertools.count(0,1)
 
+##
+# @name force_folder
+# @brief Ensure a directory exists
+# @param path [in] The folder to check or create
+# @return str path
+# @throws ValueError When path already exists and is not a directory or when it cannot be created
+def force_folder(path):
+   if os.path.isdir(path):
+      return path
+   elif os.path.exists(path):
+      raise ValueError("'{}' already exists and is not a directory.".format(path))
+   else:
+      try:
+         os.mkdir(path)
+      except OSError as ose:
+         raise ValueError("Cannot create directory '{}'".format(path))
+   return path
+
+##
+# @name folder_type
+# @brief An argparse type for directories
+# @param path [in] The specified folder
+# @return str path
+# @throws ArgumentTypeError When path is not valid
+def folder_type(path):
+   try:
+      return force_folder(path)
+   except ValueError as ve:
+      raise ArgumentTypeError(ve)
+
 ##
 # @name Constants
 # @brief A collection of constant values used throughout the application.
@@ -253,9 +287,10 @@ class Description(Parsable, Dispatchable):
 # @name Value
 # @brief A single integral value
 # @details XML tag: value
-#          Attributes: name, int
+#          Attributes: name, int, last
 #             name (required) - The name of the value
 #             int (required) - The integral value that maps to the given name
+#             last (optional) - The last integral value that maps to the given name, for a range of values
 #          CData: none
 #          Children: none
 class Value(Parsable, Dispatchable):
@@ -264,17 +299,21 @@ class Value(Parsable, Dispatchable):
       self.log   = logging.getLogger('transmute.base.Value')
       self._name = None
       self._ival = None
+      self._last = None
       
    def tag():
       return ':'.join([_prefix, 'value']).lstrip(':')
    
    def Start(self, attrs, evt_stream, node, parser):
+      self._last = None
       super().Start(attrs, evt_stream, node, parser)
       try:
          self.name = attrs['name']
          self.ival = attrs['int']
       except KeyError as ke:
          raise ParseError("<{}> missing {}".format(self.getTag(), ke))
+      if 'last' in attrs.keys():
+         self.last = attrs['last']
       
       return False
    
@@ -292,6 +331,8 @@ class Value(Parsable, Dispatchable):
          raise ValidationError("<{}> missing name attribute".format(self.getTag()))
       if self._ival is None:
          raise ValidationError("<{}> missing int attribute".format(self.getTag()))
+      if self._last is not None and int(self._last, 0) < int(self._ival, 0):
+         raise ValidationError("<{}> last attribute is less than its int attribute".format(self.getTag()))
       super().Validate(parent)
    
    @property
@@ -314,6 +355,19 @@ class Value(Parsable, Dispatchable):
          raise ParseError("<{}> invalid int attribute".format(self.getTag()))
       else:
          self._ival = data
+   
+   @property
+   def last(self):
+      return self._last if self._last is not None else self._ival
+   
+   @last.setter
+   def last(self, data):
+      try:
+         int(data, 0)
+      except ValueError:
+         raise ParseError("<{}> invalid last attribute".format(self.getTag()))
+      else:
+         self._last = data
 
 ##
 # @name Values
@@ -329,6 +383,7 @@ class Values(Parsable, Dispatchable):
       self.log     = logging.getLogger('transmute.base.Values')
       self._name   = None
       self._values = OrderedDict()
+      self.anonymous = True
       
    def tag():
       return ':'.join([_prefix, 'values']).lstrip(':')
@@ -336,16 +391,18 @@ class Values(Parsable, Dispatchable):
    def Start(self, attrs, evt_stream, node, parser):
       self._name   = None
       self._values = OrderedDict()
+      self.anonymous = True
       super().Start(attrs, evt_stream, node, parser)
       try:
          self._name = attrs['name']
+         self.anonymous = False
       except KeyError:
          pass #we allow anonymous values when they have <value> children
       
       return False
    
    def End(self):
-      if self.name is None and len(self._values) == 0:
+      if self._name is None and len(self._values) == 0:
          raise ParseError("<{}> with no name and no <{}> children".format(self.getTag(), Value.tag()))
    
    def Cdata(self, data):
@@ -357,7 +414,8 @@ class Values(Parsable, Dispatchable):
          self._values[child.name] = child
    
    def Validate(self, parent):
-      if   self.name and len(self._values) == 0:
+      #anonymous values are only named when they are used, after any interning
+      if   self._name and len(self._values) == 0:
          valid = False
          current = parent.parent if parent is not None else None
          #skip over the immediate parent (which obviously contains this node)
@@ -629,6 +687,13 @@ class Position(Parsable, Dispatchable):
    def chunklength(self):
       return self._chunks.length if self._chunks is not None else (self.bitlength // self.chunksize + (1 if self.bitlength % self.chunksize else 0))
    
+   @property
+   def chunkextent(self):
+      if self._chunks is not None:
+         return self._chunks.length
+      #a mask given explicitly may reach into the following chunks
+      return max(self.chunklength, -(-self.bitmask.bit_length() // self.chunksize))
+   
    @property
    def bitoffset(self):
       return self.index * self.chunksize + (self.bitstart if self.bit0 is Constants.bit0['LSb'] else self.chunksize - self.bitstart)
@@ -644,8 +709,8 @@ class Position(Parsable, Dispatchable):
       nck  = Chunks()
       npos._chunksize = self.chunksize
       npos.index = min(self.index, other.index)
-      terminus = max(self.index  + (self.bitlength  // self.chunksize),
-                     other.index + (other.bitlength // other.chunksize)
+      terminus = max(self.index  + self.chunkextent,
+                     other.index + other.chunkextent
                     )
       nck.length = max(1, terminus - npos.index)
       npos.Child(nck)
@@ -782,7 +847,7 @@ class Field(Parsable, Dispatchable):
                self._field._values = child
       def Validate(self, parent):
          super().Validate(parent)
-         if self._field._values.name is not None and len(self._field._values) == 0:
+         if not self._field._values.anonymous and len(self._field._values) == 0:
             self._field._values.Validate(parent)
    class WeightedFTypeHandler(SignableGenericFTypeHandler):
       def __init__(self, typename, fld):
@@ -1308,6 +1373,7 @@ class Protocol(Parsable, Dispatchable):
       if any(map(lambda combo: self.messages[combo[0]].abbreviation == self.messages[combo[1]].abbreviation, itertools.combinations(self.messages.keys(), 2))):
          raise ValidationError("<{}> '{}' has repeated {} abbreviations".format(self.getTag(), self.description.name, Message.tag()))
       self.log.info("Validation complete for {} '{}'".format(self.getTag(), self.name))
+      internFields(self)
    
    @property
    def name(self):
@@ -1369,6 +1435,142 @@ class Protocol(Parsable, Dispatchable):
    def version(self):
       return self._version
 
+##
+# @name internFields
+# @brief Shares structurally identical field parts between the fields of a protocol.
+# @details Anonymous <values> sets with the same values, weights with the same scale and
+#          positions with the same shape and encoding are replaced, in each field and in its
+#          children, by the first of their kind. Named <values> sets are distinct types and are
+#          left alone. This runs once the protocol is validated, since positions are keyed on
+#          the chunk size, endianness and bit numbering they inherit.
+# @param protocol [in] The validated Protocol
+# @return dict The number of uses and of distinct objects, keyed by element tag
+def internFields(protocol):
+   def values_key(v):
+      if v.anonymous and len(v):
+         return tuple((k, x.ival, x.last) for k,x in v.values.items())
+   def weight_key(w):
+      return (w.lsb, w.offset)
+   def position_key(p):
+      return (p.index, p.chunksize, p.endian, p.bit0, p.bitlength, p.bitstart, p.bitmask, p.chunklength)
+   
+   shapes = [('_values', Values.tag(), values_key), ('_weight', Weight.tag(), weight_key), ('position', Position.tag(), position_key)]
+   interned = dict((tag, {}) for attr, tag, key in shapes)
+   uses     = dict((tag, 0)  for attr, tag, key in shapes)
+   sections = [protocol.header, protocol.trailer]
+   for m in protocol.messages.values():
+      sections.extend([m, m.header, m.trailer])
+   for section in (s for s in sections if s is not None):
+      for f in section.fields.values():
+         for attr, tag, key in shapes:
+            part = getattr(f, attr)
+            if part is None or key(part) is None:
+               continue
+            uses[tag] += 1
+            shared = interned[tag].setdefault(key(part), part)
+            if shared is not part:
+               setattr(f, attr, shared)
+               f.children = [shared if c is part else c for c in f.children]
+   report = {}
+   for attr, tag, key in shapes:
+      report[tag] = (uses[tag], len(interned[tag]))
+      if uses[tag]:
+         _logger.info("Interned <{}>: {} uses share {} objects ({:.2f}:1)".format(tag, uses[tag], len(interned[tag]), uses[tag] / len(interned[tag])))
+   return report
+
+##
+# @brief How the value of a field is read from the buffer of its message, header or trailer.
+# @details kind is one of undecoded, bool, enum, int, weighted, float, double. byteoffset and
+#          bytelength give the bytes read, and endian their order. mask selects the field's bits
+#          from the unsigned integer read, and shift and bits give their position and count. full is
+#          True when the field uses every bit read, signed when the bits are two's complement. lsb
+#          and offset scale weighted fields, and are None for the other kinds.
+FieldLayout = namedtuple('FieldLayout', ['kind', 'byteoffset', 'bytelength', 'endian', 'mask', 'shift', 'bits', 'full', 'signed', 'lsb', 'offset'])
+
+##
+# @brief The FieldLayout kind of each field type
+_layout_kinds = {'undecoded'         : 'undecoded',
+                 'bool'              : 'bool',
+                 'boolean'           : 'bool',
+                 'enum'              : 'enum',
+                 'enumeration'       : 'enum',
+                 'weighted'          : 'weighted',
+                 'unsigned weighted' : 'weighted',
+                 'float'             : 'float',
+                 'double'            : 'double',
+                 'int'               : 'int',
+                 'integer'           : 'int',
+                 'unsigned int'      : 'int',
+                 'unsigned integer'  : 'int'
+                }
+
+##
+# @name fieldLayout
+# @brief Describes how a validated field is read from a buffer.
+# @details The field's chunks are read as one unsigned integer in the field's byte order, so
+#          <bits> masks apply to the chunk holding them whatever the chunk size, endianness or
+#          bit numbering. Floats are read from 4 bytes and doubles from 8. Integers wider than
+#          64 bits are not supported.
+# @param field [in] The validated Field
+# @return FieldLayout The layout
+# @throws ValidationError When the field cannot be read as its type
+def fieldLayout(field):
+   position   = field.position
+   chunkbytes = position.chunksize // 8
+   kind       = _layout_kinds[field.ftype]
+   mask       = position.bitmask
+   bytelength = position.chunkextent * chunkbytes
+   shift      = (mask & -mask).bit_length() - 1 if mask else 0
+   if   kind == 'float' and bytelength != 4:
+      raise ValidationError("<{}> {} is a float of {} bytes. Floats are 4 bytes".format(field.getTag(), field.abbreviation, bytelength))
+   elif kind == 'double' and bytelength != 8:
+      raise ValidationError("<{}> {} is a double of {} bytes. Doubles are 8 bytes".format(field.getTag(), field.abbreviation, bytelength))
+   elif kind != 'undecoded' and bytelength > 8:
+      raise ValidationError("<{}> {} is {} bytes wide. Fields are at most 8 bytes".format(field.getTag(), field.abbreviation, bytelength))
+   return FieldLayout(kind       = kind,
+                      byteoffset = position.index * chunkbytes,
+                      bytelength = bytelength,
+                      endian     = field.endian,
+                      mask       = mask,
+                      shift      = shift,
+                      bits       = (mask >> shift).bit_length(),
+                      full       = mask == (1 << (bytelength * 8)) - 1,
+                      signed     = kind in ('int', 'weighted') and 'unsigned' not in field.ftype,
+                      lsb        = field.weight.lsb    if kind == 'weighted' else None,
+                      offset     = field.weight.offset if kind == 'weighted' else None)
+
+##
+# @name sectionSize
+# @brief Returns the number of bytes a section's fields are read from
+# @details The extent of every field's layout counts, so a section ending in part of a chunk
+#          covers the whole chunk. Messages include their header and trailer.
+# @param section [in] The validated message, header or trailer
+# @return int The number of bytes
+def sectionSize(section):
+   sizes = [layout.byteoffset + layout.bytelength for layout in (fieldLayout(f) for f in section.fields.values())]
+   for part in (getattr(section, 'header', None), getattr(section, 'trailer', None)):
+      if part is not None:
+         sizes.append(sectionSize(part))
+   return max(sizes) if sizes else 0
+
+##
+# @name fieldValues
+# @brief Returns the <values> that define an enumerated field's values
+# @details A named reference is resolved against the <values> of the field's ancestors.
+# @param field [in] The validated enumerated Field
+# @return Values The defining Values
+# @throws ValidationError When the reference has no definition
+def fieldValues(field):
+   if len(field.values):
+      return field.values
+   current = field.parent
+   while current is not None:
+      defined = getattr(current, 'values', None)
+      if isinstance(defined, dict) and field.values.name in defined and len(defined[field.values.name]):
+         return defined[field.values.name]
+      current = current.parent
+   raise ValidationError("No definition of <{} name=\"{}\">".format(Values.tag(), field.values.name))
+
 def register(args_parser, xml_parser):
    for parsable in [Protocol,
                     Version,
@@ -1386,7 +1588,7 @@ def register(args_parser, xml_parser):
                    ]:
       xml_parser.registerParsable(parsable)
 
-def dispatch(dispatchable_obj):
+def dispatch(dispatchable_obj, sink):
    pass
 
 def setFType(xml_names, ftype_handler):
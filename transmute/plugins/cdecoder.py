@@ -0,0 +1,544 @@
+##
+# @file transmute/plugins/cdecoder.py
+# @brief Contains the standalone C decoder generation code.
+# @ingroup plugins
+#
+
+import logging
+import os
+import re
+from   collections             import OrderedDict
+from   ..                      import version_string as transmute_version
+from   .base                   import *
+from   ..Dispatch.Dispatchable import DispatchError
+from   ..Output.Template       import Template
+
+##
+# @brief The module version number.
+version = (0, 0, '1a')
+
+##
+# @brief The module version number as a formatted string
+version_string = '.'.join(str(v) for v in version)
+
+##
+# @brief All of the items exported by this module
+__all__  = ["register", "dispatch"]
+
+##
+# @brief The module's top-level logger
+_logger  = logging.getLogger('transmute.cdecoder')
+
+##
+# @brief The parsed command line arguments
+args_ns = None
+
+def register(args_parser, xml_parser):
+   global args_ns
+   args_group = args_parser.add_argument_group(title='c decoder', description='These arguments control the C decoder output.')
+   args_group.add_argument('-c', '--c-decoder', action='store_true', default=False,                                   dest='c_decoder', help="Enable C decoder output.")
+   args_group.add_argument(      '--c-out',                          default=os.curdir, type=folder_type, dest='c_path',    help="Change the C decoder output folder (default is the current working directory).")
+   args_ns,argv = args_parser.parse_known_args()
+
+##
+# @brief The indentation used in generated C code.
+_c_indent = "   "
+
+##
+# @brief The templates used to construct C decoder output.
+# @details Each template is compiled once, when the plugin is loaded. The indentation and
+#          the version banners are folded into the templates at that time.
+_c_templates = dict((name, Template(text, indent=_c_indent, transmute_version=transmute_version, plugin_version=version_string)) for name,text in {
+             'header_comment'    : "/*\n * File: {filename}\n * Description: {description}\n * Generated using transmute {transmute_version} C decoder plugin {plugin_version}\n */\n",
+             'include_guard'     : "#ifndef {guard}\n#define {guard}\n\n",
+             'include_guard_end' : "\n#endif /* {guard} */\n",
+             'include'           : "#include {name}\n",
+             'read_fxn'          : "static inline {ctype} transmute_{order}{bits}(const uint8_t *p)\n{{\n{indent}return {expr};\n}}\n\n",
+             'runtime_helpers'   : '\n'.join(['/* Returns the bits of chunk selected by mask, shifted down to bit 0 */',
+                                              'static inline uint32_t transmute_bits32(uint32_t chunk, uint32_t mask, unsigned shift)',
+                                              '{{',
+                                              '{indent}return (chunk & mask) >> shift;',
+                                              '}}',
+                                              '',
+                                              'static inline uint64_t transmute_bits64(uint64_t chunk, uint64_t mask, unsigned shift)',
+                                              '{{',
+                                              '{indent}return (chunk & mask) >> shift;',
+                                              '}}',
+                                              '',
+                                              '/* Sign extends the two\'s complement value held in the low bits of value */',
+                                              'static inline int32_t transmute_sign32(uint32_t value, unsigned bits)',
+                                              '{{',
+                                              '{indent}return (int32_t)(value << (32 - bits)) >> (32 - bits);',
+                                              '}}',
+                                              '',
+                                              'static inline int64_t transmute_sign64(uint64_t value, unsigned bits)',
+                                              '{{',
+                                              '{indent}return (int64_t)(value << (64 - bits)) >> (64 - bits);',
+                                              '}}',
+                                              '',
+                                              '/* Converts a fixed-point value with the given least significant bit and offset */',
+                                              'static inline double transmute_scale(double value, double lsb, double offset)',
+                                              '{{',
+                                              '{indent}return value * lsb + offset;',
+                                              '}}',
+                                              '',
+                                              '/* Reinterprets the bits of an IEEE 754 value */',
+                                              'static inline float transmute_float(uint32_t bits)',
+                                              '{{',
+                                              '{indent}float value;',
+                                              '{indent}memcpy(&value, &bits, sizeof(value));',
+                                              '{indent}return value;',
+                                              '}}',
+                                              '',
+                                              'static inline double transmute_double(uint64_t bits)',
+                                              '{{',
+                                              '{indent}double value;',
+                                              '{indent}memcpy(&value, &bits, sizeof(value));',
+                                              '{indent}return value;',
+                                              '}}',
+                                              ''
+                                             ]),
+             'enum_open'         : "enum {name} {{\n",
+             'enum_value'        : "{indent}{name} = {value}",
+             'enum_close'        : "\n}};\n\n",
+             'struct_open'       : "struct {name} {{\n",
+             'struct_member'     : "{indent}{ctype}{space}{name}; /* {comment} */\n",
+             'struct_close'      : "}};\n\n",
+             'size_define'       : "#define {macro} {size}\n",
+             'decode_fxn_proto'  : "int decode_{name}(const uint8_t *buf, size_t len, struct {name} *out);\n",
+             'read_fxn_decl'     : "static void read_{name}(const uint8_t *restrict buf, struct {name} *restrict out)\n{{\n",
+             'read_call'         : "{indent}read_{name}(buf, &out->{member});\n",
+             'field_assign'      : "{indent}out->{member} = {value};\n",
+             'field_read'        : "transmute_{order}{bits}(buf + {byteoffset})",
+             'field_byte'        : "buf[{byteoffset}]",
+             'field_bits'        : "transmute_bits{width}({source}, {mask}, {shift})",
+             'field_sign'        : "transmute_sign{width}({value}, {bits})",
+             'field_scale'       : "transmute_scale({value}, {lsb}, {offset})",
+             'field_bool'        : "({value}) != 0",
+             'field_real'        : "transmute_{kind}({value})",
+             'field_bytes'       : "buf + {byteoffset}",
+             'decode_fxn_decl'   : "int decode_{name}(const uint8_t *buf, size_t len, struct {name} *out)\n{{\n",
+             'decode_fxn_body'   : "{indent}if(len < {macro})\n{indent}{{\n{indent}{indent}return -1;\n{indent}}}\n{indent}read_{name}(buf, out);\n{indent}return 0;\n",
+             'fxn_end'           : "}}\n\n",
+             'bench_globals'     : '\n'.join(['/* The number of distinct buffers each message is decoded from */',
+                                              '#define BENCH_BUFFERS 256',
+                                              '',
+                                              'static uint8_t buffers[BENCH_BUFFERS][{size}];',
+                                              '',
+                                              '/* Fills the buffers with pseudo-random bytes (xorshift32) */',
+                                              'static void bench_fill(void)',
+                                              '{{',
+                                              '{indent}uint32_t state = 2463534242u;',
+                                              '{indent}size_t   i;',
+                                              '{indent}size_t   j;',
+                                              '{indent}for(i = 0; i < BENCH_BUFFERS; i++)',
+                                              '{indent}{{',
+                                              '{indent}{indent}for(j = 0; j < sizeof(buffers[i]); j++)',
+                                              '{indent}{indent}{{',
+                                              '{indent}{indent}{indent}state ^= state << 13;',
+                                              '{indent}{indent}{indent}state ^= state >> 17;',
+                                              '{indent}{indent}{indent}state ^= state << 5;',
+                                              '{indent}{indent}{indent}buffers[i][j] = (uint8_t)state;',
+                                              '{indent}{indent}}}',
+                                              '{indent}}}',
+                                              '}}',
+                                              '',
+                                              '/* Prints the rate of one message type, and returns the time it took */',
+                                              'static double bench_report(const char *name, long iterations, long failures, clock_t start)',
+                                              '{{',
+                                              '{indent}double elapsed = (double)(clock() - start) / CLOCKS_PER_SEC;',
+                                              '{indent}if(elapsed <= 0)',
+                                              '{indent}{{',
+                                              '{indent}{indent}elapsed = 1.0 / CLOCKS_PER_SEC;',
+                                              '{indent}}}',
+                                              '{indent}printf("%-32s %14.0f messages/s%s\\n", name, iterations / elapsed, failures ? " (short buffers)" : "");',
+                                              '{indent}return elapsed;',
+                                              '}}',
+                                              '',
+                                              ''
+                                             ]),
+             'bench_fxn'         : '\n'.join(['static double bench_{name}(long iterations)',
+                                              '{{',
+                                              '{indent}struct {name} msg;',
+                                              '{indent}long failures = 0;',
+                                              '{indent}long i;',
+                                              '{indent}clock_t start = clock();',
+                                              '{indent}for(i = 0; i < iterations; i++)',
+                                              '{indent}{{',
+                                              '{indent}{indent}failures -= decode_{name}(buffers[i % BENCH_BUFFERS], {macro}, &msg);',
+                                              '{indent}}}',
+                                              '{indent}return bench_report("{abbreviation}", iterations, failures, start);',
+                                              '}}',
+                                              '',
+                                              ''
+                                             ]),
+             'bench_main_open'   : '\n'.join(['int main(int argc, char **argv)',
+                                              '{{',
+                                              '{indent}long   iterations = argc > 1 ? atol(argv[1]) : 1000000L;',
+                                              '{indent}double elapsed    = 0;',
+                                              '{indent}if(iterations <= 0)',
+                                              '{indent}{{',
+                                              '{indent}{indent}fprintf(stderr, "usage: %s [iterations]\\n", argv[0]);',
+                                              '{indent}{indent}return 2;',
+                                              '{indent}}}',
+                                              '{indent}bench_fill();',
+                                              '{indent}printf("{protocol}: %ld decodes of each of {count} message types\\n", iterations);',
+                                              ''
+                                             ]),
+             'bench_call'        : "{indent}elapsed += bench_{name}(iterations);\n",
+             'bench_main_close'  : '\n'.join(['{indent}if(elapsed > 0)',
+                                              '{indent}{{',
+                                              '{indent}{indent}printf("%-32s %14.0f messages/s\\n", "all", {count} * (double)iterations / elapsed);',
+                                              '{indent}}}',
+                                              '{indent}return 0;',
+                                              '}}',
+                                              ''
+                                             ]),
+           }.items())
+
+##
+# @brief The C keywords, which are renamed when a field abbreviation produces one
+_c_keywords = frozenset(['auto', 'bool', 'break', 'case', 'char', 'const', 'continue', 'default', 'do', 'double', 'else',
+                         'enum', 'extern', 'float', 'for', 'goto', 'if', 'inline', 'int', 'long', 'register', 'restrict',
+                         'return', 'short', 'signed', 'sizeof', 'static', 'struct', 'switch', 'typedef', 'union',
+                         'unsigned', 'void', 'volatile', 'while'])
+
+##
+# @name c_name
+# @brief Translates an abbreviation string to a C identifier.
+# @details Every character that cannot appear in an identifier becomes an underscore.
+# @param abbreviation [in] The abbreviation string.
+# @return str The identifier
+def c_name(abbreviation):
+   name = re.sub('[^0-9A-Za-z_]', '_', abbreviation)
+   return ''.join([name, '_']) if name in _c_keywords else name
+
+##
+# @name c_enum_name
+# @brief Returns the tag of the C enumeration of a <values>
+# @details Enumerations are prefixed with their protocol, as anonymous ones are numbered across protocols.
+# @param dispatchable_obj [in] The protocol
+# @param values [in] The defining Values
+# @return str The enumeration tag
+def c_enum_name(dispatchable_obj, values):
+   return c_name('_'.join([dispatchable_obj.abbreviation, values.name]))
+
+##
+# @name c_enumerator
+# @brief Returns the C name of one value of an enumeration
+# @details Values are prefixed with their enumeration, as names such as OFF or ON are reused by
+#          several enumerations and enumerators share a single scope.
+# @param enum [in] The enumeration tag
+# @param name [in] The value name
+# @return str The enumerator
+def c_enumerator(enum, name):
+   return c_name('_'.join([enum, name])).upper()
+
+##
+# @name c_size_macro
+# @brief Returns the name of the macro holding the number of bytes a section's decoder reads
+# @param section [in] The message, header or trailer
+# @return str The macro name
+def c_size_macro(section):
+   return '{}_SIZE'.format(c_name(section.abbreviation).upper())
+
+##
+# @name c_members
+# @brief Names the struct members of a section's fields
+# @details Members are named after the part of the field abbreviation that follows the section
+#          abbreviation, or after the whole abbreviation when those parts are not distinct.
+# @param section [in] The message, header or trailer
+# @return OrderedDict The member name of each field, keyed by field abbreviation
+def c_members(section):
+   prefix  = ''.join([section.abbreviation, '.'])
+   members = OrderedDict((a, c_name(a[len(prefix):] if a.startswith(prefix) else a)) for a in section.fields)
+   if len(set(members.values())) != len(members) or any(m in ('header', 'trailer') for m in members.values()):
+      members = OrderedDict((a, c_name(a)) for a in section.fields)
+   return members
+
+##
+# @name c_sections
+# @brief Lists the sections of a protocol that get a struct and a decode_ function
+# @details Headers and trailers come before the messages holding them.
+# @param dispatchable_obj [in] The protocol
+# @return list The headers, trailers and messages
+def c_sections(dispatchable_obj):
+   sections = [s for s in (dispatchable_obj.header, dispatchable_obj.trailer) if s is not None]
+   for m in dispatchable_obj.messages.values():
+      sections.extend(s for s in (m.header, m.trailer) if s is not None)
+      sections.append(m)
+   return sections
+
+##
+# @name c_section_size
+# @brief Returns the number of bytes a section's decoder reads
+# @param section [in] The message, header or trailer
+# @return int The number of bytes
+def c_section_size(section):
+   return sectionSize(section)
+
+##
+# @name c_int_width
+# @brief Returns the width of the C integer type holding a number of bits
+# @param bits [in] The number of bits
+# @return int One of 8, 16, 32, 64
+def c_int_width(bits):
+   for width in (8, 16, 32):
+      if bits <= width:
+         return width
+   return 64
+
+##
+# @name c_member_type
+# @brief Returns the C type of a field's struct member
+# @param layout [in] The FieldLayout of the field
+# @return str The C type
+def c_member_type(layout):
+   if   layout.kind == 'undecoded':
+      return 'const uint8_t *'
+   elif layout.kind == 'bool':
+      return 'bool'
+   elif layout.kind in ('weighted', 'double'):
+      return 'double'
+   elif layout.kind == 'float':
+      return 'float'
+   return '{}int{}_t'.format('' if layout.signed else 'u', c_int_width(layout.bits))
+
+##
+# @name c_member_comment
+# @brief Describes a field in the comment of its struct member
+# @param dispatchable_obj [in] The protocol
+# @param f [in] The field
+# @param layout [in] The FieldLayout of the field
+# @return str The comment text
+def c_member_comment(dispatchable_obj, f, layout):
+   if   layout.kind == 'undecoded':
+      return '{} bytes at offset {}, undecoded'.format(layout.bytelength, layout.byteoffset)
+   elif layout.kind == 'enum':
+      return 'enum {}'.format(c_enum_name(dispatchable_obj, fieldValues(f)))
+   elif layout.kind == 'weighted':
+      return 'scaled by {} with offset {}'.format(c_float(layout.lsb), c_float(layout.offset))
+   return str(f.description.brief).replace('*/', '* /')
+
+##
+# @name c_float
+# @brief Formats a float as a C double literal
+# @param f [in] The value
+# @return str The literal
+def c_float(f):
+   rv = '{:.18F}'.format(f).rstrip('0')
+   if rv.endswith('.'):
+      rv = ''.join([rv,'0'])
+   return rv
+
+##
+# @name c_field_value
+# @brief Renders the expression decoding a field from buf
+# @details The field's bytes are read as one unsigned integer in its byte order, then masked,
+#          sign extended and scaled by the helpers in transmute_c_runtime.h.
+# @param layout [in] The FieldLayout of the field
+# @return str The expression
+def c_field_value(layout):
+   T = _c_templates
+   if layout.kind == 'undecoded':
+      return T['field_bytes'](byteoffset=layout.byteoffset)
+   width = 64 if layout.bytelength > 4 else 32
+   if layout.bytelength == 1:
+      value = T['field_byte'](byteoffset=layout.byteoffset)
+   else:
+      value = T['field_read'](order='be' if layout.endian == Constants.endian['big'] else 'le', bits=layout.bytelength * 8, byteoffset=layout.byteoffset)
+   if layout.kind in ('float', 'double'):
+      return T['field_real'](kind=layout.kind, value=value)
+   #a field that fills the bytes it is read from needs no extraction
+   if not layout.full:
+      value = T['field_bits'](width=width, source=value, mask=c_mask(layout.mask, width), shift=layout.shift)
+   if layout.signed:
+      value = T['field_sign'](width=width, value=value, bits=layout.bits)
+   if layout.kind == 'weighted':
+      value = T['field_scale'](value=value, lsb=c_float(layout.lsb), offset=c_float(layout.offset))
+   elif layout.kind == 'bool':
+      value = T['field_bool'](value=value)
+   return value
+
+##
+# @name c_mask
+# @brief Formats a mask as an unsigned C literal
+# @param mask [in] The mask
+# @param width [in] The width of the integer it applies to
+# @return str The literal
+def c_mask(mask, width):
+   return '{}{}'.format(hex(mask), 'u' if width <= 32 else 'ull')
+
+##
+# @name c_read_helpers
+# @brief Renders the functions reading big and little endian integers of 2 to 8 bytes
+# @return str The functions
+def c_read_helpers():
+   T     = _c_templates
+   rendered = []
+   for size in range(2, 9):
+      ctype = 'uint32_t' if size <= 4 else 'uint64_t'
+      for order, indices in (('be', range(size)), ('le', reversed(range(size)))):
+         terms = ['({})p[{}] << {}'.format(ctype, i, 8 * (size - 1 - n)) for n, i in enumerate(indices)]
+         terms[-1] = terms[-1].replace(' << 0', '')
+         rendered.append(T['read_fxn'](ctype=ctype, order=order, bits=size * 8, expr=' | '.join(terms)))
+   return ''.join(rendered)
+
+def c_include_guard(file_obj):
+   return '{}_'.format(os.path.basename(file_obj.name).upper().replace('-','_').replace('.','_'))
+
+##
+# @name write_runtime_header
+# @brief Writes the header of helper functions called by the generated decoders.
+# @param folder [in] The output folder
+# @param sink [in] The output sink
+def write_runtime_header(folder, sink):
+   T = _c_templates
+   with sink.open(os.path.join(folder, 'transmute_c_runtime.h')) as hfile:
+      hfile.write(T['header_comment'](filename=hfile.name, description="Helper functions shared by transmute generated decoders"))
+      hfile.write(T['include_guard'](guard=c_include_guard(hfile)))
+      for name in ('<stdint.h>', '<string.h>'):
+         hfile.write(T['include'](name=name))
+      hfile.write('\n/* Reads an unsigned integer from big (be) or little (le) endian bytes */\n')
+      hfile.write(c_read_helpers())
+      hfile.write(T['runtime_helpers']())
+      hfile.write(T['include_guard_end'](guard=c_include_guard(hfile)))
+
+##
+# @name write_decoder_header
+# @brief Writes the enumerations, structs and decode_ prototypes of a protocol.
+# @param folder [in] The output folder
+# @param dispatchable_obj [in] The protocol
+# @param sink [in] The output sink
+# @param sections [in] The sections of the protocol
+def write_decoder_header(folder, dispatchable_obj, sink, sections):
+   T = _c_templates
+   with sink.open(os.path.join(folder, '{}_decoder.h'.format(dispatchable_obj.abbreviation))) as hfile:
+      hfile.write(T['header_comment'](filename=hfile.name, description="The decoder interface for the {} protocol".format(dispatchable_obj.name)))
+      hfile.write(T['include_guard'](guard=c_include_guard(hfile)))
+      for name in ('<stdbool.h>', '<stddef.h>', '<stdint.h>'):
+         hfile.write(T['include'](name=name))
+      hfile.write('\n/* Enumerations */\n')
+      #interned anonymous values are shared by several fields
+      enums = OrderedDict()
+      for section in sections:
+         for f in section.fields.values():
+            if fieldLayout(f).kind == 'enum':
+               values = fieldValues(f)
+               enums.setdefault(c_enum_name(dispatchable_obj, values), values)
+      for name, values in enums.items():
+         hfile.write(T['enum_open'](name=name))
+         hfile.write(',\n'.join(T['enum_value'](name=c_enumerator(name, v), value=values.values[v].ival) for v in values.values))
+         hfile.write(T['enum_close']())
+      hfile.write('/* Decoded Sections */\n')
+      for section in sections:
+         hfile.write(T['struct_open'](name=c_name(section.abbreviation)))
+         if getattr(section, 'header', None) is not None:
+            hfile.write(T['struct_member'](ctype='struct {}'.format(c_name(section.header.abbreviation)), space=' ', name='header', comment=str(section.header.description.brief)))
+         members = c_members(section)
+         for f in section.fields.values():
+            layout = fieldLayout(f)
+            ctype  = c_member_type(layout)
+            hfile.write(T['struct_member'](ctype=ctype, space='' if ctype.endswith('*') else ' ', name=members[f.abbreviation], comment=c_member_comment(dispatchable_obj, f, layout)))
+         if getattr(section, 'trailer', None) is not None:
+            hfile.write(T['struct_member'](ctype='struct {}'.format(c_name(section.trailer.abbreviation)), space=' ', name='trailer', comment=str(section.trailer.description.brief)))
+         if not section.fields and getattr(section, 'header', None) is None and getattr(section, 'trailer', None) is None:
+            #C99 has no empty structs
+            hfile.write(T['struct_member'](ctype='uint8_t', space=' ', name='unused', comment='no fields'))
+         hfile.write(T['struct_close']())
+      hfile.write('/* The number of bytes each decode_ function reads */\n')
+      for section in sections:
+         hfile.write(T['size_define'](macro=c_size_macro(section), size=c_section_size(section)))
+      hfile.write('\n/* decode_ Functions: return 0, or -1 when len is less than the section size.\n')
+      hfile.write('   Undecoded fields point into buf. Messages are decoded from the bytes that follow the protocol header. */\n')
+      for section in sections:
+         hfile.write(T['decode_fxn_proto'](name=c_name(section.abbreviation)))
+      hfile.write(T['include_guard_end'](guard=c_include_guard(hfile)))
+
+##
+# @name write_decoder_source
+# @brief Writes the decode_ functions of a protocol.
+# @details Each section is read by a static read_ function that does no bounds check, so that a
+#          message reads its header and trailer after checking its own size once.
+# @param folder [in] The output folder
+# @param dispatchable_obj [in] The protocol
+# @param sink [in] The output sink
+# @param sections [in] The sections of the protocol
+def write_decoder_source(folder, dispatchable_obj, sink, sections):
+   T = _c_templates
+   with sink.open(os.path.join(folder, '{}_decoder.c'.format(dispatchable_obj.abbreviation))) as cfile:
+      cfile.write(T['header_comment'](filename=cfile.name, description="The decoders for the {} protocol".format(dispatchable_obj.name)))
+      for name in ('"{}_decoder.h"'.format(dispatchable_obj.abbreviation), '"transmute_c_runtime.h"'):
+         cfile.write(T['include'](name=name))
+      cfile.write('\n')
+      for section in sections:
+         name = c_name(section.abbreviation)
+         cfile.write(T['read_fxn_decl'](name=name))
+         if getattr(section, 'header', None) is not None:
+            cfile.write(T['read_call'](name=c_name(section.header.abbreviation), member='header'))
+         members = c_members(section)
+         for f in section.fields.values():
+            cfile.write(T['field_assign'](member=members[f.abbreviation], value=c_field_value(fieldLayout(f))))
+         if getattr(section, 'trailer', None) is not None:
+            cfile.write(T['read_call'](name=c_name(section.trailer.abbreviation), member='trailer'))
+         if not section.fields and getattr(section, 'header', None) is None and getattr(section, 'trailer', None) is None:
+            cfile.write(T['field_assign'](member='unused', value='0'))
+         cfile.write(T['fxn_end']())
+         cfile.write(T['decode_fxn_decl'](name=name))
+         cfile.write(T['decode_fxn_body'](name=name, macro=c_size_macro(section)))
+         cfile.write(T['fxn_end']())
+
+##
+# @name write_benchmark
+# @brief Writes a benchmark main() that decodes pseudo-random buffers with each message decoder.
+# @param folder [in] The output folder
+# @param dispatchable_obj [in] The protocol
+# @param sink [in] The output sink
+def write_benchmark(folder, dispatchable_obj, sink):
+   T        = _c_templates
+   messages = list(dispatchable_obj.messages.values())
+   with sink.open(os.path.join(folder, '{}_bench.c'.format(dispatchable_obj.abbreviation))) as cfile:
+      cfile.write(T['header_comment'](filename=cfile.name, description="A decoding benchmark for the {} protocol".format(dispatchable_obj.name)))
+      for name in ('<stdio.h>', '<stdlib.h>', '<time.h>', '"{}_decoder.h"'.format(dispatchable_obj.abbreviation)):
+         cfile.write(T['include'](name=name))
+      cfile.write('\n')
+      cfile.write(T['bench_globals'](size=max([1] + [c_section_size(m) for m in messages])))
+      for m in messages:
+         cfile.write(T['bench_fxn'](name=c_name(m.abbreviation), macro=c_size_macro(m), abbreviation=m.abbreviation))
+      cfile.write(T['bench_main_open'](protocol=dispatchable_obj.name, count=len(messages)))
+      for m in messages:
+         cfile.write(T['bench_call'](name=c_name(m.abbreviation)))
+      cfile.write(T['bench_main_close'](count=len(messages)))
+
+def write_makefile(folder, dispatchable_obj, sink):
+   abbr = dispatchable_obj.abbreviation
+   with sink.open(os.path.join(folder, 'Makefile')) as mfile:
+      mfile.write('\n'.join(['# This file automatically generated using Transmute',
+                             'CC     ?= gcc',
+                             'CFLAGS ?= -std=c99 -O2 -Wall',
+                             '',
+                             '{0}_bench: {0}_bench.c {0}_decoder.c {0}_decoder.h transmute_c_runtime.h'.format(abbr),
+                             '\t$(CC) $(CFLAGS) -o $@ {0}_bench.c {0}_decoder.c'.format(abbr),
+                             '',
+                             'clean:',
+                             '\trm -f {}_bench'.format(abbr),
+                             '',
+                             '.PHONY: clean',
+                             '']
+                 ))
+
+def dispatch(dispatchable_obj, sink):
+   if args_ns.c_decoder and dispatchable_obj.getTag() == Protocol.tag():
+      _logger.debug('Beginning dispatch for {} protocol'.format(dispatchable_obj.name))
+      folder = os.path.join(args_ns.c_path, dispatchable_obj.abbreviation)
+      _logger.debug('C decoder output to {}'.format(folder))
+      sink.folder(folder)
+      sections = c_sections(dispatchable_obj)
+      names    = [c_name(s.abbreviation) for s in sections]
+      if len(set(names)) != len(names):
+         raise DispatchError("<{}> {} has sections whose abbreviations give the same C name".format(dispatchable_obj.getTag(), dispatchable_obj.name))
+      write_runtime_header(folder, sink)
+      write_decoder_header(folder, dispatchable_obj, sink, sections)
+      write_decoder_source(folder, dispatchable_obj, sink, sections)
+      write_benchmark(folder, dispatchable_obj, sink)
+      write_makefile(folder, dispatchable_obj, sink)
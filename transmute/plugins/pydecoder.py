@@ -0,0 +1,441 @@
+##
+# @file transmute/plugins/pydecoder.py
+# @brief Contains the Python decoder module generation code.
+# @ingroup plugins
+#
+
+import keyword
+import logging
+import os
+from   collections             import OrderedDict, namedtuple
+from   ..                      import version_string as transmute_version
+from   .base                   import *
+from   .cdecoder               import c_sections, c_section_size
+from   ..Dispatch.Dispatchable import DispatchError
+from   ..Output.Template       import Template
+
+##
+# @brief The module version number.
+version = (0, 0, '1a')
+
+##
+# @brief The module version number as a formatted string
+version_string = '.'.join(str(v) for v in version)
+
+##
+# @brief All of the items exported by this module
+__all__  = ["register", "dispatch"]
+
+##
+# @brief The module's top-level logger
+_logger  = logging.getLogger('transmute.pydecoder')
+
+##
+# @brief The parsed command line arguments
+args_ns = None
+
+def register(args_parser, xml_parser):
+   global args_ns
+   args_group = args_parser.add_argument_group(title='python decoder', description='These arguments control the Python decoder output.')
+   args_group.add_argument('-py', '--python',     action='store_true', default=False,                                   dest='python',      help="Enable Python decoder output.")
+   args_group.add_argument(       '--python-out',                      default=os.curdir, type=folder_type, dest='python_path', help="Change the Python decoder output folder (default is the current working directory).")
+   args_group.add_argument(       '--python-mode', default='eager', choices=['eager', 'lazy'],                        dest='python_mode', help="How the generated classes decode. eager decodes every field up front, lazy returns views that decode each field on first access (default is eager).")
+   args_ns,argv = args_parser.parse_known_args()
+
+##
+# @brief The indentation used in generated Python code.
+_py_indent = "   "
+
+##
+# @brief The templates used to construct Python decoder output.
+# @details Each template is compiled once, when the plugin is loaded. The indentation and
+#          the version banners are folded into the templates at that time.
+_py_templates = dict((name, Template(text, indent=_py_indent, transmute_version=transmute_version, plugin_version=version_string)) for name,text in {
+             'header_comment' : "#\n# File: {filename}\n# Description: {description}\n# Generated using transmute {transmute_version} python decoder plugin {plugin_version}\n#\n",
+             'module_head'    : '\n'.join(['import bisect',
+                                           'import struct',
+                                           '',
+                                           '_new = object.__new__',
+                                           '',
+                                           'class _Values(dict):',
+                                           '{indent}"""Maps the first value of each range of an enumeration to its name, and any value in a range to the name of the range"""',
+                                           "{indent}__slots__ = ('_starts', '_ranges')",
+                                           '',
+                                           '{indent}def __init__(self, ranges):',
+                                           '{indent}{indent}dict.__init__(self, ((first, name) for first, last, name in ranges))',
+                                           '{indent}{indent}self._ranges = sorted(ranges)',
+                                           '{indent}{indent}self._starts = [r[0] for r in self._ranges]',
+                                           '',
+                                           '{indent}def __missing__(self, value):',
+                                           '{indent}{indent}i = bisect.bisect_right(self._starts, value) - 1',
+                                           '{indent}{indent}if i >= 0 and value <= self._ranges[i][1]:',
+                                           '{indent}{indent}{indent}return self._ranges[i][2]',
+                                           '{indent}{indent}raise KeyError(value)',
+                                           '',
+                                           '{indent}def __contains__(self, value):',
+                                           '{indent}{indent}return self.get(value) is not None',
+                                           '',
+                                           '{indent}def get(self, value, default=None):',
+                                           '{indent}{indent}try:',
+                                           '{indent}{indent}{indent}return self[value]',
+                                           '{indent}{indent}except (KeyError, TypeError):',
+                                           '{indent}{indent}{indent}return default',
+                                           '',
+                                           'class _Section(object):',
+                                           '{indent}__slots__ = ()',
+                                           '',
+                                           '{indent}def __repr__(self):',
+                                           "{indent}{indent}return '{{}}({{}})'.format(type(self).__name__, ', '.join('{{}}={{!r}}'.format(n, getattr(self, n)) for n in self._fields))",
+                                           '',
+                                           '{indent}def __eq__(self, other):',
+                                           '{indent}{indent}return type(self) is type(other) and all(getattr(self, n) == getattr(other, n) for n in self._fields)',
+                                           '',
+                                           ''
+                                          ]),
+             'enum_dict'      : "{name} = _Values([{items}])\n",
+             'enum_item'      : "({ival}, {last}, {name!r})",
+             'reader'         : "_{name}_{group} = struct.Struct({format!r}).unpack_from\n",
+             'class_open'     : '\n'.join(['',
+                                           'class {name}(_Section):',
+                                           '{indent}"""{brief}"""',
+                                           '{indent}__slots__ = ({slots})',
+                                           '{indent}_fields   = __slots__',
+                                           '{indent}size      = {size}',
+                                           '{indent}enums     = {{{enums}}}',
+                                           '',
+                                           '{indent}@classmethod',
+                                           '{indent}def decode(cls, buf, offset=0):',
+                                           '{indent}{indent}if len(buf) - offset < {size}:',
+                                           "{indent}{indent}{indent}raise ValueError('{abbreviation} needs {size} bytes, got {{}}'.format(len(buf) - offset))",
+                                           '{indent}{indent}return cls._read({buf}, offset)',
+                                           '',
+                                           '{indent}@classmethod',
+                                           '{indent}def _read(cls, buf, offset):',
+                                           '{indent}{indent}self = _new(cls)',
+                                           ''
+                                          ]),
+             'read_group'     : "{indent}{indent}{refs}, = _{name}_{group}(buf, offset)\n",
+             'read_section'   : "{indent}{indent}self.{member} = {name}._read(buf, offset)\n",
+             'field_assign'   : "{indent}{indent}self.{member} = {value}\n",
+             'class_close'    : "{indent}{indent}return self\n\n",
+             'field_int'      : "int.from_bytes({ref}, {endian!r})",
+             'field_sint'     : "int.from_bytes({ref}, {endian!r}, signed=True)",
+             'field_shift'    : "({value} >> {shift})",
+             'field_mask'     : "({value} & {mask})",
+             'field_sign'     : "(({value} ^ {sign}) - {sign})",
+             'field_scale'    : "{value} * {lsb!r}",
+             'field_offset'   : "{value} + {offset!r}",
+             'field_bool'     : "{value} != 0",
+             'field_view'     : "buf[offset + {start}:offset + {end}]",
+             'enum_entry'     : "{member!r}: {name}",
+             'shared_reader'  : "_{order}_{code} = struct.Struct({format!r}).unpack_from\n",
+             'view_open'      : '\n'.join(['',
+                                           'class {name}(_Section):',
+                                           '{indent}"""{brief}"""',
+                                           "{indent}__slots__ = ('_buf', '_offset', {slots})",
+                                           '{indent}_fields   = ({fields})',
+                                           '{indent}size      = {size}',
+                                           '{indent}enums     = {{{enums}}}',
+                                           '',
+                                           '{indent}@classmethod',
+                                           '{indent}def decode(cls, buf, offset=0):',
+                                           '{indent}{indent}if len(buf) - offset < {size}:',
+                                           "{indent}{indent}{indent}raise ValueError('{abbreviation} needs {size} bytes, got {{}}'.format(len(buf) - offset))",
+                                           '{indent}{indent}return cls._read(memoryview(buf), offset)',
+                                           '',
+                                           '{indent}@classmethod',
+                                           '{indent}def _read(cls, buf, offset):',
+                                           '{indent}{indent}self = _new(cls)',
+                                           '{indent}{indent}self._buf = buf',
+                                           '{indent}{indent}self._offset = offset',
+                                           '{indent}{indent}return self',
+                                           ''
+                                          ]),
+             'view_property'  : '\n'.join(['',
+                                           '{indent}@property',
+                                           '{indent}def {member}(self):',
+                                           '{indent}{indent}try:',
+                                           '{indent}{indent}{indent}return self.{cache}',
+                                           '{indent}{indent}except AttributeError:',
+                                           '{indent}{indent}{indent}buf, offset = self._buf, self._offset',
+                                           '{read}{indent}{indent}{indent}value = self.{cache} = {value}',
+                                           '{indent}{indent}{indent}return value',
+                                           ''
+                                          ]),
+             'view_read'      : "{indent}{indent}{indent}r, = _{order}_{code}(buf, offset{at})\n",
+             'view_close'     : "\n",
+             'module_tail'    : "\nheaders  = ({headers})\nmessages = ({messages})\n",
+           }.items())
+
+##
+# @brief The names generated classes use for themselves, which fields are not given
+_py_reserved = frozenset(['header', 'trailer', 'size', 'enums', 'decode', 'self', 'cls', 'buf', 'offset'])
+
+##
+# @brief The module-level names of a generated module, which sections and values are not given
+# @details The struct readers of the module are named with a leading underscore, so sections and
+#          values may not start with one either.
+_py_module_names = frozenset(['bisect', 'struct', '_new', '_Section', '_Values', 'headers', 'messages'])
+
+##
+# @brief One read of a section's bytes, shared by the fields that lie in those bytes
+# @details code is the struct format code of the read.
+PyRead = namedtuple('PyRead', ['byteoffset', 'bytelength', 'endian', 'code'])
+
+##
+# @name py_name
+# @brief Translates an abbreviation string to a Python identifier.
+# @param abbreviation [in] The abbreviation string.
+# @return str The identifier
+def py_name(abbreviation):
+   name = abbreviation.replace('.','_').replace('-','_')
+   return ''.join([name, '_']) if keyword.iskeyword(name) or name in _py_reserved else name
+
+##
+# @name py_members
+# @brief Names the attributes of a section's fields
+# @details Attributes are named after the part of the field abbreviation that follows the section
+#          abbreviation, or after the whole abbreviation when those parts are not distinct.
+# @param section [in] The message, header or trailer
+# @return OrderedDict The attribute name of each field, keyed by field abbreviation
+def py_members(section):
+   prefix  = ''.join([section.abbreviation, '.'])
+   members = OrderedDict((a, py_name(a[len(prefix):] if a.startswith(prefix) else a)) for a in section.fields)
+   if len(set(members.values())) != len(members):
+      members = OrderedDict((a, py_name(a)) for a in section.fields)
+   return members
+
+##
+# @name py_read
+# @brief Returns the read a field's value is extracted from
+# @details Reads of 1, 2, 4 and 8 bytes unpack to integers (signed when the field fills them), and
+#          floats and doubles unpack to themselves. Other reads unpack to bytes.
+# @param layout [in] The FieldLayout of the field
+# @return PyRead The read
+def py_read(layout):
+   if   layout.kind in ('float', 'double'):
+      code = layout.kind[0]
+   elif layout.kind != 'undecoded' and layout.bytelength in (1, 2, 4, 8):
+      code = 'BHIQ'[(1, 2, 4, 8).index(layout.bytelength)]
+      if layout.signed and layout.full:
+         code = code.lower()
+   else:
+      code = '{}s'.format(layout.bytelength)
+   return PyRead(layout.byteoffset, layout.bytelength, layout.endian, code)
+
+##
+# @name py_read_groups
+# @brief Packs the reads of a section into as few struct.Struct layouts as possible
+# @details A struct reads its items in order, with one byte order. Reads that overlap an earlier
+#          read, or have another byte order, start another group.
+# @param reads [in] The distinct PyReads of the section
+# @return list Lists of PyReads, each in offset order
+def py_read_groups(reads):
+   groups = []
+   for read in sorted(reads, key=lambda r: (r.byteoffset, r.bytelength, r.code)):
+      for group in groups:
+         last = group[-1]
+         if last.endian == read.endian and last.byteoffset + last.bytelength <= read.byteoffset:
+            group.append(read)
+            break
+      else:
+         groups.append([read])
+   return groups
+
+##
+# @name py_struct_format
+# @brief Returns the struct format string of a group of reads
+# @param group [in] The PyReads, in offset order
+# @return str The format
+def py_struct_format(group):
+   items = ['>' if group[0].endian == Constants.endian['big'] else '<']
+   end   = 0
+   for read in group:
+      if read.byteoffset > end:
+         items.append('{}x'.format(read.byteoffset - end))
+      items.append(read.code)
+      end = read.byteoffset + read.bytelength
+   return ''.join(items)
+
+##
+# @name py_field_value
+# @brief Renders the expression decoding a field from its read
+# @param layout [in] The FieldLayout of the field
+# @param read [in] The PyRead of the field
+# @param ref [in] The local variable holding the unpacked read
+# @return str The expression
+def py_field_value(layout, read, ref):
+   T = _py_templates
+   if layout.kind in ('undecoded', 'float', 'double'):
+      return ref
+   value = ref
+   if read.code.endswith('s'):
+      value = T['field_sint' if layout.signed and layout.full else 'field_int'](ref=ref, endian=layout.endian)
+   #a field that fills the bytes it is read from needs no extraction
+   if not layout.full:
+      if layout.shift:
+         value = T['field_shift'](value=value, shift=layout.shift)
+      if layout.bits + layout.shift < layout.bytelength * 8:
+         value = T['field_mask'](value=value, mask=hex(layout.mask >> layout.shift))
+      if layout.signed:
+         value = T['field_sign'](value=value, sign=hex(1 << (layout.bits - 1)))
+   if layout.kind == 'weighted':
+      value = T['field_scale'](value=value, lsb=layout.lsb)
+      if layout.offset:
+         value = T['field_offset'](value=value, offset=layout.offset)
+   elif layout.kind == 'bool':
+      value = T['field_bool'](value=value)
+   return value
+
+##
+# @name py_enums
+# @brief Collects the <values> of the enumerated fields of some sections
+# @details Interned anonymous values are shared by several fields, and are listed once.
+# @param sections [in] The messages, headers and trailers
+# @return OrderedDict The Values, keyed by name
+def py_enums(sections):
+   enums = OrderedDict()
+   for section in sections:
+      for f in section.fields.values():
+         if fieldLayout(f).kind == 'enum':
+            values = fieldValues(f)
+            enums.setdefault(py_name(values.name), values)
+   return enums
+
+##
+# @name py_has_views
+# @brief Tells whether a section, its header or its trailer has undecoded fields
+# @param section [in] The message, header or trailer
+# @return bool True if decoding the section slices a memoryview
+def py_has_views(section):
+   parts = [getattr(section, s, None) for s in ('header', 'trailer')]
+   return any(fieldLayout(f).kind == 'undecoded' for f in section.fields.values()) or any(py_has_views(p) for p in parts if p is not None)
+
+##
+# @name py_section_class
+# @brief Renders the readers and the class of one section
+# @param section [in] The message, header or trailer
+# @param views [in] True if undecoded fields are memoryview slices of the decoded buffer, instead of bytes
+# @return str The Python source
+def py_section_class(section, views=False):
+   T        = _py_templates
+   name     = py_name(section.abbreviation)
+   members  = py_members(section)
+   layouts  = OrderedDict((a, fieldLayout(f)) for a, f in section.fields.items())
+   reads    = OrderedDict((a, py_read(layout)) for a, layout in layouts.items() if not (views and layout.kind == 'undecoded'))
+   groups   = py_read_groups(set(reads.values()))
+   refs     = dict((read, 'r{}_{}'.format(g, i)) for g, group in enumerate(groups) for i, read in enumerate(group))
+   parts    = [s for s in ('header', 'trailer') if getattr(section, s, None) is not None]
+   rendered = [T['reader'](name=name, group=g, format=py_struct_format(group)) for g, group in enumerate(groups)]
+   rendered.append(T['class_open'](name         = name,
+                                   brief        = str(section.description.brief).replace('"""', "'''"),
+                                   slots        = ''.join(repr(s) + ', ' for s in parts + list(members.values())),
+                                   size         = c_section_size(section),
+                                   enums        = ', '.join(T['enum_entry'](member=members[a], name=py_name(fieldValues(f).name))
+                                                            for a, f in section.fields.items() if layouts[a].kind == 'enum'),
+                                   abbreviation = section.abbreviation,
+                                   buf          = 'memoryview(buf)' if views and py_has_views(section) else 'buf'))
+   for g, group in enumerate(groups):
+      rendered.append(T['read_group'](refs=', '.join(refs[read] for read in group), name=name, group=g))
+   for part in parts:
+      rendered.append(T['read_section'](member=part, name=py_name(getattr(section, part).abbreviation)))
+   for a, layout in layouts.items():
+      if a in reads:
+         value = py_field_value(layout, reads[a], refs[reads[a]])
+      else:
+         value = T['field_view'](start=layout.byteoffset, end=layout.byteoffset + layout.bytelength)
+      rendered.append(T['field_assign'](member=members[a], value=value))
+   rendered.append(T['class_close']())
+   return ''.join(rendered)
+
+##
+# @name py_view_class
+# @brief Renders the view class of one section
+# @details A view holds a memoryview of the buffer and its offset, and decodes each field the
+#          first time its property is read. The value is cached in a slot of the instance.
+# @param section [in] The message, header or trailer
+# @param readers [in,out] The set of (order, code) module-level readers the view uses
+# @return str The Python source
+def py_view_class(section, readers):
+   T        = _py_templates
+   name     = py_name(section.abbreviation)
+   members  = py_members(section)
+   layouts  = OrderedDict((a, fieldLayout(f)) for a, f in section.fields.items())
+   parts    = [s for s in ('header', 'trailer') if getattr(section, s, None) is not None]
+   names    = parts + list(members.values())
+   rendered = [T['view_open'](name         = name,
+                              brief        = str(section.description.brief).replace('"""', "'''"),
+                              slots        = ''.join(repr('_v_' + n) + ', ' for n in names),
+                              fields       = ''.join(repr(n) + ', ' for n in names),
+                              size         = c_section_size(section),
+                              enums        = ', '.join(T['enum_entry'](member=members[a], name=py_name(fieldValues(f).name))
+                                                       for a, f in section.fields.items() if layouts[a].kind == 'enum'),
+                              abbreviation = section.abbreviation)]
+   for part in parts:
+      rendered.append(T['view_property'](member=part, cache='_v_' + part, read='', value='{}._read(buf, offset)'.format(py_name(getattr(section, part).abbreviation))))
+   for a, layout in layouts.items():
+      read = py_read(layout)
+      if read.code.endswith('s'):
+         #undecoded fields, and integers of 3, 5, 6 or 7 bytes, are sliced from the memoryview
+         ref   = T['field_view'](start=layout.byteoffset, end=layout.byteoffset + layout.bytelength)
+         value = ref if layout.kind == 'undecoded' else py_field_value(layout, read, ref)
+         code  = ''
+      else:
+         order = 'be' if read.endian == Constants.endian['big'] else 'le'
+         readers.add((order, read.code))
+         value = py_field_value(layout, read, 'r')
+         code  = T['view_read'](order=order, code=read.code, at=' + {}'.format(read.byteoffset) if read.byteoffset else '')
+      rendered.append(T['view_property'](member=members[a], cache='_v_' + members[a], read=code, value=value))
+   rendered.append(T['view_close']())
+   return ''.join(rendered)
+
+##
+# @name py_module
+# @brief Renders the decoder module of a protocol
+# @details Each header, trailer and message becomes a class with __slots__ and a decode
+#          classmethod. A class unpacks its fields with precompiled struct.Struct readers, then
+#          extracts bit fields with masks and shifts, and scales weighted fields. Enumerated fields
+#          decode to their integer value, which the module-level dicts named after their <values>
+#          map to names; a value anywhere in the range of a <value> maps to its name. Messages decode from the bytes that follow the protocol header.
+#          In lazy mode, the classes are views that decode each field on first access instead.
+# @param dispatchable_obj [in] The protocol
+# @param filename [in] The name given in the header comment
+# @param views [in] True if undecoded fields are memoryview slices of the decoded buffer, instead of bytes
+# @param lazy [in] True to render view classes, whose undecoded fields are always memoryview slices
+# @return str The Python source
+# @throws DispatchError When two sections or enumerations have the same Python name, or the
+#         name of one of the module's own definitions
+def py_module(dispatchable_obj, filename, views=False, lazy=False):
+   T        = _py_templates
+   sections = c_sections(dispatchable_obj)
+   enums    = py_enums(sections)
+   names    = [py_name(s.abbreviation) for s in sections] + list(enums)
+   if len(set(names)) != len(names):
+      raise DispatchError("<{}> {} has sections or values whose names give the same Python name".format(dispatchable_obj.getTag(), dispatchable_obj.name))
+   clashes = sorted(n for n in names if n in _py_module_names or n.startswith('_'))
+   if clashes:
+      raise DispatchError("<{}> {} has sections or values named {}, which the Python module uses for itself".format(dispatchable_obj.getTag(), dispatchable_obj.name, ', '.join(clashes)))
+   rendered = [T['header_comment'](filename=filename, description="The decoders for the {} protocol".format(dispatchable_obj.name)), T['module_head']()]
+   for name, values in enums.items():
+      rendered.append(T['enum_dict'](name=name, items=', '.join(T['enum_item'](ival=int(values.values[v].ival, 0), last=int(values.values[v].last, 0), name=v) for v in values.values)))
+   if lazy:
+      readers = set()
+      classes = [py_view_class(section, readers) for section in sections]
+      for order, code in sorted(readers):
+         rendered.append(T['shared_reader'](order=order, code=code, format='{}{}'.format('>' if order == 'be' else '<', code)))
+      rendered.extend(classes)
+   else:
+      rendered.extend(py_section_class(section, views) for section in sections)
+   headers = [py_name(s.abbreviation) for s in (dispatchable_obj.header, dispatchable_obj.trailer) if s is not None]
+   rendered.append(T['module_tail'](headers  = ''.join(h + ', ' for h in headers),
+                                    messages = ''.join(py_name(m.abbreviation) + ', ' for m in dispatchable_obj.messages.values())))
+   return ''.join(rendered)
+
+def dispatch(dispatchable_obj, sink):
+   if args_ns.python and dispatchable_obj.getTag() == Protocol.tag():
+      _logger.debug('Beginning dispatch for {} protocol'.format(dispatchable_obj.name))
+      sink.folder(args_ns.python_path)
+      path = os.path.join(args_ns.python_path, '{}_decoder.py'.format(py_name(dispatchable_obj.abbreviation)))
+      _logger.debug('Python decoder output to {}'.format(path))
+      with sink.open(path) as pyfile:
+         pyfile.write(py_module(dispatchable_obj, pyfile.name, lazy=args_ns.python_mode == 'lazy'))
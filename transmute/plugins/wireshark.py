@@ -4,16 +4,19 @@
 # @ingroup plugins
 #
 
+import io
 import logging
+import multiprocessing
 import os
 from   argparse                import ArgumentTypeError
 from   sys                     import argv
-from   collections             import OrderedDict
+from   collections             import OrderedDict, namedtuple
 from   ..                      import version_string as transmute_version
 from   ..Parsing.Parsable      import Parsable
 from   ..Parsing.Parser        import ParseError, ValidationError
 from   .base                   import *
 from   ..Dispatch.Dispatchable import Dispatchable, DispatchError
+from   ..Output.Template       import Template
 
 ##
 # @brief The module version number.
@@ -40,34 +43,19 @@ _prefix = 'ws'
 args_ns = None
 
 ##
-# @name force_folder
-# @brief Ensure a directory exists
-# @param path [in] The folder to check or create
-# @return str path
-# @throws ValueError When path already exists and is not a directory or when it cannot be created
-def force_folder(path):
-   if os.path.isdir(path):
-      return path
-   elif os.path.exists(path):
-      raise ValueError("'{}' already exists and is not a directory.".format(path))
-   else:
-      try:
-         os.mkdir(path)
-      except OSError as ose:
-         raise ValueError("Cannot create directory '{}'".format(path))
-   return path
-
-##
-# @name folder_type
-# @brief An argparse type for directories
-# @param path [in] The specified folder
-# @return str path
-# @throws ArgumentTypeError When path is not valid
-def folder_type(path):
+# @name count_type
+# @brief An argparse type for positive counts
+# @param text [in] The specified count
+# @return int The count
+# @throws ArgumentTypeError When text is not a positive integer
+def count_type(text):
    try:
-      return force_folder(path)
-   except ValueError as ve:
-      raise ArgumentTypeError(ve)
+      count = int(text)
+   except ValueError:
+      raise ArgumentTypeError("'{}' is not a number".format(text))
+   if count < 1:
+      raise ArgumentTypeError("'{}' must be at least 1".format(text))
+   return count
 
 ##
 # @name Register
@@ -89,12 +77,12 @@ class Register(Parsable):
       return ':'.join([_prefix, 'register']).lstrip(':')
    
    def Start(self, attrs, evt_stream, node, parser):
-      if args_ns.wireshark:
-         try:
-            self.table = attrs['table']
-            self.value = attrs['value']
-         except KeyError as ki:
-            raise ParseError("{} missing required attribute '{}'".format(self.getTag(), ki))
+      #read even without -ws, since other plugins route messages with the same tables
+      try:
+         self.table = attrs['table']
+         self.value = attrs['value']
+      except KeyError as ki:
+         raise ParseError("{} missing required attribute '{}'".format(self.getTag(), ki))
    
    def End(self):
       pass #ws:register does not have complex ending tasks
@@ -126,11 +114,11 @@ class Expose(Parsable):
       return ':'.join([_prefix, 'expose']).lstrip(':')
    
    def Start(self, attrs, evt_stream, node, parser):
-      if args_ns.wireshark:
-         try:
-            self.field = attrs['field']
-         except KeyError as ki:
-            raise ParseError("{} missing required attribute '{}'".format(self.getTag(), ki))
+      #read even without -ws, since Validate checks the field in every run
+      try:
+         self.field = attrs['field']
+      except KeyError as ki:
+         raise ParseError("{} missing required attribute '{}'".format(self.getTag(), ki))
    
    def End(self):
       pass #ws:expose does not have complex ending tasks
@@ -154,6 +142,9 @@ def register(args_parser, xml_parser):
    args_group = args_parser.add_argument_group(title='wireshark', description='These arguments control the wireshark output.')
    args_group.add_argument('-ws', '--wireshark',      action='store_true', default=False,                 help="Enable wireshark output.")
    args_group.add_argument(        '--wireshark-out',                      type=folder_type, dest='path', help="Change the wireshark output folder (default is the current working directory).")
+   args_group.add_argument(        '--wireshark-shards', default=1,         type=count_type,  dest='shards', metavar='N', help="Split the dissector into registration, handoff and N dissector source files (default is 1, a single source file).")
+   args_group.add_argument(        '--wireshark-share',  action='store_true',  default=False,       dest='share', help="Emit identical message headers and trailers once, shared by their messages. Their filter fields are then named after the first message using them.")
+   args_group.add_argument(        '--wireshark-registration', default='eager', choices=('eager', 'lazy'), dest='registration', help="Register the header fields of each message when Wireshark starts (eager, the default), or the first time the message is dissected into a tree or a display filter names a field of the protocol (lazy).")
    args_ns,argv = args_parser.parse_known_args()
    for parsable in [Register,
                     Expose
@@ -161,31 +152,152 @@ def register(args_parser, xml_parser):
       xml_parser.registerParsable(parsable)
 
 ##
-# @brief A collection of format strings used to construct Wireshark output.
-_ws_text = { 'header_comment'    : "/* \n * File: {{filename}}\n * Description: {{description}}\n * Generated using transmute {transmute_version} Wireshark plugin {plugin_version}\n */\n".format(**{'transmute_version':transmute_version,'plugin_version':version_string}),
+# @brief The indentation used in generated C code.
+_ws_indent = "   "
+
+##
+# @brief The templates used to construct Wireshark output.
+# @details Each template is compiled once, when the plugin is loaded. The indentation and
+#          the version banners are folded into the templates at that time.
+_ws_templates = dict((name, Template(text, indent=_ws_indent, transmute_version=transmute_version, plugin_version=version_string)) for name,text in {
+             'header_comment'    : "/* \n * File: {filename}\n * Description: {description}\n * Generated using transmute {transmute_version} Wireshark plugin {plugin_version}\n */\n",
              'header_includes'   : '\n'.join(['#include "config.h"',
                                               '#include <glib.h>',
                                               '#include <epan/packet.h>',
                                               '#include <epan/proto.h>',
                                               '#include <epan/tvbuff.h>',
                                               '#include <epan/column-utils.h>',
+                                              '#include "transmute_ws_runtime.h"',
                                               ''
                                             ]),
+             'runtime_helpers'   : '\n'.join(['/* Returns the bits of chunk selected by mask, shifted down to bit 0 */',
+                                              'static inline guint32 transmute_bits32(guint32 chunk, guint32 mask, guint shift)',
+                                              '{{',
+                                              '{indent}return (chunk & mask) >> shift;',
+                                              '}}',
+                                              '',
+                                              'static inline guint64 transmute_bits64(guint64 chunk, guint64 mask, guint shift)',
+                                              '{{',
+                                              '{indent}return (chunk & mask) >> shift;',
+                                              '}}',
+                                              '',
+                                              '/* Sign extends the two\'s complement value held in the low bits of value',
+                                              '   (the arithmetic right shift compiles to a single sign extension) */',
+                                              'static inline gint32 transmute_sign32(guint32 value, guint bits)',
+                                              '{{',
+                                              '{indent}return (gint32)(value << (32 - bits)) >> (32 - bits);',
+                                              '}}',
+                                              '',
+                                              'static inline gint64 transmute_sign64(guint64 value, guint bits)',
+                                              '{{',
+                                              '{indent}return (gint64)(value << (64 - bits)) >> (64 - bits);',
+                                              '}}',
+                                              '',
+                                              '/* Converts a fixed-point value with the given least significant bit and offset */',
+                                              'static inline double transmute_scale(double value, double lsb, double offset)',
+                                              '{{',
+                                              '{indent}return value * lsb + offset;',
+                                              '}}',
+                                              ''
+                                             ]),
+             'include_guard'     : "#ifndef {guard}\n#define {guard}\n",
+             'include_guard_end' : "#endif /* {guard} */\n",
              'source_includes'   : "#include \"packet-{name}.h\"\n",
+             'id_def'            : "{linkage}int {kind}_{name} = -1;\n",
+             'ett_def'           : "{linkage}gint ett_{name} = -1;\n",
+             'handle_def'        : "{linkage}dissector_handle_t handle_{name};\n",
+             'id_decl'           : "extern int {kind}_{name};\n",
+             'ett_decl'          : "extern gint ett_{name};\n",
+             'handle_decl'       : "extern dissector_handle_t handle_{name};\n",
+             'dissect_fxn_proto' : "{linkage}void dissect_{name}(tvbuff_t *tvb, packet_info *pinfo, proto_tree *tree);\n",
              'enum'              : "typedef enum enum_{name} {{\n{values}\n}} {name};\n",
              'enum_value'        : "{indent}{name} = {value}",
              'vs_value'          : "{indent}{{{name}, \"{name}\"}}",
              'value_string'      : "const value_string vs_{name}[] = {{\n{values},\n{indent}{{0, NULL}}\n}};\n",
-             'true_false_string' : "const true_false_string tfs_{name} = {{{vtrue}, {vfalse}}};\n",
-             'dissect_fxn_decl'  : "static void dissect_{name}(tvbuff_t *tvb, packet_info *pinfo, proto_tree *tree)",
-             'dissect_fxn_vars'  : "int offset = 0;\n   proto_tree *{name}_tree;\n   proto_item *pItem;\n",
-             'dissect_fxn_cols'  : "col_set_str(pinfo->cinfo, COL_PROTOCOL, \"{name}\");\n   col_clear(pinfo->cinfo, COL_INFO);\n",
-             'register_fxn_decl' : "void proto_register_{name}(void)",
-             'handoff_fxn_decl'  : "void proto_reg_handoff_{name}(void)",
-             'handoff_fxn_vars'  : "dissector_handle_t {name}_handle;\n",
-             'indent'            : "   ",
-             'header_field'      : '''{indent}{{&hf_{name},\n{indent}{indent}{{"{brief}", "{abbreviation}", FT_{ftype}, BASE_{btype}, {VALS}, {mask},\n{indent}{indent}{indent}"{detail}", HFILL}}}}''',
-           }
+             'value_string_ext'  : "value_string_ext vs_{name}_ext = VALUE_STRING_EXT_INIT(vs_{name});\n",
+             'rs_value'          : "{indent}{{{first}, {last}, \"{name}\"}}",
+             'range_string'      : "const range_string rs_{name}[] = {{\n{values},\n{indent}{{0, 0, NULL}}\n}};\n",
+             'enum_report'       : "/* {name}: {kind}, {count} values, {access} lookup */\n",
+             'true_false_string' : "{indent}const true_false_string tfs_{name} = {{{vtrue}, {vfalse}}};\n",
+             'dissect_fxn_decl'  : "{linkage}void dissect_{name}(tvbuff_t *tvb, packet_info *pinfo, proto_tree *tree)\n{{\n",
+             'dissect_fxn_vars'  : '\n'.join(['{indent}gint32            value    = 0;',
+                                              '{indent}double            dblValue = 0;',
+                                              '{indent}tvbuff_t         *tvbr     = NULL;',
+                                              '{indent}proto_item       *pItem    = NULL;',
+                                              '{indent}proto_tree       *pTree    = NULL;',
+                                              '{indent}proto_item       *psubI    = NULL;',
+                                              '{indent}proto_tree       *psubT    = NULL;',
+                                              '{indent}dissector_table_t pTable   = NULL;',
+                                              ''
+                                             ]),
+             'dissect_fxn_chunk' : "{indent}{ctype:<17} {name} = 0;\n",
+             'dissect_fxn_bits'  : "{indent}static const int *{name}[] = {{{fields}, NULL}};\n",
+             'dissect_fxn_unused': '\n'.join(['(void)(value);',
+                                              '(void)(dblValue);',
+                                              '(void)(tvbr);',
+                                              '(void)(pItem);',
+                                              '(void)(pTree);',
+                                              '(void)(psubI);',
+                                              '(void)(psubT);',
+                                              '(void)(pTable);',
+                                              '(void)(tvb);',
+                                              '(void)(pinfo);',
+                                              '(void)(tree);',
+                                              ''
+                                             ]),
+             'dissect_fxn_cols'  : "{indent}col_set_str(pinfo->cinfo, COL_PROTOCOL, \"{name}{space}\");\n",
+             'dissect_fxn_fence' : "{indent}col_set_fence(pinfo->cinfo, COL_PROTOCOL);\n",
+             'dissect_fxn_item'  : "{indent}pItem = proto_tree_add_item(   tree, {proto_or_hf}_{name}, tvb, {offset}, {length}, ENC_{endian}_ENDIAN);\n",
+             'dissect_fxn_tree'  : "{indent}pTree = proto_item_add_subtree(pItem, ett_{name});\n",
+             'dissect_fxn_check' : "{indent}tvb_ensure_bytes_exist(tvb, 0, {length});\n",
+             'chunk_read'        : "{indent}{name} = {read};\n",
+             'tvb_read'          : "tvb_get_guint{bitfamily}(tvb, {byteoffs}{enc})",
+             'dissect_call'      : "{indent}dissect_{name}(tvb, pinfo, pTree);\n",
+             'tree_open'         : "{indent}if(tree)\n{indent}{{\n",
+             'tree_close'        : "{indent}}}\n",
+             'field_item'        : "{indent}proto_tree_add_item(pTree, hf_{name}, tvb, {offset}, {length}, ENC_{endian}_ENDIAN);\n",
+             'field_chunk_item'  : "{indent}proto_tree_add_{kind}(pTree, hf_{name}, tvb, {offset}, {length}, {value});\n",
+             'field_bits_item'   : "{indent}proto_tree_add_bitmask(pTree, tvb, {offset}, hf_{name}, ett_{name}, {fields}, ENC_{endian}_ENDIAN);\n",
+             'field_scaled_item' : "{indent}psubI = proto_tree_add_double_format_value(pTree, hf_{name}, tvb, {byteoffset}, {bytelength}, dblValue, \"%f\", dblValue);\n{indent}PROTO_ITEM_SET_GENERATED(psubI);\n",
+             'field_value'       : "{return_field} = {value}",
+             'field_bits'        : "transmute_bits{width}({source}, {andv}, {shift})",
+             'field_sign'        : "transmute_sign{width}({value}, {bits})",
+             'field_scale'       : "transmute_scale({value}, {scale}, {offset})",
+             'statement'         : "{indent}{statement};\n",
+             'expose_length'     : "{indent}value = tvb_length(tvb);\n",
+             'expose_less'       : "{indent}value -= {length}; //{section} length\n",
+             'expose_subset'     : "{indent}tvbr = tvb_new_subset(tvb, {offset}, value, value);\n",
+             'expose_table'      : "{indent}pTable = find_dissector_table(\"{name}\");\n",
+             'expose_try'        : "{indent}if(pTable)\n{indent}{{\n{indent}{indent}dissector_try_uint(pTable, value, tvbr, pinfo, tree);\n{indent}}}\n",
+             'expose_switch'     : "{indent}switch(value)\n{indent}{{\n",
+             'expose_case'       : "{indent}case {value}:\n{indent}{indent}if(proto_is_protocol_enabled(find_protocol_by_id(proto_{name})))\n{indent}{indent}{{\n{indent}{indent}{indent}dissect_{name}(tvbr, pinfo, tree);\n{indent}{indent}{indent}break;\n{indent}{indent}}}\n",
+             'expose_case_end'   : "{indent}{indent}break;\n",
+             'expose_default'    : "{indent}default:\n",
+             'expose_switch_end' : "{indent}{indent}break;\n{indent}}}\n",
+             'fxn_end'           : "}}\n\n",
+             'register_fxn_decl' : "void proto_register_{name}(void)\n{{\n",
+             'register_hf_open'  : "{indent}static hf_register_info hf[] = {{",
+             'register_ett_open' : "{indent}static gint *ett[] = {{\n",
+             'register_ett'      : "{indent}{indent}&ett_{name}",
+             'register_end'      : "\n{indent}}};\n",
+             'register_proto'    : "{indent}proto_{name} = proto_register_protocol(\"{protoname}\", \"{brief}\", \"{abbreviation}\");\n",
+             'register_handle'   : "{indent}handle_{name} = create_dissector_handle(dissect_{name}, proto_{name});\n",
+             'register_fields'   : "{indent}proto_register_field_array(proto_{name}, hf, array_length(hf));\n",
+             'register_subtrees' : "{indent}proto_register_subtree_array(ett, array_length(ett));\n",
+             'fields_fxn_proto'  : "{linkage}void register_fields_{name}(const char *prefix);\n",
+             'fields_fxn_decl'   : "{linkage}void register_fields_{name}(const char *prefix)\n{{\n{indent}static gboolean registered = FALSE;\n",
+             'fields_fxn_once'   : "{indent}(void)prefix;\n{indent}if(registered)\n{indent}{{\n{indent}{indent}return;\n{indent}}}\n{indent}registered = TRUE;\n",
+             'fields_call'       : "{indent}register_fields_{name}({prefix});\n",
+             'prefix_fxn_decl'   : "static void register_prefix_{name}(const char *prefix)\n{{\n",
+             'register_prefix'   : "{indent}proto_register_prefix(\"{abbreviation}\", register_prefix_{name});\n",
+             'registration_report': "/* Registration: {mode}, {startup} header fields at startup, {deferred} on first use in {batches} batches */\n",
+             'register_table'    : "{indent}register_dissector_table(\"{field}\", \"{descr}\", FT_{ftype}, BASE_{btype});\n",
+             'handoff_fxn_decl'  : "void proto_reg_handoff_{name}(void)\n{{\n",
+             'handoff_handle'    : "{indent}dissector_handle_t {handle};\n",
+             'handoff_find'      : "{indent}handle_{name} = find_dissector(\"{name}\");\n",
+             'handoff_add'       : "{indent}dissector_add_uint(\"{table}\", {value}, handle_{name});\n",
+             'header_field'      : '''{indent}{indent}{{&hf_{name},\n{indent}{indent}{{"{brief}", "{abbreviation}", FT_{ftype}, {display}, {VALS}, {mask},\n{indent}{indent}{indent}"{detail}", HFILL}}}}''',
+           }.items())
 
 ##
 # @brief A lookup table of Wireshark base ftypes from Transmute field types
@@ -308,72 +420,223 @@ def ws_field_basetype(f):
       return 'NONE'
 
 def ws_header_field(f, abbrAppend='', descrAppend='', ftypeOverride=None):
-   abbr = ''.join([f.description.abbreviation, abbrAppend])
-   brief = ''.join([str(f.description.brief), descrAppend])
-   detail = ''.join([str(f.description.detail), descrAppend])
-   attrs = {'indent'      : _ws_text['indent'],
-            'name'        : abbr2name(abbr),
-            'brief'       : brief,
-            'abbreviation': abbr,
-            'ftype'       : _ws_ftypes[f.ftype if hasattr(f, 'ftype') else 'undecoded'],
-            'btype'       : 'NONE',
-            'VALS'        : 'NULL',
-            'mask'        : 0x0,
-            'detail'      : detail
-           }
-   
-   attrs['ftype'] = ws_field_ftype(f)
-   attrs['btype'] = ws_field_basetype(f)
+   abbr  = ''.join([f.description.abbreviation, abbrAppend])
+   ftype = ws_field_ftype(f)
+   btype = ws_field_basetype(f)
+   vals  = 'NULL'
+   mask  = 0x0
 
    if ftypeOverride is not None:
-      attrs['ftype'] = ftypeOverride
-      attrs['btype'] = 'NONE'
-   
-   if isinstance(f, Field) and attrs['ftype'] != 'NONE':
+      ftype = ftypeOverride
+      btype = 'NONE'
+
+   if isinstance(f, Field) and ftype != 'NONE':
       if 'enum' in f.ftype:
-         attrs['VALS'] = 'VALS({vstr}_{vname})'.format(vstr  = 'tfs' if is_tfs(f.values) else 'vs',
-                                                       vname = f.values.name if f.values.name else abbr2name(abbr)
-                                                      )
-      attrs['mask'] = hex(f.position.bitmask)
-      if((attrs['ftype'] == 'DOUBLE') or
-         (attrs['ftype'] == 'FLOAT' ) or
-         ('INT32' in attrs['ftype']  and attrs['mask'] == '0xffffffff'        ) or
-         ('INT16' in attrs['ftype']  and attrs['mask'] == '0xffff'            ) or
-         ('INT8'  in attrs['ftype']  and attrs['mask'] == '0xff'              )):
-         attrs['mask'] = 0
-   
-   return '{indent}{s}'.format(indent = _ws_text['indent'],
-                               s      = _ws_text['header_field'].format(**attrs))
-
-def ws_field_value(f, return_field='value'):
-   attrs = {'byteoffs'     : f.position.index * (f.chunksize // 8),
-            'enc'          : "ENC_LITTLE_ENDIAN" if f.endian == Constants.endian['little'] else "ENC_BIG_ENDIAN",
-            'bitfamily'    : ws_bit_family(f),
-            'shift'        : f.position.bitstart if f.bit0 == Constants.bit0['LSb'] else (f.position.chunksize - f.position.bitstart),
-            'andv'         : hex(f.position.bitmask),
-            'scale_expr'   : '',
-            'sign_cast'    : '',
-            'sign_expr'    : '',
-            'return_field' : return_field,
-            'intfamily'    : ws_gint_family(f)
-           }
-   attrs['enc']     = ' '.join((',', attrs['enc'])) if attrs['bitfamily'] > 8 else ''
-   attrs['shiftop'] = ' >> ' if attrs['shift'] else ''
-   if attrs['shift'] == 0:
-      attrs['shift'] = ''
-   if ('weighted' in f.ftype or 'int' in f.ftype) and 'unsigned' not in f.ftype:
-      bits_constant = '0x{{:F>{famwidth}X}}'.format(famwidth=attrs['intfamily']//4)
-      attrs['sign_bits'] = bits_constant.format(int('1' * attrs['bitfamily'], 2) ^ (int(attrs['andv'], 16) >> (int(attrs['shift']) + 1 if attrs['shift'] else 1)))
-      attrs['sign_cast'] = '(gint{intfamily})'.format(**attrs)
-      sign_expr = ' | (((tvb_get_guint{bitfamily}(tvb, {byteoffs}{enc}) & {andv}{shiftop}{shift}) & {sign_bits}) ? {sign_bits} : 0)'.format(**attrs)
-      attrs['sign_expr'] = sign_expr
-   if 'weighted' in f.ftype:
-      scale   = ws_float_value(f.weight.lsb)
-      voffset = f.weight.offset
-      attrs['scale_expr'] = ' * {scale} + {offset}'.format(scale  = scale,
-                                                           offset = voffset
-                                                          )
-   return '{return_field} = ({sign_cast}(((tvb_get_guint{bitfamily}(tvb, {byteoffs}{enc}) & {andv}){shiftop}{shift}){sign_expr})){scale_expr}'.format(**{k:str(attrs[k]) for k in attrs})
+         vname = f.values.name if f.values.name else abbr2name(abbr)
+         kind  = ws_enum_representation(fieldValues(f)).kind
+         if is_tfs(f.values):
+            vals = 'VALS(tfs_{})'.format(vname)
+         elif kind == 'value_string_ext':
+            vals  = '&vs_{}_ext'.format(vname)
+            btype = '{}|BASE_EXT_STRING'.format(btype)
+         elif kind == 'range_string':
+            vals  = 'RVALS(rs_{})'.format(vname)
+            btype = '{}|BASE_RANGE_STRING'.format(btype)
+         else:
+            vals = 'VALS(vs_{})'.format(vname)
+      mask = ws_field_mask(f, ftype)
+
+   #a boolean with a bitmask is displayed with the width of the bytes it is read from
+   display = 'BASE_{}'.format(btype)
+   if ftype == 'BOOLEAN' and mask:
+      display = ws_chunks2bytes(f.position.chunksize, f.position.chunklength) * 8
+   return _ws_templates['header_field'](name         = abbr2name(abbr),
+                                        brief        = ''.join([str(f.description.brief), descrAppend]),
+                                        abbreviation = abbr,
+                                        ftype        = ftype,
+                                        display      = display,
+                                        VALS         = vals,
+                                        mask         = mask,
+                                        detail       = ''.join([str(f.description.detail), descrAppend])
+                                       )
+
+##
+# @name ws_field_mask
+# @brief Returns the hf_register_info bitmask of a field
+# @param f [in] The field
+# @param ftype [in] The Wireshark ftype of the field
+# @return The bitmask as a hex string, or 0 when the field uses every bit it is read from
+def ws_field_mask(f, ftype):
+   mask = hex(f.position.bitmask)
+   if((ftype == 'DOUBLE') or
+      (ftype == 'FLOAT' ) or
+      ('INT32' in ftype  and mask == '0xffffffff'        ) or
+      ('INT16' in ftype  and mask == '0xffff'            ) or
+      ('INT8'  in ftype  and mask == '0xff'              )):
+      mask = 0
+   return mask
+
+##
+# @brief A local variable holding the chunks a field is read from.
+# @details name is the C identifier, ctype its C type, and read the expression that reads it from the tvb.
+ChunkRead = namedtuple('ChunkRead', ['name', 'ctype', 'read'])
+
+##
+# @name ws_field_chunk
+# @brief Describes the read that a field's value is derived from
+# @details The read covers the bytes of the field's layout, so fields read from the same bytes with
+#          the same width and encoding share a ChunkRead.
+# @param f [in] The field
+# @return ChunkRead The read
+def ws_field_chunk(f):
+   layout = fieldLayout(f)
+   width  = layout.bytelength * 8
+   little = layout.endian == Constants.endian['little']
+   enc    = (', ENC_LITTLE_ENDIAN' if little else ', ENC_BIG_ENDIAN') if width > 8 else ''
+   return ChunkRead(name  = 'chunk_{}_{}{}'.format(layout.byteoffset, width, '_le' if little and width > 8 else ''),
+                    ctype = 'guint{}'.format(next(w for w in (8, 16, 32, 64) if width <= w)),
+                    read  = _ws_templates['tvb_read'](bitfamily=width, byteoffs=layout.byteoffset, enc=enc))
+
+##
+# @name ws_field_cached
+# @brief Returns whether a field is decoded from a chunk local in the dissect_ function
+# @param f [in] The field
+# @return bool True for integer fields
+def ws_field_cached(f):
+   return 'INT' in _ws_ftypes.get(f.ftype, 'NONE')
+
+##
+# @name ws_field_chunk_item
+# @brief Returns whether a field's tree item is added from its chunk local
+# @details Integer fields read with the width of the item are.
+# @param f [in] The field
+# @return bool True when the item uses the chunk local
+def ws_field_chunk_item(f):
+   if not ws_field_cached(f):
+      return False
+   bitfamily = ws_bit_family(f)
+   length    = ws_chunks2bytes(f.position.chunksize, f.position.chunklength)
+   return bitfamily in (8, 16, 32, 64) and bitfamily // 8 == length == fieldLayout(f).bytelength
+
+##
+# @name ws_field_item
+# @brief Renders the tree item of a field
+# @details Integer fields read with the width of the item are added from their chunk local.
+#          Wireshark applies the hf bitmask to the value, just as it does for proto_tree_add_item.
+# @param f [in] The field
+# @return str The statement adding the item
+def ws_field_item(f):
+   T      = _ws_templates
+   name   = abbr2name(f.description.abbreviation)
+   length = ws_chunks2bytes(f.position.chunksize, f.position.chunklength)
+   if ws_field_chunk_item(f):
+      bitfamily = ws_bit_family(f)
+      chunk     = ws_field_chunk(f)
+      unsigned  = 'UINT' in ws_field_ftype(f)
+      return T['field_chunk_item'](kind   = ''.join(['uint' if unsigned else 'int', '64' if bitfamily == 64 else '']),
+                                   name   = name,
+                                   offset = f.position.index,
+                                   length = length,
+                                   value  = chunk.name if unsigned else '(gint{}){}'.format(bitfamily, chunk.name))
+   return T['field_item'](name   = name,
+                          endian = "BIG" if f.endian == Constants.endian['big'] else "LITTLE",
+                          length = length,
+                          offset = f.position.index)
+
+##
+# @brief Bit fields decoded together with proto_tree_add_bitmask.
+# @details abbreviation names the group's own header field and subtree, array names the C array of
+#          the fields' hf ids, chunk is the ChunkRead the fields share, and fields lists the fields in
+#          declaration order.
+BitGroup = namedtuple('BitGroup', ['abbreviation', 'array', 'chunk', 'fields', 'offset', 'length', 'endian', 'ftype'])
+
+##
+# @name ws_bit_groups
+# @brief Groups the bit fields of a section that are read from the same chunk
+# @details Integer and boolean fields that use part of the chunk they are read from are grouped
+#          when at least two of them share the read. Weighted fields stay out of the groups, so
+#          their scaled values follow them in the tree.
+# @param section [in] The message, header or trailer
+# @return list The BitGroups of the section
+def ws_bit_groups(section):
+   candidates = OrderedDict()
+   if ws_has_section(section, 'fields'):
+      for f in section.fields.values():
+         ftype = ws_field_ftype(f)
+         if (ws_field_cached(f) or ftype == 'BOOLEAN') and 'weighted' not in f.ftype and ws_field_mask(f, ftype):
+            width = ws_chunks2bytes(f.position.chunksize, f.position.chunklength) * 8
+            #the width of a boolean is its display, which ws_header_field sets to the chunk's
+            if (ws_bit_family(f) if ftype != 'BOOLEAN' else width) == width and width in (8, 16, 24, 32, 64):
+               candidates.setdefault(ws_field_chunk(f).name, []).append(f)
+   groups = []
+   for name, fields in candidates.items():
+      if len(fields) > 1:
+         first  = fields[0]
+         chunk  = ws_field_chunk(first)
+         length = ws_chunks2bytes(first.position.chunksize, first.position.chunklength)
+         groups.append(BitGroup(abbreviation = '{}.bits{}'.format(section.abbreviation, first.position.index),
+                                array        = chunk.name.replace('chunk_', 'bits_', 1),
+                                chunk        = chunk,
+                                fields       = fields,
+                                offset       = first.position.index,
+                                length       = length,
+                                endian       = "BIG" if first.endian == Constants.endian['big'] else "LITTLE",
+                                ftype        = 'UINT{}'.format(length * 8)))
+   return groups
+
+##
+# @name ws_bit_group_field
+# @brief Renders the hf_register_info entry of a BitGroup's header field
+# @param group [in] The BitGroup
+# @return str The entry
+def ws_bit_group_field(group):
+   brief = 'Bits at offset {}'.format(group.offset)
+   return _ws_templates['header_field'](name         = abbr2name(group.abbreviation),
+                                        brief        = brief,
+                                        abbreviation = group.abbreviation,
+                                        ftype        = group.ftype,
+                                        display      = 'BASE_HEX',
+                                        VALS         = 'NULL',
+                                        mask         = 0,
+                                        detail       = brief
+                                       )
+
+##
+# @name ws_extent
+# @brief Returns the number of bytes a dissect_ function checks for before decoding
+# @details Messages check their whole extent, and protocols the extent of their header.
+#          Headers and trailers are covered by the check of the function calling them.
+# @param dispatchable_obj [in] The protocol or section
+# @return int The number of bytes, or 0 for no check
+def ws_extent(dispatchable_obj):
+   if isinstance(dispatchable_obj, Protocol) and ws_has_section(dispatchable_obj, 'header'):
+      return sectionSize(dispatchable_obj.header)
+   elif isinstance(dispatchable_obj, Message) and not isinstance(dispatchable_obj, (Header, Trailer)):
+      return sectionSize(dispatchable_obj)
+   return 0
+
+##
+# @name ws_field_value
+# @brief Renders the assignment of a field's decoded value
+# @details The masking, sign extension and scaling are done by the helpers in transmute_ws_runtime.h.
+# @param f [in] The field
+# @param return_field [in] The variable assigned
+# @param cached [in] True to read the field from its chunk local rather than the tvb
+# @return str The assignment
+def ws_field_value(f, return_field='value', cached=False):
+   T      = _ws_templates
+   layout = fieldLayout(f)
+   width  = 64 if layout.bytelength > 4 else 32
+   chunk  = ws_field_chunk(f)
+   value  = chunk.name if cached else chunk.read
+   #a field that fills its chunk needs no extraction
+   if not layout.full:
+      value = T['field_bits'](width=width, source=value, andv=hex(layout.mask), shift=layout.shift)
+   if layout.signed:
+      value = T['field_sign'](width=width, value=value, bits=max(1, layout.bits))
+   if layout.kind == 'weighted':
+      value = T['field_scale'](value=value, scale=ws_float_value(layout.lsb), offset=ws_float_value(layout.offset))
+   return T['field_value'](return_field=return_field, value=value)
 
 def ws_include_guard(file_obj):
    return os.path.basename('{}_'.format(file_obj.name.upper().replace('-','_').replace('.','_')))
@@ -394,197 +657,636 @@ def tfs_get(v, val):
       if v.values[k] == val:
          return k
 
+##
+# @brief The smallest enumeration emitted as a value_string_ext
+# @details Below this a linear scan of a plain value_string is as fast as the extended lookup.
+_ws_vs_ext_min = 16
+
+##
+# @brief The lookup table chosen for an enumeration.
+# @details kind is value_string, value_string_ext or range_string, access the lookup Wireshark
+#          performs on it, and entries the (first, last, name) of each value in table order.
+EnumRepresentation = namedtuple('EnumRepresentation', ['kind', 'access', 'entries'])
+
+##
+# @name ws_enum_representation
+# @brief Chooses the lookup table of an enumeration
+# @details Values that cover a range of integers need a range_string. Large sets with distinct
+#          values become a value_string_ext sorted by value, which Wireshark indexes directly
+#          when the values are contiguous and binary searches otherwise. Everything else
+#          stays a value_string, searched linearly.
+# @param v [in] The defining Values
+# @return EnumRepresentation The representation
+def ws_enum_representation(v):
+   entries = [(int(value.ival, 0), int(value.last, 0), name) for name, value in v.values.items()]
+   if any(first != last for first, last, name in entries):
+      return EnumRepresentation('range_string', 'linear', sorted(entries))
+   #value_string lookups compare the guint32 value
+   keys = [first & 0xffffffff for first, last, name in entries]
+   if len(entries) < _ws_vs_ext_min or len(set(keys)) != len(keys):
+      return EnumRepresentation('value_string', 'linear', entries)
+   ordered = sorted(entries, key=lambda e: e[0] & 0xffffffff)
+   keys    = sorted(keys)
+   direct  = keys[-1] - keys[0] == len(keys) - 1
+   return EnumRepresentation('value_string_ext', 'direct' if direct else 'binary search', ordered)
+
 def var_decl(v):
    _logger.debug('ws:var_decl({})'.format(v))
    return '{}\n'.format(''.join((v[:v.index('=')].rstrip(),';')))
 
-def write_dissect_fxn(dispatchable_obj, cfile):
-   if ws_has_section(dispatchable_obj, 'header'):
-      write_dissect_fxn(dispatchable_obj.header, cfile)
-   if ws_has_section(dispatchable_obj, 'trailer'):
-      write_dissect_fxn(dispatchable_obj.trailer, cfile)
+##
+# @name write_tree_block
+# @brief Writes statements that only run when the dissector is asked for a protocol tree.
+# @details Filtering and statistics runs call dissectors with a NULL tree. They only need the
+#          column information and the subdissector dispatch, so the tree items are skipped.
+# @param cfile [in] The output file
+# @param statements [in] The rendered statements
+def write_tree_block(cfile, statements):
+   T = _ws_templates
+   cfile.write(T['tree_open']())
+   cfile.write(ws_indent_block(statements))
+   cfile.write(T['tree_close']())
+
+##
+# @name ws_indent_block
+# @brief Indents rendered statements by one level
+# @param statements [in] The rendered statements
+# @return str The indented statements
+def ws_indent_block(statements):
+   return ''.join(''.join([_ws_indent, line]) if line.strip() else line for line in statements.splitlines(True))
+
+##
+# @name ws_section_fingerprint
+# @brief Describes the layout of a header or trailer, without its abbreviations
+# @details Sections with equal fingerprints dissect the same bytes into the same tree, so
+#          one dissect_ function and one set of header fields can serve all of them.
+# @param section [in] The Header or Trailer
+# @return tuple The fingerprint
+def ws_section_fingerprint(section):
+   fields = []
+   for f in section.fields.values():
+      fields.append((str(f.description.brief), str(f.description.detail), f.ftype, f.chunksize, f.endian, f.bit0,
+                     f.position.index, f.position.chunklength, f.position.bitstart, f.position.bitmask,
+                     tuple((v.ival, v.last, k) for k,v in fieldValues(f).values.items()) if 'enum' in f.ftype else None,
+                     (f.weight.lsb, f.weight.offset) if 'weighted' in f.ftype else None
+                   ))
+   return (section.getTag(), str(section.description.brief), str(section.description.detail), section.endian, tuple(fields))
+
+##
+# @name ws_shared_sections
+# @brief Maps each header and trailer of a protocol to the first one with the same layout
+# @param dispatchable_obj [in] The protocol
+# @return OrderedDict The canonical abbreviation of each header and trailer abbreviation
+def ws_shared_sections(dispatchable_obj):
+   shared    = OrderedDict()
+   canonical = {}
+   for node in [dispatchable_obj] + list(dispatchable_obj.messages.values()):
+      for section in (getattr(node, s) for s in ('header', 'trailer') if ws_has_section(node, s)):
+         shared[section.abbreviation] = canonical.setdefault(ws_section_fingerprint(section), section.abbreviation)
+   return shared
+
+##
+# @name ws_section_abbreviation
+# @brief Returns the abbreviation of the header or trailer whose functions dissect a section
+# @param section [in] The Header or Trailer
+# @param shared [in] The canonical abbreviation of each header and trailer, or None
+# @return str The abbreviation
+def ws_section_abbreviation(section, shared):
+   return shared.get(section.abbreviation, section.abbreviation) if shared else section.abbreviation
+
+##
+# @name ws_is_shared_copy
+# @brief Returns whether a section is dissected by the functions of another section
+# @param section [in] The Header or Trailer
+# @param shared [in] The canonical abbreviation of each header and trailer, or None
+# @return bool True when the section's own functions and header fields are not emitted
+def ws_is_shared_copy(section, shared):
+   return ws_section_abbreviation(section, shared) != section.abbreviation
+
+def write_dissect_fxn(dispatchable_obj, cfile, fragments=None, linkage='static ', shared=None, lazy=False):
+   T = _ws_templates
+   for section in ('header', 'trailer'):
+      if ws_has_section(dispatchable_obj, section) and not ws_is_shared_copy(getattr(dispatchable_obj, section), shared):
+         write_dissect_fxn(getattr(dispatchable_obj, section), cfile, linkage=linkage, lazy=lazy)
    if ws_has_section(dispatchable_obj, 'messages'):
       for msg in dispatchable_obj.messages:
-         write_dissect_fxn(dispatchable_obj.messages[msg], cfile)
-   cfile.write('{decl}\n{{\n'.format(**{'decl':_ws_text['dissect_fxn_decl'].format(name=abbr2name(dispatchable_obj.abbreviation))}))
-   cfile.write('\n'.join(['{indent}gint32            value    = 0;',
-                          '{indent}double            dblValue = 0;',
-                          '{indent}tvbuff_t         *tvbr     = NULL;',
-                          '{indent}proto_item       *pItem    = NULL;',
-                          '{indent}proto_tree       *pTree    = NULL;',
-                          '{indent}proto_item       *psubI    = NULL;',
-                          '{indent}proto_tree       *psubT    = NULL;',
-                          '{indent}dissector_table_t pTable   = NULL;',
-                          '(void)(value);',
-                          '(void)(dblValue);',
-                          '(void)(tvbr);',
-                          '(void)(pItem);',
-                          '(void)(pTree);',
-                          '(void)(psubI);',
-                          '(void)(psubT);',
-                          '(void)(pTable);',
-                          '(void)(tvb);',
-                          '(void)(pinfo);',
-                          '(void)(tree);',
-                          ''
-                         ]).format(indent = _ws_text['indent'],
-                                   name   = abbr2name(dispatchable_obj.abbreviation)
-                                  ))
+         if fragments is None:
+            write_dissect_fxn(dispatchable_obj.messages[msg], cfile, linkage=linkage, shared=shared, lazy=lazy)
+         elif msg in fragments:
+            cfile.write(fragments[msg].dissect)
+   name     = abbr2name(dispatchable_obj.abbreviation)
+   position = dispatchable_obj.position
+   fields   = list(dispatchable_obj.fields.values()) if ws_has_section(dispatchable_obj, 'fields') else []
+   exposed  = [dispatchable_obj.getField(c.field) for c in dispatchable_obj.children if isinstance(c, Expose)]
+   groups   = ws_bit_groups(dispatchable_obj)
+   grouped  = dict((id(f), g) for g in groups for f in g.fields)
+   #each chunk is read once; the ones exposed fields need are read even when there is no tree
+   exposed_chunks = OrderedDict((c.name, c) for c in (ws_field_chunk(f) for f in exposed))
+   #only the chunks an item or a scaled value reads are declared, as unused locals break -Werror builds
+   tree_chunks    = OrderedDict((c.name, c) for c in (ws_field_chunk(f) for f in fields if id(f) not in grouped and (ws_field_chunk_item(f) or 'weighted' in f.ftype)) if c.name not in exposed_chunks)
+   cfile.write(T['dissect_fxn_decl'](name=name, linkage=linkage))
+   cfile.write(T['dissect_fxn_vars']())
+   for chunk in list(exposed_chunks.values()) + list(tree_chunks.values()):
+      cfile.write(T['dissect_fxn_chunk'](ctype=chunk.ctype, name=chunk.name))
+   for group in groups:
+      cfile.write(T['dissect_fxn_bits'](name   = group.array,
+                                        fields = ', '.join('&hf_{}'.format(abbr2name(f.description.abbreviation)) for f in group.fields)))
+   cfile.write(T['dissect_fxn_unused']())
    if not isinstance(dispatchable_obj, (Header, Trailer)):
-      cfile.write('{indent}col_set_str(pinfo->cinfo, COL_PROTOCOL, "{name}{space}");\n'.format(indent = _ws_text['indent'],
-                                                                                               name   = dispatchable_obj.description.name,
-                                                                                               space  = ' ' if isinstance(dispatchable_obj, Protocol) else ''
-                                                                                              ))
+      cfile.write(T['dissect_fxn_cols'](name  = dispatchable_obj.description.name,
+                                        space = ' ' if isinstance(dispatchable_obj, Protocol) else ''
+                                       ))
       if isinstance(dispatchable_obj, Protocol):
-         cfile.write('{indent}col_set_fence(pinfo->cinfo, COL_PROTOCOL);\n'.format(indent = _ws_text['indent']))
-   cfile.write('{indent}pItem = proto_tree_add_item(   tree, {proto_or_hf}_{name}, tvb, {offset}, {length}, ENC_{endian}_ENDIAN);\n'.format(indent = _ws_text['indent'],
-                                                                                                                         name   = abbr2name(dispatchable_obj.abbreviation),
-                                                                                                                         endian = "BIG" if dispatchable_obj.endian == Constants.endian['big'] else "LITTLE",
-                                                                                                                         proto_or_hf = "proto" if dispatchable_obj.getTag() == Protocol.tag() else "hf",
-                                                                                                                         length = ws_chunks2bytes(dispatchable_obj.position.chunksize, dispatchable_obj.position.chunklength),
-                                                                                                                         offset = dispatchable_obj.position.index
-                                                                                                                        ))
-   cfile.write('{indent}pTree = proto_item_add_subtree(pItem, ett_{name});\n'.format(indent = _ws_text['indent'],
-                                                                                     name   = abbr2name(dispatchable_obj.abbreviation)
-                                                                                    ))
+         cfile.write(T['dissect_fxn_fence']())
+   extent = ws_extent(dispatchable_obj)
+   if extent > 0:
+      cfile.write(T['dissect_fxn_check'](length=extent))
+   for chunk in exposed_chunks.values():
+      cfile.write(T['chunk_read'](name=chunk.name, read=chunk.read))
+   #the protocol tree is only built when Wireshark asks for one
+   items = io.StringIO()
+   #headers and trailers are registered with the node that owns them
+   owner = dispatchable_obj.parent if isinstance(dispatchable_obj, (Header, Trailer)) else dispatchable_obj
+   if lazy and owner.hasFields():
+      items.write(T['fields_call'](name=abbr2name(owner.abbreviation), prefix='NULL'))
+   for chunk in tree_chunks.values():
+      items.write(T['chunk_read'](name=chunk.name, read=chunk.read))
+   items.write(T['dissect_fxn_item'](name        = name,
+                                     endian      = "BIG" if dispatchable_obj.endian == Constants.endian['big'] else "LITTLE",
+                                     proto_or_hf = "proto" if dispatchable_obj.getTag() == Protocol.tag() else "hf",
+                                     length      = ws_chunks2bytes(position.chunksize, position.chunklength),
+                                     offset      = position.index
+                                    ))
+   items.write(T['dissect_fxn_tree'](name=name))
    if ws_has_section(dispatchable_obj, 'header'):
-      cfile.write('{indent}dissect_{name}(tvb, pinfo, pTree);\n'.format(name = abbr2name(dispatchable_obj.header.abbreviation), indent = _ws_text['indent']))
-   if ws_has_section(dispatchable_obj, 'fields'):
-      for f in dispatchable_obj.fields.values():
-         cfile.write('{indent}proto_tree_add_item(pTree, hf_{name}, tvb, {offset}, {length}, ENC_{endian}_ENDIAN);\n'.format(indent = _ws_text['indent'],
-                                                                                                                             name   = abbr2name(f.description.abbreviation),
-                                                                                                                             endian = "BIG" if f.endian == Constants.endian['big'] else "LITTLE",
-                                                                                                                             length = ws_chunks2bytes(f.position.chunksize, f.position.chunklength),
-                                                                                                                             offset = f.position.index
-                                                                                                                            ))
-         if f.ftype in ('weighted', 'unsigned weighted'):
-            sz = ws_field_size(f)
-            cfile.write('{indent}{value_expr};\n'.format(indent     = _ws_text['indent'],
-                                                         value_expr = ws_field_value(f, return_field='dblValue')
-                                                        ))
-            cfile.write('{indent}psubI = proto_tree_add_double_format_value(pTree, hf_{name}, tvb, {byteoffset}, {bytelength}, dblValue, "%f", dblValue);\n'.format(indent     = _ws_text['indent'],
-                                                                                                                                                                     name       = abbr2name('.'.join([f.description.abbreviation, 'scaled'])),
-                                                                                                                                                                     endian     = "BIG" if f.endian == Constants.endian['big'] else "LITTLE",
-                                                                                                                                                                     bytelength = ws_chunks2bytes(f.position.chunksize, f.position.chunklength),
-                                                                                                                                                                     byteoffset = ws_chunks2bytes(f.position.chunksize, f.position.index)
-                                                                                                                                                                    ))
-            cfile.write('{indent}PROTO_ITEM_SET_GENERATED(psubI);\n'.format(indent = _ws_text['indent']))
+      items.write(T['dissect_call'](name=abbr2name(ws_section_abbreviation(dispatchable_obj.header, shared))))
+   for f in fields:
+      group = grouped.get(id(f))
+      if group is not None:
+         #a group is added in place of its first field
+         if group.fields[0] is f:
+            items.write(T['field_bits_item'](name   = abbr2name(group.abbreviation),
+                                             offset = group.offset,
+                                             fields = group.array,
+                                             endian = group.endian))
+         continue
+      items.write(ws_field_item(f))
+      if f.ftype in ('weighted', 'unsigned weighted'):
+         items.write(T['statement'](statement=ws_field_value(f, return_field='dblValue', cached=True)))
+         items.write(T['field_scaled_item'](name       = abbr2name('.'.join([f.description.abbreviation, 'scaled'])),
+                                            bytelength = ws_chunks2bytes(f.position.chunksize, f.position.chunklength),
+                                            byteoffset = ws_chunks2bytes(f.position.chunksize, f.position.index)
+                                           ))
+   write_tree_block(cfile, items.getvalue())
    if any(c.getTag() == Expose.tag() for c in dispatchable_obj.children):
-      cfile.write('{indent}value = tvb_length(tvb);\n'.format(indent = _ws_text['indent']))
+      cfile.write(T['expose_length']())
       if ws_has_section(dispatchable_obj, 'header'):
-         cfile.write('{indent}value -= {length}; //header length\n'.format(indent = _ws_text['indent'], length = ws_chunks2bytes(dispatchable_obj.header.position.chunksize, dispatchable_obj.header.position.chunklength)))
+         cfile.write(T['expose_less'](section='header', length=ws_chunks2bytes(dispatchable_obj.header.position.chunksize, dispatchable_obj.header.position.chunklength)))
       if ws_has_section(dispatchable_obj, 'trailer'):
-         cfile.write('{indent}value -= {length}; //trailer length\n'.format(indent = _ws_text['indent'], length = ws_chunks2bytes(dispatchable_obj.trailer.position.chunksize, dispatchable_obj.trailer.position.chunklength)))
-      cfile.write('{indent}tvbr = tvb_new_subset(tvb, {offset}, value, value);\n'.format(indent = _ws_text['indent'],
-                                                                                            offset = ws_chunks2bytes(dispatchable_obj.header.position.chunksize, dispatchable_obj.header.position.chunklength) if ws_has_section(dispatchable_obj, 'header') else 0
-                                                                                           ))
+         cfile.write(T['expose_less'](section='trailer', length=ws_chunks2bytes(dispatchable_obj.trailer.position.chunksize, dispatchable_obj.trailer.position.chunklength)))
+      cfile.write(T['expose_subset'](offset=ws_chunks2bytes(dispatchable_obj.header.position.chunksize, dispatchable_obj.header.position.chunklength) if ws_has_section(dispatchable_obj, 'header') else 0))
       for table in (c for c in dispatchable_obj.children if isinstance(c, Expose)):
-         cfile.write('{indent}pTable = find_dissector_table("{name}");\n'.format(indent = _ws_text['indent'],
-                                                                                 name   = table.field
-                                                                                ))
-         tfield = dispatchable_obj.getField(table.field)
-         cfile.write('{indent}{value_expr};\n'.format(indent     = _ws_text['indent'],
-                                                      value_expr = ws_field_value(tfield)))
-         cfile.write('{indent}if(pTable)\n{indent}{{\n{indent}{indent}dissector_try_uint(pTable, value, tvbr, pinfo, tree);\n{indent}}}\n'.format(indent = _ws_text['indent']))
+         routes = ws_routes(dispatchable_obj, table.field)
+         lookup = ''.join([T['expose_table'](name=table.field), T['expose_try']()])
+         cfile.write(T['statement'](statement=ws_field_value(dispatchable_obj.getField(table.field), cached=True)))
+         if routes:
+            #enabled messages of this protocol are called directly, other values are left to the dissector table
+            cfile.write(T['expose_switch']())
+            for value, msg in routes.items():
+               cfile.write(T['expose_case'](value=value, name=abbr2name(msg.abbreviation)))
+               cfile.write(ws_indent_block(lookup))
+               cfile.write(T['expose_case_end']())
+            cfile.write(T['expose_default']())
+            cfile.write(ws_indent_block(lookup))
+            cfile.write(T['expose_switch_end']())
+         else:
+            cfile.write(lookup)
    if ws_has_section(dispatchable_obj, 'trailer'):
-      cfile.write('{indent}dissect_{name}(tvb, pinfo, pTree);\n'.format(indent = _ws_text['indent'],
-                                                                        name   = abbr2name(dispatchable_obj.trailer.abbreviation)
-                                                                       ))
-   cfile.write('}\n\n')
+      write_tree_block(cfile, T['dissect_call'](name=abbr2name(ws_section_abbreviation(dispatchable_obj.trailer, shared))))
+   cfile.write(T['fxn_end']())
 
-def write_register_fxn(dispatchable_obj, cfile):
-   cfile.write('{decl}\n{{\n'.format(**{'decl':_ws_text['register_fxn_decl'].format(name=abbr2name(dispatchable_obj.abbreviation))}))
+def write_register_fxn(dispatchable_obj, cfile, fragments=None, shared=None, lazy=False, linkage='static '):
+   T = _ws_templates
+   name = abbr2name(dispatchable_obj.abbreviation)
+   #a shared header or trailer is registered by the message that owns it
+   sections = [dispatchable_obj.header  if ws_has_section(dispatchable_obj, 'header') and not ws_is_shared_copy(dispatchable_obj.header, shared) else None,
+               dispatchable_obj         if ws_has_section(dispatchable_obj, 'fields') else None,
+               dispatchable_obj.trailer if ws_has_section(dispatchable_obj, 'trailer') and not ws_is_shared_copy(dispatchable_obj.trailer, shared) else None]
+   groups = [g for section in sections if section is not None for g in ws_bit_groups(section)]
    if dispatchable_obj.hasFields():
-      cfile.write('{indent}static hf_register_info hf[] = {{'.format(**{'indent':_ws_text['indent']}))
-      header_fields = ''
-      for section in [dispatchable_obj.header  if ws_has_section(dispatchable_obj, 'header') else None,
-                      dispatchable_obj         if ws_has_section(dispatchable_obj, 'fields') else None,
-                      dispatchable_obj.trailer if ws_has_section(dispatchable_obj, 'trailer') else None]:
+      if lazy:
+         #the header fields are registered by the first tree or display filter that needs them
+         cfile.write(T['fields_fxn_decl'](linkage=linkage, name=name))
+      else:
+         cfile.write(T['register_fxn_decl'](name=name))
+      cfile.write(T['register_hf_open']())
+      header_fields = []
+      for section in sections:
          if section is not None:
-            header_fields = ',\n'.join([header_fields, ws_header_field(section)])
+            header_fields.append(ws_header_field(section))
             for field in section.fields.values():
-               header_fields = ',\n'.join([header_fields, ws_header_field(field)])
+               header_fields.append(ws_header_field(field))
                if 'weighted' in field.ftype:
-                  header_fields = ',\n'.join([header_fields, ws_header_field(field, '.scaled', ' (scaled)', _ws_ftypes['double'])])
-      #if ws_has_section(dispatchable_obj, 'header'):
-      #   header_fields = ',\n'.join([header_fields, ws_header_field(dispatchable_obj.header)])
-      #   header_fields = ',\n'.join([header_fields, ',\n'.join(ws_header_field(f) for f in dispatchable_obj.header.fields.values())])
-      #if ws_has_section(dispatchable_obj, 'fields'):
-      #   header_fields = ',\n'.join([header_fields, ',\n'.join(ws_header_field(f) for f in dispatchable_obj.fields.values())])
-      #if ws_has_section(dispatchable_obj, 'trailer'):
-      #   header_fields = ',\n'.join([header_fields, ws_header_field(dispatchable_obj.trailer)])
-      #   header_fields = ',\n'.join([header_fields, ',\n'.join(ws_header_field(f) for f in dispatchable_obj.trailer.fields.values())])
-      #if isinstance(dispatchable_obj, Message):
-      #   header_fields = ',\n'.join([header_fields, ws_header_field(dispatchable_obj)])
-      cfile.write(header_fields.lstrip(',').replace('\n,\n','\n'))
-      cfile.write('\n{indent}}};\n'.format(**{'indent':_ws_text['indent']}))
-   cfile.write('{indent}static gint *ett[] = {{\n'.format(**{'indent':_ws_text['indent']}))
-   cfile.write('{indent}{indent}&ett_{ett}'.format(**{'indent':_ws_text['indent'], 'ett':abbr2name(dispatchable_obj.abbreviation)}))
-   if ws_has_section(dispatchable_obj, 'header'):
-      cfile.write(',\n{indent}{indent}&ett_{ett}'.format(**{'indent':_ws_text['indent'], 'ett':abbr2name(dispatchable_obj.header.abbreviation)}))
-   if ws_has_section(dispatchable_obj, 'trailer'):
-      cfile.write(',\n{indent}{indent}&ett_{ett}'.format(**{'indent':_ws_text['indent'], 'ett':abbr2name(dispatchable_obj.trailer.abbreviation)}))
-   cfile.write('\n{indent}}};\n'.format(**{'indent':_ws_text['indent']}))
+                  header_fields.append(ws_header_field(field, '.scaled', ' (scaled)', _ws_ftypes['double']))
+      header_fields.extend(ws_bit_group_field(g) for g in groups)
+      cfile.write(''.join(['\n', ',\n'.join(header_fields)]))
+      cfile.write(T['register_end']())
+      if lazy:
+         cfile.write(T['fields_fxn_once']())
+         cfile.write(T['register_fields'](name=name))
+         cfile.write(T['fxn_end']())
+   if lazy and isinstance(dispatchable_obj, Protocol) and ws_field_batches(dispatchable_obj):
+      #a display filter naming any field of the protocol registers all of them
+      cfile.write(T['prefix_fxn_decl'](name=name))
+      for batch in ws_field_batches(dispatchable_obj):
+         cfile.write(T['fields_call'](name=abbr2name(batch.abbreviation), prefix='prefix'))
+      cfile.write(T['fxn_end']())
+   if lazy or not dispatchable_obj.hasFields():
+      cfile.write(T['register_fxn_decl'](name=name))
+   cfile.write(T['register_ett_open']())
+   etts = [dispatchable_obj.abbreviation]
+   if sections[0] is not None:
+      etts.append(dispatchable_obj.header.abbreviation)
+   if sections[2] is not None:
+      etts.append(dispatchable_obj.trailer.abbreviation)
+   etts.extend(g.abbreviation for g in groups)
+   cfile.write(',\n'.join(T['register_ett'](name=abbr2name(e)) for e in etts))
+   cfile.write(T['register_end']())
    #note: the module_t* variables are needed for protocol preferences and other items we don't support yet
-   #cfile.write('{indent}module_t *module_{name};\n'.format(**{'indent':_ws_text['indent'], 'name':abbr2name(dispatchable_obj.abbreviation)}))
-   cfile.write('{indent}proto_{name} = proto_register_protocol("{protoname}", "{brief}", "{abbreviation}");\n'.format(indent       = _ws_text['indent'], 
-                                                                                                                      name         = abbr2name(dispatchable_obj.abbreviation),
-                                                                                                                      protoname    = dispatchable_obj.description.name,
-                                                                                                                      brief        = dispatchable_obj.description.brief,
-                                                                                                                      abbreviation = dispatchable_obj.description.abbreviation
-                                                                                                                     ))
-   cfile.write('{indent}handle_{name} = create_dissector_handle(dissect_{name}, proto_{name});\n'.format(**{'indent':_ws_text['indent'], 'name':abbr2name(dispatchable_obj.abbreviation)}))
-   if dispatchable_obj.hasFields():
-      cfile.write('{indent}proto_register_field_array(proto_{name}, hf, array_length(hf));\n'.format(**{'indent':_ws_text['indent'], 'name':abbr2name(dispatchable_obj.abbreviation)}))
-   cfile.write('{indent}proto_register_subtree_array(ett, array_length(ett));\n'.format(**{'indent':_ws_text['indent']}))
+   cfile.write(T['register_proto'](name         = name,
+                                   protoname    = dispatchable_obj.description.name,
+                                   brief        = dispatchable_obj.description.brief,
+                                   abbreviation = dispatchable_obj.description.abbreviation
+                                  ))
+   cfile.write(T['register_handle'](name=name))
+   if dispatchable_obj.hasFields() and not lazy:
+      cfile.write(T['register_fields'](name=name))
+   cfile.write(T['register_subtrees']())
+   if lazy and isinstance(dispatchable_obj, Protocol) and ws_field_batches(dispatchable_obj):
+      cfile.write(T['register_prefix'](name=name, abbreviation=dispatchable_obj.description.abbreviation))
    for table in (c for c in dispatchable_obj.children if isinstance(c, Expose)):
       field = dispatchable_obj.getField(table.field)
-      cfile.write('{indent}register_dissector_table("{field}", "{descr}", FT_{ftype}, BASE_{btype});\n'.format(indent = _ws_text['indent'],
-                                                                                                               field  = table.field,
-                                                                                                               descr  = field.description.brief,
-                                                                                                               ftype  = ws_field_ftype(field),
-                                                                                                               btype  = ws_field_basetype(field)
-                                                                                                              ))
-   cfile.write('}\n\n')
+      cfile.write(T['register_table'](field = table.field,
+                                      descr = field.description.brief,
+                                      ftype = ws_field_ftype(field),
+                                      btype = ws_field_basetype(field)
+                                     ))
+   cfile.write(T['fxn_end']())
    if ws_has_section(dispatchable_obj, 'messages'):
       for m in dispatchable_obj.messages.values():
-         write_register_fxn(m, cfile)
+         if fragments is not None:
+            cfile.write(fragments[m.abbreviation].register)
+         else:
+            write_register_fxn(m, cfile, shared=shared, lazy=lazy, linkage=linkage)
+
+##
+# @name ws_field_batches
+# @brief Lists the nodes of a protocol that register a header field array
+# @param dispatchable_obj [in] The protocol
+# @return list The protocol, if it has header fields, followed by the messages that have them
+def ws_field_batches(dispatchable_obj):
+   return [node for node in ws_route_nodes(dispatchable_obj) if node.hasFields()]
+
+##
+# @name ws_registration_report
+# @brief Counts the header fields registered at startup and on first use, and logs the counts
+# @param dispatchable_obj [in] The protocol
+# @param namespace [in] The dispatched namespace of the protocol
+# @param lazy [in] Whether header fields are registered on first use
+# @return str The counts, as a C comment
+def ws_registration_report(dispatchable_obj, namespace, lazy):
+   count   = len(ws_hf_ids(namespace))
+   batches = len(ws_field_batches(dispatchable_obj)) if lazy else 0
+   mode    = 'lazy' if lazy else 'eager'
+   _logger.info('Registration ({}): {} header fields at startup, {} on first use in {} batches'.format(mode, 0 if lazy else count, count if lazy else 0, batches))
+   return _ws_templates['registration_report'](mode=mode, startup=0 if lazy else count, deferred=count if lazy else 0, batches=batches)
 
-def write_handoff_fxn(dispatchable_obj, cfile, local_handles):
-   cfile.write('{decl}\n{{\n'.format(**{'decl':_ws_text['handoff_fxn_decl'].format(name=abbr2name(dispatchable_obj.abbreviation))}))
+def write_handoff_fxn(dispatchable_obj, cfile, local_handles, fragments=None):
+   T = _ws_templates
+   cfile.write(T['handoff_fxn_decl'](name=abbr2name(dispatchable_obj.abbreviation)))
    _local_handles = ['handle_{name}'.format(name = abbr2name(l.abbreviation)) for l in local_handles.values()]
    handles = set()
-   joins = [j for j in dispatchable_obj.children if isinstance(j, Register)]
+   #joins to tables of this protocol are dispatched with a switch rather than through the table
+   local_tables = ws_local_tables(dispatchable_obj)
+   joins = [j for j in dispatchable_obj.children if isinstance(j, Register) and j.table not in local_tables]
    for j in joins:
       handles.add('handle_{name}'.format(name = abbr2name(j.parent.abbreviation)))
    for h in handles:
       if h not in _local_handles:
-         cfile.write('{indent}dissector_handle_t {handle};\n'.format(indent = _ws_text['indent'], handle = h))
+         cfile.write(T['handoff_handle'](handle=h))
    for j in joins:
       if h not in _local_handles:
-         cfile.write('{indent}handle_{name} = find_dissector("{name}");\n'.format(indent = _ws_text['indent'], name=abbr2name(j.parent.abbreviation)))
-      cfile.write('{indent}dissector_add_uint("{table}", {value}, handle_{name});\n'.format(indent = _ws_text['indent'],
-                                                                                            table  = j.table,
-                                                                                            value  = j.value,
-                                                                                            name   = abbr2name(j.parent.abbreviation)))
-   cfile.write('}\n\n')
+         cfile.write(T['handoff_find'](name=abbr2name(j.parent.abbreviation)))
+      cfile.write(T['handoff_add'](table = j.table,
+                                   value = j.value,
+                                   name  = abbr2name(j.parent.abbreviation)))
+   cfile.write(T['fxn_end']())
    if ws_has_section(dispatchable_obj, 'messages'):
       for m in dispatchable_obj.messages.values():
-         write_handoff_fxn(m, cfile, local_handles)
+         if fragments is not None:
+            cfile.write(fragments[m.abbreviation].handoff)
+         else:
+            write_handoff_fxn(m, cfile, local_handles)
+
+##
+# @name ws_route_nodes
+# @brief Lists the nodes of a protocol that may hold <ws:expose> and <ws:register> elements
+# @param dispatchable_obj [in] Any node of the protocol
+# @return list The protocol followed by its messages
+def ws_route_nodes(dispatchable_obj):
+   while dispatchable_obj.parent is not None:
+      dispatchable_obj = dispatchable_obj.parent
+   return [dispatchable_obj] + list(dispatchable_obj.messages.values())
+
+##
+# @name ws_local_tables
+# @brief Lists the dissector tables exposed by a protocol
+# @param dispatchable_obj [in] Any node of the protocol
+# @return set The table names
+def ws_local_tables(dispatchable_obj):
+   return set(c.field for node in ws_route_nodes(dispatchable_obj) for c in node.children if isinstance(c, Expose))
+
+##
+# @name ws_routes
+# @brief Lists the nodes of a protocol registered in one of its own dissector tables
+# @details A value registered more than once routes to its last node, as the repeated
+#          dissector_add_uint calls of the handoff leave it.
+# @param dispatchable_obj [in] Any node of the protocol
+# @param table [in] The table name
+# @return OrderedDict The registered nodes, keyed and sorted by discriminator value
+# @throws DispatchError When a value is not an integer
+def ws_routes(dispatchable_obj, table):
+   routes = {}
+   for node in ws_route_nodes(dispatchable_obj):
+      for j in (c for c in node.children if isinstance(c, Register) and c.table == table):
+         try:
+            value = int(j.value, 0)
+         except ValueError:
+            raise DispatchError("<{}> has non-integer value '{}' for table '{}'".format(Register.tag(), j.value, table))
+         if value in routes:
+            _logger.warning("More than one <{}> for value {} of table '{}', {} replaces {}".format(Register.tag(), value, table, node.abbreviation, routes[value].abbreviation))
+         routes[value] = node
+   return OrderedDict(sorted(routes.items()))
+
+##
+# @brief The rendered dissect_, proto_register_ and proto_reg_handoff_ functions of one message.
+MessageFragments = namedtuple('MessageFragments', ['dissect', 'register', 'handoff'])
+
+##
+# @brief The protocol, dissector handles, linkage, shared sections and registration mode used by the worker processes of a parallel dispatch.
+_pool_state = None
+
+##
+# @name _pool_init
+# @brief Initializes a worker process of a parallel dispatch.
+# @param protocol [in] The protocol being dispatched
+# @param local_handles [in] The dissector handles declared in the protocol's source file
+# @param linkage [in] The linkage of the dissect_ functions
+# @param shared [in] The canonical abbreviation of each header and trailer
+# @param lazy [in] Whether header fields are registered on first use
+def _pool_init(protocol, local_handles, linkage, shared, lazy):
+   global _pool_state
+   _pool_state = (protocol, local_handles, linkage, shared, lazy)
+
+##
+# @name _pool_render
+# @brief Renders one message of the protocol held by the worker process.
+# @param abbreviation [in] The message abbreviation
+# @return MessageFragments The rendered functions
+def _pool_render(abbreviation):
+   protocol, local_handles, linkage, shared, lazy = _pool_state
+   return render_message(protocol.messages[abbreviation], local_handles, linkage, shared, lazy)
+
+##
+# @name render_message
+# @brief Renders the functions of one message.
+# @param msg [in] The message
+# @param local_handles [in] The dissector handles declared in the protocol's source file
+# @param linkage [in] The linkage of the dissect_ functions
+# @param shared [in] The canonical abbreviation of each header and trailer, or None
+# @param lazy [in] Whether header fields are registered on first use
+# @return MessageFragments The rendered functions
+def render_message(msg, local_handles, linkage='static ', shared=None, lazy=False):
+   dissect, register, handoff = io.StringIO(), io.StringIO(), io.StringIO()
+   write_dissect_fxn(msg, dissect, linkage=linkage, shared=shared, lazy=lazy)
+   write_register_fxn(msg, register, shared=shared, lazy=lazy, linkage=linkage)
+   write_handoff_fxn(msg, handoff, local_handles)
+   return MessageFragments(dissect.getvalue(), register.getvalue(), handoff.getvalue())
+
+##
+# @name render_messages
+# @brief Renders the functions of every message of a protocol, in a pool of worker processes when jobs > 1.
+# @details Each message is rendered independently, and the results are keyed in message order,
+#          so the assembled output is identical to the serial output.
+# @param protocol [in] The protocol being dispatched
+# @param local_handles [in] The dissector handles declared in the protocol's source file
+# @param linkage [in] The linkage of the dissect_ functions
+# @param jobs [in] The number of worker processes
+# @param shared [in] The canonical abbreviation of each header and trailer, or None
+# @param lazy [in] Whether header fields are registered on first use
+# @return OrderedDict The MessageFragments for each message abbreviation
+def render_messages(protocol, local_handles, linkage, jobs, shared=None, lazy=False):
+   abbreviations = list(protocol.messages.keys())
+   if jobs <= 1 or len(abbreviations) <= 1:
+      return OrderedDict((a, render_message(protocol.messages[a], local_handles, linkage, shared, lazy)) for a in abbreviations)
+   _logger.debug('Rendering {} messages with {} jobs'.format(len(abbreviations), jobs))
+   with multiprocessing.Pool(processes=jobs, initializer=_pool_init, initargs=(protocol, local_handles, linkage, shared, lazy)) as pool:
+      rendered = pool.map(_pool_render, abbreviations, chunksize=max(1, len(abbreviations) // (jobs * 4)))
+   return OrderedDict(zip(abbreviations, rendered))
+
+##
+# @brief The source files of a generated dissector.
+# @details register lists the files holding proto_register_ and proto_reg_handoff_ functions,
+#          support lists the other source files, and headers lists the header files.
+SourceLayout = namedtuple('SourceLayout', ['register', 'support', 'headers'])
+
+##
+# @name ws_message_weight
+# @brief Estimates the amount of code generated for a message.
+# @param msg [in] The message
+# @return int The number of fields dissected by the message's functions, plus one
+def ws_message_weight(msg):
+   weight = 1 + len(msg.fields)
+   for section in ('header', 'trailer'):
+      if ws_has_section(msg, section):
+         weight += 1 + len(getattr(msg, section).fields)
+   return weight
+
+##
+# @name ws_shards
+# @brief Groups the messages of a protocol into dissector shards.
+# @details Messages keep their order, and each shard receives a contiguous run of messages
+#          with roughly the same amount of generated code.
+# @param dispatchable_obj [in] The protocol
+# @param count [in] The requested number of shards
+# @return list A list of non-empty lists of messages
+def ws_shards(dispatchable_obj, count):
+   messages = list(dispatchable_obj.messages.values())
+   count    = min(count, len(messages))
+   weights  = [ws_message_weight(m) for m in messages]
+   total    = sum(weights)
+   shards   = [[] for s in range(count)]
+   done     = 0
+   for msg, weight in zip(messages, weights):
+      shards[min(count - 1, done * count // total)].append(msg)
+      done += weight
+   return [shard for shard in shards if shard]
+
+##
+# @name ws_source_layout
+# @brief Lists the source files generated for a protocol.
+# @param dispatchable_obj [in] The protocol
+# @param shards [in] The dissector shards, or None for a single source file
+# @return SourceLayout The generated files
+def ws_source_layout(dispatchable_obj, shards):
+   abbr = dispatchable_obj.abbreviation
+   if shards is None:
+      return SourceLayout(['packet-{}.c'.format(abbr)], [], ['packet-{}.h'.format(abbr), 'transmute_ws_runtime.h'])
+   return SourceLayout(['packet-{}-register.c'.format(abbr), 'packet-{}-handoff.c'.format(abbr)],
+                       ['packet-{}.c'.format(abbr)] + ['packet-{}-dissect-{}.c'.format(abbr, s + 1) for s in range(len(shards))],
+                       ['packet-{}.h'.format(abbr), 'packet-{}-int.h'.format(abbr), 'transmute_ws_runtime.h'])
+
+##
+# @name ws_file_list
+# @brief Formats a list of files as the continued lines of a make variable.
+# @param files [in] The file names
+# @return list The lines
+def ws_file_list(files):
+   return [''.join(['\t', f, ' \\' if i < len(files) - 1 else '']) for i,f in enumerate(files)]
+
+##
+# @name ws_hf_ids
+# @brief Lists the header field ids of a protocol.
+# @param namespace [in] The dispatched namespace of the protocol
+# @return list The names of the hf_ ids
+def ws_hf_ids(namespace):
+   ids = []
+   for field in namespace['fields'].values():
+      ids.append(abbr2name(field.abbreviation))
+      if 'weighted' in field.ftype:
+         ids.append(abbr2name('.'.join([field.abbreviation,'scaled'])))
+   for section in ('messages', 'headers', 'trailers'):
+      ids.extend(abbr2name(s.abbreviation) for s in namespace[section].values())
+   ids.extend(ws_bit_group_ids(namespace))
+   return ids
+
+##
+# @name ws_ett_ids
+# @brief Lists the subtree ids of a protocol.
+# @param namespace [in] The dispatched namespace of the protocol
+# @return list The names of the ett_ ids
+def ws_ett_ids(namespace):
+   return [abbr2name(tree.abbreviation) for tree in namespace['trees'].values()] + ws_bit_group_ids(namespace)
+
+##
+# @name ws_bit_group_ids
+# @brief Lists the ids of the bit field groups of a protocol, which have both a header field and a subtree.
+# @param namespace [in] The dispatched namespace of the protocol
+# @return list The names of the ids
+def ws_bit_group_ids(namespace):
+   return [abbr2name(g.abbreviation) for tree in namespace['trees'].values() for g in ws_bit_groups(tree)]
+
+##
+# @name write_internal_header
+# @brief Writes the header shared by the source files of a sharded dissector.
+# @details The ids, trees, handles and dissect_ functions are declared here, since the
+#          source files that define them are compiled separately from the ones that use them.
+# @param folder [in] The output folder
+# @param dispatchable_obj [in] The protocol
+# @param sink [in] The output sink
+# @param namespace [in] The dispatched namespace of the protocol
+# @param lazy [in] Whether header fields are registered on first use
+def write_internal_header(folder, dispatchable_obj, sink, namespace, lazy=False):
+   T = _ws_templates
+   with sink.open(os.path.join(folder, 'packet-{}-int.h'.format(dispatchable_obj.abbreviation))) as hfile:
+      hfile.write(T['header_comment'](filename=hfile.name, description="The internal header file for the {} protocol".format(dispatchable_obj.name)))
+      hfile.write(T['include_guard'](guard=ws_include_guard(hfile)))
+      hfile.write(T['source_includes'](name=dispatchable_obj.abbreviation))
+      hfile.write(T['id_decl'](kind='proto', name=abbr2name(dispatchable_obj.abbreviation)))
+      for m in dispatchable_obj.messages.values():
+         hfile.write(T['id_decl'](kind='proto', name=abbr2name(m.abbreviation)))
+      hfile.write('/* Header Fields */\n')
+      for hf in ws_hf_ids(namespace):
+         hfile.write(T['id_decl'](kind='hf', name=hf))
+      hfile.write('/* Trees */\n')
+      for ett in ws_ett_ids(namespace):
+         hfile.write(T['ett_decl'](name=ett))
+      hfile.write('/* Dissector Handles */\n')
+      for handle in namespace['handles'].values():
+         hfile.write(T['handle_decl'](name=abbr2name(handle.abbreviation)))
+      hfile.write('/* dissect_ Functions */\n')
+      for tree in namespace['trees'].values():
+         hfile.write(T['dissect_fxn_proto'](linkage='', name=abbr2name(tree.abbreviation)))
+      if lazy:
+         hfile.write('/* register_fields_ Functions */\n')
+         for batch in ws_field_batches(dispatchable_obj):
+            hfile.write(T['fields_fxn_proto'](linkage='', name=abbr2name(batch.abbreviation)))
+      hfile.write(T['include_guard_end'](guard=ws_include_guard(hfile)))
+
+##
+# @name write_runtime_header
+# @brief Writes the header of helper functions called by the generated dissectors.
+# @param folder [in] The output folder
+# @param sink [in] The output sink
+def write_runtime_header(folder, sink):
+   T = _ws_templates
+   with sink.open(os.path.join(folder, 'transmute_ws_runtime.h')) as hfile:
+      hfile.write(T['header_comment'](filename=hfile.name, description="Helper functions shared by transmute generated dissectors"))
+      hfile.write(T['include_guard'](guard=ws_include_guard(hfile)))
+      hfile.write('#include <glib.h>\n\n')
+      hfile.write(T['runtime_helpers']())
+      hfile.write(T['include_guard_end'](guard=ws_include_guard(hfile)))
 
-def write_cmake_file(folder, dispatchable_obj):
-   with open(os.path.join(folder, 'CMakeLists.txt'), 'w') as cmakefile:
+##
+# @name write_shard_files
+# @brief Writes the registration, handoff and dissector shard source files of a sharded dissector.
+# @param folder [in] The output folder
+# @param dispatchable_obj [in] The protocol
+# @param sink [in] The output sink
+# @param namespace [in] The dispatched namespace of the protocol
+# @param shards [in] The messages of each dissector shard
+# @param fragments [in] The rendered functions of each message
+# @param shared [in] The canonical abbreviation of each header and trailer, or None
+# @param lazy [in] Whether header fields are registered on first use
+def write_shard_files(folder, dispatchable_obj, sink, namespace, shards, fragments, shared=None, lazy=False):
+   T    = _ws_templates
+   abbr = dispatchable_obj.abbreviation
+   with sink.open(os.path.join(folder, 'packet-{}-register.c'.format(abbr))) as cfile:
+      cfile.write(T['header_comment'](filename=cfile.name, description="The registration functions for the {} protocol".format(dispatchable_obj.name)))
+      cfile.write(T['source_includes'](name='{}-int'.format(abbr)))
+      cfile.write('/* proto_register_ Functions */\n')
+      cfile.write(ws_registration_report(dispatchable_obj, namespace, lazy))
+      write_register_fxn(dispatchable_obj, cfile, fragments, shared, lazy, linkage='')
+   with sink.open(os.path.join(folder, 'packet-{}-handoff.c'.format(abbr))) as cfile:
+      cfile.write(T['header_comment'](filename=cfile.name, description="The handoff functions for the {} protocol".format(dispatchable_obj.name)))
+      cfile.write(T['source_includes'](name='{}-int'.format(abbr)))
+      cfile.write('/* proto_reg_handoff_ Functions */\n')
+      write_handoff_fxn(dispatchable_obj, cfile, namespace['handles'], fragments)
+   for number, shard in enumerate(shards, 1):
+      with sink.open(os.path.join(folder, 'packet-{}-dissect-{}.c'.format(abbr, number))) as cfile:
+         messages = shard[0].abbreviation if len(shard) == 1 else '{} to {}'.format(shard[0].abbreviation, shard[-1].abbreviation)
+         cfile.write(T['header_comment'](filename=cfile.name, description="The {} dissectors for the {} protocol".format(messages, dispatchable_obj.name)))
+         cfile.write(T['source_includes'](name='{}-int'.format(abbr)))
+         cfile.write('/* dissect_ Functions */\n')
+         for msg in shard:
+            cfile.write(fragments[msg.abbreviation].dissect)
+
+def write_cmake_file(folder, dispatchable_obj, sink, layout):
+   support = (['set(DISSECTOR_SUPPORT_SRC'] + ['\t{}'.format(f) for f in layout.support] + [')', '']) if layout.support else []
+   with sink.open(os.path.join(folder, 'CMakeLists.txt')) as cmakefile:
       cmakefile.write('\n'.join(['# This file automatically generated using Transmute',
                                  'include(WiresharkPlugin)',
                                  'set_module_info({name} {major} {minor} {micro} {extra})'.format(name=dispatchable_obj.abbreviation, **dispatchable_obj.version.data), 
-                                 'set(DISSECTOR_SRC',
-                                 '\tpacket-{}.c'.format(dispatchable_obj.abbreviation),
-                                 ')',
-                                 '',
-                                 'set(PLUGIN_FILES',
+                                 'set(DISSECTOR_SRC'] +
+                                ['\t{}'.format(f) for f in layout.register] +
+                                [')',
+                                 ''] +
+                                support +
+                                ['set(PLUGIN_FILES',
                                  '\tplugin.c',
-                                 '\t${DISSECTOR_SRC}',
-                                 ')',
+                                 '\t${DISSECTOR_SRC}'] +
+                                (['\t${DISSECTOR_SUPPORT_SRC}'] if layout.support else []) +
+                                [')',
                                  '',
                                  'set(CLEAN_FILES',
                                  '\t${PLUGIN_FILES}',
@@ -631,7 +1333,7 @@ def write_cmake_file(folder, dispatchable_obj):
                                  '']
                      ))
    
-def write_moduleinfo_file(folder, dispatchable_obj):
+def write_moduleinfo_file(folder, dispatchable_obj, sink):
    vinfo = dispatchable_obj.version.data
    for k in ['major', 'minor', 'micro', 'extra']:
       try:
@@ -642,7 +1344,7 @@ def write_moduleinfo_file(folder, dispatchable_obj):
       except ValueError as ve:
          _logger.info('<{}> {} version is missing {}, using default'.format(dispatchable_obj.getTag(), dispatchable_obj.name, ve))
          vinfo[k] = '0'
-   with open(os.path.join(folder, 'moduleinfo.nmake'), 'w') as mfile:
+   with sink.open(os.path.join(folder, 'moduleinfo.nmake')) as mfile:
       mfile.write('\n'.join(['# This file automatically generated using Transmute',
                              'PACKAGE={}'.format(dispatchable_obj.abbreviation),
                              'MODULE_VERSION_MAJOR={}'.format(dispatchable_obj.version.data['major']),
@@ -654,20 +1356,20 @@ def write_moduleinfo_file(folder, dispatchable_obj):
                              '']
                  ))
 
-def write_makefile_common(folder, dispatchable_obj):
-   with open(os.path.join(folder, 'Makefile.common'), 'w') as mfile:
+def write_makefile_common(folder, dispatchable_obj, sink, layout):
+   with sink.open(os.path.join(folder, 'Makefile.common')) as mfile:
       mfile.write('\n'.join(['# This file automatically generated using Transmute',
                              'PLUGIN_NAME = {}'.format(dispatchable_obj.abbreviation),
                              '',
-                             'NONGENERATED_REGISTER_C_FILES = \\',
-                             '\tpacket-{}.c'.format(dispatchable_obj.abbreviation),
-                             '',
-                             'NONGENERATED_C_FILES = \\',
-                             '\t$(NONGENERATED_REGISTER_C_FILES)',
-                             '',
-                             'CLEAN_HEADER_FILES = \\',
-                             '\tpacket-{}.h'.format(dispatchable_obj.abbreviation),
-                             '',
+                             'NONGENERATED_REGISTER_C_FILES = \\'] +
+                             ws_file_list(layout.register) +
+                            ['',
+                             'NONGENERATED_C_FILES = \\'] +
+                             ws_file_list(['$(NONGENERATED_REGISTER_C_FILES)'] + layout.support) +
+                            ['',
+                             'CLEAN_HEADER_FILES = \\'] +
+                             ws_file_list(layout.headers) +
+                            ['',
                              'HEADER_FILES = \\',
                              '\t$(CLEAN_HEADER_FILES)',
                              '',
@@ -675,8 +1377,8 @@ def write_makefile_common(folder, dispatchable_obj):
                              '']
                  ))
 
-def write_makefile_am(folder, dispatchable_obj):
-   with open(os.path.join(folder, 'Makefile.am'), 'w') as mfile:
+def write_makefile_am(folder, dispatchable_obj, sink):
+   with sink.open(os.path.join(folder, 'Makefile.am')) as mfile:
       mfile.write('\n'.join(['# This file automatically generated using Transmute',
                              'include $(top_srcdir)/Makefile.am.inc',
                              '',
@@ -731,8 +1433,8 @@ def write_makefile_am(folder, dispatchable_obj):
                              '']
                  ))
 
-def write_makefile_nmake(folder, dispatchable_obj):
-   with open(os.path.join(folder, 'Makefile.nmake'), 'w') as mfile:
+def write_makefile_nmake(folder, dispatchable_obj, sink):
+   with sink.open(os.path.join(folder, 'Makefile.nmake')) as mfile:
       mfile.write('\n'.join(['# This file automatically generated using Transmute',
                              'include ..\\..\\config.nmake',
                              'include ..\\..\\Makefile.nmake.inc',
@@ -795,8 +1497,8 @@ def write_makefile_nmake(folder, dispatchable_obj):
                              '']
                  ))
 
-def write_plugin_rc_in(folder, dispatchable_obj):
-   with open(os.path.join(folder, 'plugin.rc.in'), 'w') as mfile:
+def write_plugin_rc_in(folder, dispatchable_obj, sink):
+   with sink.open(os.path.join(folder, 'plugin.rc.in')) as mfile:
       mfile.write('\n'.join([r'#include "winver.h"',
                              r'',
                              r'VS_VERSION_INFO VERSIONINFO',
@@ -834,8 +1536,8 @@ def write_plugin_rc_in(folder, dispatchable_obj):
                              r'']
                            ))
 
-def write_moduleinfo_h(folder, dispatchable_obj):
-   with open(os.path.join(folder, 'moduleinfo.h'), 'w') as mfile:
+def write_moduleinfo_h(folder, dispatchable_obj, sink):
+   with sink.open(os.path.join(folder, 'moduleinfo.h')) as mfile:
       mfile.write('\n'.join(['/* Automatically generated using Transmute',
                              '   Included *after* config.h, in order to re-define these macros */',
                              '',
@@ -873,17 +1575,27 @@ def dispatch_node(dispatchable_obj, namespace):
       namespace['handles'][dispatchable_obj.abbreviation] = dispatchable_obj
       namespace['trees'][dispatchable_obj.abbreviation] = dispatchable_obj
    elif dispatchable_obj.getTag() == Values.tag():
-      if dispatchable_obj.name in (set(namespace['enums'].keys()) | set(namespace['value_strings'].keys()) | set(namespace['true_false_strings'].keys())):
-         if len(dispatchable_obj):
+      if any(dispatchable_obj.name in namespace[k] for k in ('enums', 'value_strings', 'range_strings', 'true_false_strings')):
+         #interned anonymous values are reached once for each field that shares them
+         if len(dispatchable_obj) and namespace['definitions'][dispatchable_obj.name] is not dispatchable_obj:
             raise DispatchError("More than one enumeration with name {name}".format(name = dispatchable_obj.name))
       else:
          if not len(dispatchable_obj):
             raise DispatchError("Enumeration '{name}' referenced before definition".format(name = dispatchable_obj.name))
-         namespace['enums'][dispatchable_obj.name] = _ws_text['enum'].format(name=dispatchable_obj.name, values=',\n'.join([_ws_text['enum_value'].format(indent=_ws_text['indent'], name=v, value=dispatchable_obj.values[v].ival) for v in dispatchable_obj.values]))
+         T = _ws_templates
+         namespace['definitions'][dispatchable_obj.name] = dispatchable_obj
+         namespace['enums'][dispatchable_obj.name] = T['enum'](name=dispatchable_obj.name, values=',\n'.join([T['enum_value'](name=v, value=dispatchable_obj.values[v].ival) for v in dispatchable_obj.values]))
          if is_tfs(dispatchable_obj):
-            namespace['true_false_strings'][dispatchable_obj.name] = "{indent}{tfs}".format(**{'indent':_ws_text['indent'], 'tfs':_ws_text['true_false_string'].format(name=dispatchable_obj.name, vtrue=tfg_get(dispatchable_obj,1),vfalse=tfs_get(dispatchable_obj,0))})
+            namespace['true_false_strings'][dispatchable_obj.name] = T['true_false_string'](name=dispatchable_obj.name, vtrue=tfs_get(dispatchable_obj,1), vfalse=tfs_get(dispatchable_obj,0))
          else:
-            namespace['value_strings'][dispatchable_obj.name] = "{vs}".format(vs = _ws_text['value_string'].format(name=dispatchable_obj.name, indent=_ws_text['indent'], values=',\n'.join([_ws_text['vs_value'].format(name=v, indent=_ws_text['indent']) for v in dispatchable_obj.values.keys()])))
+            rep = ws_enum_representation(dispatchable_obj)
+            namespace['representations'][dispatchable_obj.name] = rep
+            if rep.kind == 'range_string':
+               namespace['range_strings'][dispatchable_obj.name] = T['range_string'](name=dispatchable_obj.name, values=',\n'.join([T['rs_value'](first=first, last=last, name=v) for first, last, v in rep.entries]))
+            else:
+               namespace['value_strings'][dispatchable_obj.name] = T['value_string'](name=dispatchable_obj.name, values=',\n'.join([T['vs_value'](name=v) for first, last, v in rep.entries]))
+               if rep.kind == 'value_string_ext':
+                  namespace['value_string_exts'][dispatchable_obj.name] = T['value_string_ext'](name=dispatchable_obj.name)
    elif dispatchable_obj.getTag() == Expose.tag():
       if dispatchable_obj.field in namespace['tables']:
          raise DispatchError("More than one <{}> with name '{}'".format(Expose.tag(), dispatchable_obj.field))
@@ -904,19 +1616,20 @@ def dispatch_node(dispatchable_obj, namespace):
    for child in dispatchable_obj.children:
       dispatch_node(child, namespace)
 
-def dispatch(dispatchable_obj):
+def dispatch(dispatchable_obj, sink):
    if args_ns.wireshark and dispatchable_obj.getTag() == Protocol.tag():
       _logger.debug('Beginning dispatch for {} protocol'.format(dispatchable_obj.name))
       _logger.debug('args_ns is {}'.format(args_ns))
       folder = os.path.join(args_ns.path, dispatchable_obj.abbreviation)
       _logger.debug('Wireshark output to {}'.format(folder))
-      try:
-         force_folder(folder)
-      except ValueError as ve:
-         raise DispatchError(ve)
+      sink.folder(folder)
       
       namespace = { 'enums'              : OrderedDict(),
                     'value_strings'      : OrderedDict(),
+                    'value_string_exts'  : OrderedDict(),
+                    'range_strings'      : OrderedDict(),
+                    'representations'    : OrderedDict(),
+                    'definitions'        : OrderedDict(),
                     'true_false_strings' : OrderedDict(),
                     'fields'             : OrderedDict(),
                     'messages'           : OrderedDict(),
@@ -930,35 +1643,48 @@ def dispatch(dispatchable_obj):
       
       dispatch_node(dispatchable_obj, namespace)
       
-      with open(os.path.join(folder, 'packet-{}.c'.format(dispatchable_obj.abbreviation)), 'w') as cfile:
-         with open(os.path.join(folder, 'packet-{}.h'.format(dispatchable_obj.abbreviation)), 'w') as hfile:
-            hfile.write(_ws_text['header_comment'].format(**{'filename':hfile.name, 'description':"The header file for the {} protocol".format(dispatchable_obj.name)}))
-            hfile.write('#ifndef {include_guard}\n#define {include_guard}\n'.format(include_guard = ws_include_guard(hfile)))
-            cfile.write(_ws_text['header_comment'].format(**{'filename':cfile.name, 'description':"The implementation file for the {} protocol".format(dispatchable_obj.name)}))
+      #identical headers and trailers are dissected by the first of them
+      shared = ws_shared_sections(dispatchable_obj) if args_ns.share else None
+      if shared:
+         for section, canonical in shared.items():
+            if section != canonical:
+               _logger.info('{} is dissected as {}'.format(section, canonical))
+               for f in namespace['trees'].pop(section).fields.values():
+                  namespace['fields'].pop(f.abbreviation)
+               namespace['headers'].pop(section, None)
+               namespace['trailers'].pop(section, None)
+      
+      T         = _ws_templates
+      abbr      = dispatchable_obj.abbreviation
+      shards    = ws_shards(dispatchable_obj, args_ns.shards) if args_ns.shards > 1 else None
+      layout    = ws_source_layout(dispatchable_obj, shards)
+      linkage   = 'static ' if shards is None else ''
+      lazy      = args_ns.registration == 'lazy'
+      #messages are independent, so they can be rendered in parallel and assembled in order
+      fragments = None
+      if shards is not None or (args_ns.jobs > 1 and len(dispatchable_obj.messages) > 1):
+         fragments = render_messages(dispatchable_obj, namespace['handles'], linkage, args_ns.jobs, shared, lazy)
+      with sink.open(os.path.join(folder, 'packet-{}.c'.format(abbr))) as cfile:
+         with sink.open(os.path.join(folder, 'packet-{}.h'.format(abbr))) as hfile:
+            hfile.write(T['header_comment'](filename=hfile.name, description="The header file for the {} protocol".format(dispatchable_obj.name)))
+            hfile.write(T['include_guard'](guard=ws_include_guard(hfile)))
+            cfile.write(T['header_comment'](filename=cfile.name, description="The implementation file for the {} protocol".format(dispatchable_obj.name)))
             
-            hfile.write(_ws_text['header_includes'])
-            cfile.write(_ws_text['source_includes'].format(name = dispatchable_obj.abbreviation))
+            hfile.write(T['header_includes']())
+            cfile.write(T['source_includes'](name=abbr if shards is None else '{}-int'.format(abbr)))
             
-            cfile.write('static int proto_{name} = -1;\n'.format(name = abbr2name(dispatchable_obj.abbreviation)))
+            cfile.write(T['id_def'](linkage=linkage, kind='proto', name=abbr2name(abbr)))
             for m in dispatchable_obj.messages.values():
-               cfile.write('static int proto_{name} = -1;\n'.format(name = abbr2name(m.abbreviation)))
+               cfile.write(T['id_def'](linkage=linkage, kind='proto', name=abbr2name(m.abbreviation)))
             
             cfile.write('/* Header Fields */\n')
-            for field in namespace['fields'].values():
-               cfile.write('static int hf_{hf} = -1;\n'.format(hf=abbr2name(field.abbreviation)))
-               if 'weighted' in field.ftype:
-                  cfile.write('static int hf_{hf} = -1;\n'.format(hf=abbr2name('.'.join([field.abbreviation,'scaled']))))
-            for msg in namespace['messages'].values():
-               cfile.write('static int hf_{hf} = -1;\n'.format(hf=abbr2name(msg.abbreviation)))
-            for hdr in namespace['headers'].values():
-               cfile.write('static int hf_{hf} = -1;\n'.format(hf=abbr2name(hdr.abbreviation)))
-            for trlr in namespace['trailers'].values():
-               cfile.write('static int hf_{hf} = -1;\n'.format(hf=abbr2name(trlr.abbreviation)))
+            for hf in ws_hf_ids(namespace):
+               cfile.write(T['id_def'](linkage=linkage, kind='hf', name=hf))
             cfile.write('\n')
             
             cfile.write('/* Trees */\n')
-            for tree in namespace['trees'].values():
-               cfile.write('static gint ett_{ett} = -1;\n'.format(ett=abbr2name(tree.abbreviation)))
+            for ett in ws_ett_ids(namespace):
+               cfile.write(T['ett_def'](linkage=linkage, name=ett))
             cfile.write('\n')
             
             cfile.write('/* Enumerations */ \n')
@@ -967,9 +1693,21 @@ def dispatch(dispatchable_obj):
             cfile.write('\n')
             
             cfile.write('/* Value Strings */\n')
+            for name, rep in namespace['representations'].items():
+               _logger.info('Enumeration {}: {} with {} values, {} lookup'.format(name, rep.kind, len(rep.entries), rep.access))
+               cfile.write(T['enum_report'](name=name, kind=rep.kind, count=len(rep.entries), access=rep.access))
             for vs in namespace['value_strings'].values():
                hfile.write(var_decl(' '.join(['extern', vs])))
                cfile.write(vs)
+            for ext in namespace['value_string_exts'].values():
+               hfile.write(var_decl(' '.join(['extern', ext])))
+               cfile.write(ext)
+            cfile.write('\n')
+            
+            cfile.write('/* Range Strings */\n')
+            for rs in namespace['range_strings'].values():
+               hfile.write(var_decl(' '.join(['extern', rs])))
+               cfile.write(rs)
             cfile.write('\n')
             
             cfile.write('/* True/False Strings */\n')
@@ -980,25 +1718,38 @@ def dispatch(dispatchable_obj):
             
             cfile.write('/* Dissector Handles */\n')
             for handle in namespace['handles'].values():
-               cfile.write('static dissector_handle_t handle_{name};\n'.format(name = abbr2name(handle.abbreviation)))
+               cfile.write(T['handle_def'](linkage=linkage, name=abbr2name(handle.abbreviation)))
             cfile.write('\n')
             
-            hfile.write('#endif /* {include_guard} */\n'.format(include_guard = ws_include_guard(hfile)))
+            hfile.write(T['include_guard_end'](guard=ws_include_guard(hfile)))
             
             #dissect_...
             cfile.write('/* dissect_ Functions */\n')
-            write_dissect_fxn(dispatchable_obj, cfile)
-            #proto_register...
-            cfile.write('/* proto_register_ Functions */\n')
-            write_register_fxn(dispatchable_obj, cfile)
-            #proto_reg_handoff...
-            cfile.write('/* proto_reg_handoff_ Functions */\n')
-            write_handoff_fxn(dispatchable_obj, cfile, namespace['handles'])
-      write_cmake_file(folder, dispatchable_obj)
-      write_moduleinfo_file(folder, dispatchable_obj)
-      write_makefile_common(folder, dispatchable_obj)
-      write_makefile_am(folder, dispatchable_obj)
-      write_makefile_nmake(folder, dispatchable_obj)
-      write_plugin_rc_in(folder, dispatchable_obj)
-      write_moduleinfo_h(folder, dispatchable_obj)
-      
+            if shards is None:
+               #messages may be called by a dissector defined before them
+               for tree in namespace['trees'].values():
+                  cfile.write(T['dissect_fxn_proto'](linkage=linkage, name=abbr2name(tree.abbreviation)))
+               if lazy:
+                  for batch in ws_field_batches(dispatchable_obj):
+                     cfile.write(T['fields_fxn_proto'](linkage=linkage, name=abbr2name(batch.abbreviation)))
+               cfile.write('\n')
+            write_dissect_fxn(dispatchable_obj, cfile, fragments if shards is None else {}, linkage, shared, lazy)
+            if shards is None:
+               #proto_register...
+               cfile.write('/* proto_register_ Functions */\n')
+               cfile.write(ws_registration_report(dispatchable_obj, namespace, lazy))
+               write_register_fxn(dispatchable_obj, cfile, fragments, shared, lazy, linkage)
+               #proto_reg_handoff...
+               cfile.write('/* proto_reg_handoff_ Functions */\n')
+               write_handoff_fxn(dispatchable_obj, cfile, namespace['handles'], fragments)
+      if shards is not None:
+         write_internal_header(folder, dispatchable_obj, sink, namespace, lazy)
+         write_shard_files(folder, dispatchable_obj, sink, namespace, shards, fragments, shared, lazy)
+      write_runtime_header(folder, sink)
+      write_cmake_file(folder, dispatchable_obj, sink, layout)
+      write_moduleinfo_file(folder, dispatchable_obj, sink)
+      write_makefile_common(folder, dispatchable_obj, sink, layout)
+      write_makefile_am(folder, dispatchable_obj, sink)
+      write_makefile_nmake(folder, dispatchable_obj, sink)
+      write_plugin_rc_in(folder, dispatchable_obj, sink)
+      write_moduleinfo_h(folder, dispatchable_obj, sink)
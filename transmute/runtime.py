@@ -0,0 +1,898 @@
+##
+# @file transmute/runtime.py
+# @brief Compiles validated protocols into decoders, in-process.
+# @details Tools that load specifications at runtime call @ref transmute.runtime.compile "compile"
+#          instead of going through a code generation step. The protocol is rendered with the
+#          @ref transmute.plugins.pydecoder "pydecoder" plugin, and the source is compiled and
+#          executed once. The result is memoized per specification digest, so that loading the same
+#          specification again (even as a new Protocol object) reuses the same classes.
+#
+#          Fixed-size records of one message type are decoded in bulk by
+#          @ref transmute.runtime.decodeBatch "decodeBatch", into numpy column arrays. numpy is
+#          only needed for batch decoding.
+#
+#          Queries that read a few fields of each record, and filter records with a predicate, are
+#          compiled by @ref transmute.runtime.compileQuery "compileQuery", or passed to decodeBatch.
+#          Both read only the bytes of the fields they use.
+#
+#          Buffers are classified by message type with
+#          @ref transmute.runtime.compileClassifier "compileClassifier", or in bulk with
+#          @ref transmute.runtime.classifyBatch "classifyBatch", which read only the fields that
+#          <ws:expose> elements route on.
+#
+#          Encoders, the inverse of the decoders, are compiled by
+#          @ref transmute.runtime.compileEncoder "compileEncoder", and columns are encoded into
+#          fixed-size records in bulk by @ref transmute.runtime.encodeBatch "encodeBatch".
+#
+import ast
+import builtins
+import hashlib
+import io
+import linecache
+import logging
+import tokenize
+from   collections       import OrderedDict, namedtuple
+from   .plugins.base     import fieldLayout, fieldValues
+from   .plugins          import pydecoder
+from   .plugins.wireshark import Expose, ws_route_nodes, ws_routes
+from   .Output.Template  import Template
+
+try:
+   import numpy
+except ImportError:
+   numpy = None
+
+##
+# @brief All of the items exported by this module
+__all__ = ["Decoders", "compile", "specDigest", "cache_limit", "Column", "sectionColumns", "compileQuery",
+           "BatchLayout", "batchLayout", "decodeBatch", "Route", "routeGraph", "compileClassifier", "classifyBatch",
+           "compileEncoder", "encodeBatch"]
+
+##
+# @brief The module's top-level logger
+_logger = logging.getLogger('transmute.runtime')
+
+##
+# @brief The number of compiled protocols kept in memory
+cache_limit = 32
+
+##
+# @brief The compiled protocols and queries, keyed by digest, least recently used first
+_cache = OrderedDict()
+
+##
+# @name _remember
+# @brief Caches a compiled protocol or query, and forgets the least recently used ones
+# @param digest [in] The digest of the protocol or query
+# @param compiled [in] The compiled protocol or query, which has a filename attribute
+def _remember(digest, compiled):
+   #make the generated source available to tracebacks
+   linecache.cache[compiled.filename] = (len(compiled.source), None, compiled.source.splitlines(True), compiled.filename)
+   _cache[digest] = compiled
+   while len(_cache) > cache_limit:
+      evicted = _cache.popitem(last=False)[1]
+      linecache.cache.pop(evicted.filename, None)
+
+##
+# @brief A compiled protocol
+# @details filename is the name the generated source is compiled under. classes maps the
+#          abbreviation of every header, trailer and message to its class, and decode maps it to
+#          the bound decode(buf, offset=0) of that class. messages and headers list the message
+#          classes and the protocol header and trailer classes, and enums maps the name of each
+#          enumeration to its value names, keyed by value.
+Decoders = namedtuple('Decoders', ['digest', 'filename', 'source', 'classes', 'decode', 'messages', 'headers', 'enums'])
+
+##
+# @name specDigest
+# @brief Digests everything about a protocol that its decoders depend on
+# @details The digest covers the sections, their abbreviations and briefs, and the layout, scaling
+#          and values of every field, but not the parts of the specification that only other
+#          plugins use. Anonymous values are digested by their contents, since their names depend
+#          on how many specifications were loaded before; a protocol that reuses compiled decoders
+#          sees the anonymous names they were compiled with.
+# @param protocol [in] The validated Protocol
+# @param views [in] True if undecoded fields are memoryview slices
+# @param lazy [in] True if the classes are views
+# @return str The hexadecimal digest
+def specDigest(protocol, views=True, lazy=False):
+   digest = hashlib.sha1(repr((pydecoder.version_string, views or lazy, lazy, protocol.abbreviation, protocol.name)).encode())
+   for section in pydecoder.c_sections(protocol):
+      parts = tuple(getattr(getattr(section, s, None), 'abbreviation', None) for s in ('header', 'trailer'))
+      digest.update(repr((section.abbreviation, str(section.description.brief), parts)).encode())
+      for f in section.fields.values():
+         layout = fieldLayout(f)
+         values = fieldValues(f) if layout.kind == 'enum' else None
+         digest.update(repr((f.abbreviation, tuple(layout), values and (None if values.anonymous else values.name, [(v, values.values[v].ival, values.values[v].last) for v in values.values]))).encode())
+   return digest.hexdigest()
+
+##
+# @name compile
+# @brief Compiles a validated protocol into decoders
+# @details Every class decodes from bytes, bytearray or memoryview buffers, and raises ValueError
+#          when the buffer is shorter than the section. With views, undecoded fields are zero-copy
+#          memoryview slices of the buffer, which stay valid as long as the buffer does.
+#          With lazy, decode returns a view in O(1) that keeps the buffer, and decodes each field
+#          the first time it is read; filters that read a few fields of large messages skip the
+#          rest of the work.
+# @param protocol [in] The validated Protocol
+# @param views [in] True if undecoded fields are memoryview slices, False if they are bytes
+# @param lazy [in] True to decode fields on first access. Undecoded fields are then always views
+# @return Decoders The compiled protocol
+# @throws DispatchError When two sections or enumerations have the same Python name
+def compile(protocol, views=True, lazy=False):
+   digest = specDigest(protocol, views, lazy)
+   if digest in _cache:
+      _cache.move_to_end(digest)
+      _logger.debug('Reusing the decoders of {} ({})'.format(protocol.name, digest))
+      return _cache[digest]
+   filename  = '<transmute {} {}>'.format(protocol.abbreviation, digest[:12])
+   source    = pydecoder.py_module(protocol, filename, views=views, lazy=lazy)
+   namespace = {'__name__' : 'transmute.runtime.{}'.format(pydecoder.py_name(protocol.abbreviation))}
+   exec(builtins.compile(source, filename, 'exec'), namespace)
+   classes  = OrderedDict((s.abbreviation, namespace[pydecoder.py_name(s.abbreviation)]) for s in pydecoder.c_sections(protocol))
+   decoders = Decoders(digest   = digest,
+                       filename = filename,
+                       source   = source,
+                       classes  = classes,
+                       decode   = OrderedDict((a, cls.decode) for a, cls in classes.items()),
+                       messages = namespace['messages'],
+                       headers  = namespace['headers'],
+                       enums    = OrderedDict((name, namespace[name]) for name in pydecoder.py_enums(pydecoder.c_sections(protocol))))
+   _logger.info('Compiled {} sections of {} ({})'.format(len(classes), protocol.name, digest))
+   _remember(digest, decoders)
+   return decoders
+
+##
+# @brief The templates used to construct query functions
+_query_templates = dict((name, Template(text, indent=pydecoder._py_indent)) for name,text in {
+             'query_open'  : '\n'.join(['import struct',
+                                        '',
+                                        'def query(buf, offset=0):',
+                                        '{views}{indent}if len(buf) - offset < {size}:',
+                                        "{indent}{indent}raise ValueError('{abbreviation} queries need {size} bytes, got {{}}'.format(len(buf) - offset))",
+                                        ''
+                                       ]),
+             'views'       : "{indent}buf = memoryview(buf)\n",
+             'reader'      : "_q{stage}_{group} = struct.Struct({format!r}).unpack_from\n",
+             'read_group'  : "{indent}{refs}, = _q{stage}_{group}(buf, offset)\n",
+             'assign'      : "{indent}{name} = {value}\n",
+             'predicate'   : "{indent}if not ({expression}):\n{indent}{indent}return None\n",
+             'query_close' : "{indent}return ({values})\n",
+           }.items())
+
+##
+# @name queryColumns
+# @brief Indexes Columns by name and by field abbreviation
+# @param columns [in] The Columns
+# @return dict The Columns
+def queryColumns(columns):
+   known = {}
+   for column in columns:
+      known.setdefault(column.abbreviation, column)
+      known.setdefault(column.name, column)
+   return known
+
+##
+# @name queryColumn
+# @brief Returns the Column of a field name or abbreviation
+# @param known [in] The Columns indexed by queryColumns
+# @param field [in] The name or abbreviation
+# @return Column The Column
+# @throws ValueError When no field has that name or abbreviation
+def queryColumn(known, field):
+   try:
+      return known[field]
+   except KeyError:
+      raise ValueError("Unknown field '{}'".format(field))
+
+##
+# @name queryPredicate
+# @brief Resolves the fields of a predicate
+# @details A predicate is a Python expression that refers to fields by name or by abbreviation
+#          (e.g. "smp.a.temp > 20 and header.kind == 1"). Each field is replaced by a local
+#          variable, v0 for the first field used, v1 for the next, and so on.
+# @param where [in] The predicate
+# @param known [in] The Columns indexed by queryColumns
+# @return (str, list) The expression over the local variables, and the Column of each variable
+# @throws ValueError When the predicate is not an expression, or uses an unknown name
+def queryPredicate(where, known):
+   try:
+      tokens = list(tokenize.generate_tokens(io.StringIO(where).readline))
+   except (tokenize.TokenError, SyntaxError) as e:
+      raise ValueError("Invalid predicate '{}': {}".format(where, e))
+   lines = [0]
+   for line in io.StringIO(where):
+      lines.append(lines[-1] + len(line))
+   index = lambda position: lines[position[0] - 1] + position[1]
+   used  = []
+   spans = []
+   i     = 0
+   while i < len(tokens):
+      #a dotted name, unless it is an attribute of something else
+      if tokens[i][0] == tokenize.NAME and not (i and tokens[i - 1][:2] == (tokenize.OP, '.')):
+         parts = [tokens[i][1]]
+         j     = i + 1
+         while j + 1 < len(tokens) and tokens[j][:2] == (tokenize.OP, '.') and tokens[j + 1][0] == tokenize.NAME:
+            parts.append(tokens[j + 1][1])
+            j += 2
+         #the longest dotted prefix that names a field
+         for n in range(len(parts), 0, -1):
+            if '.'.join(parts[:n]) in known:
+               column = known['.'.join(parts[:n])]
+               if column not in used:
+                  used.append(column)
+               spans.append((index(tokens[i][2]), index(tokens[i + 2 * n - 2][3]), 'v{}'.format(used.index(column))))
+               i += 2 * n - 2
+               break
+      i += 1
+   pieces = []
+   end    = 0
+   for start, stop, name in spans:
+      pieces.extend([where[end:start], name])
+      end = stop
+   pieces.append(where[end:])
+   expression = ''.join(pieces).strip()
+   try:
+      tree = ast.parse(expression, mode='eval')
+   except SyntaxError as e:
+      raise ValueError("Invalid predicate '{}': {}".format(where, e))
+   for node in ast.walk(tree):
+      if isinstance(node, ast.Name) and not (node.id.startswith('v') and node.id[1:].isdigit()) and not hasattr(builtins, node.id):
+         raise ValueError("Unknown field '{}' in predicate '{}'".format(node.id, where))
+   return (expression, used)
+
+##
+# @class _Vectorize
+# @brief Rewrites a predicate to apply to numpy columns
+# @details and, or and not become &, | and ~, and chained comparisons become the & of each
+#          comparison.
+class _Vectorize(ast.NodeTransformer):
+   def visit_BoolOp(self, node):
+      self.generic_visit(node)
+      op    = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+      value = node.values[0]
+      for right in node.values[1:]:
+         value = ast.BinOp(left=value, op=op, right=right)
+      return value
+
+   def visit_UnaryOp(self, node):
+      self.generic_visit(node)
+      return ast.UnaryOp(op=ast.Invert(), operand=node.operand) if isinstance(node.op, ast.Not) else node
+
+   def visit_Compare(self, node):
+      self.generic_visit(node)
+      operands = [node.left] + node.comparators
+      value    = None
+      for left, op, right in zip(operands, node.ops, operands[1:]):
+         compare = ast.Compare(left=left, ops=[op], comparators=[right])
+         value   = compare if value is None else ast.BinOp(left=value, op=ast.BitAnd(), right=compare)
+      return value
+
+##
+# @name compileQuery
+# @brief Compiles a projection of a section, with an optional predicate, into a function
+# @details The function is query(buf, offset=0). It reads the fields of the predicate first, and
+#          returns None as soon as the predicate fails. Otherwise it reads the projected fields, and
+#          returns their values as a tuple, in the order given. Only the bytes of those fields are
+#          read, and no other field is decoded. Undecoded fields are memoryview slices of buf.
+#          Queries are memoized like compiled protocols.
+# @param section [in] The validated message, header or trailer
+# @param fields [in] The names or abbreviations of the projected fields
+# @param where [in] A predicate over field names or abbreviations, as a Python expression
+# @return function The query
+# @throws ValueError When a field is not in the section, or the predicate is invalid
+def compileQuery(section, fields, where=None):
+   T         = _query_templates
+   columns   = sectionColumns(section)
+   fields    = tuple(fields)
+   digest    = hashlib.sha1(repr((pydecoder.version_string, section.abbreviation, [tuple(c) for c in columns], fields, where)).encode()).hexdigest()
+   if digest in _cache:
+      _cache.move_to_end(digest)
+      return _cache[digest]
+   known     = queryColumns(columns)
+   projected = [queryColumn(known, f) for f in fields]
+   expression, used = queryPredicate(where, known) if where is not None else (None, [])
+   names     = OrderedDict((column, 'v{}'.format(i)) for i, column in enumerate(used))
+   for column in projected:
+      names.setdefault(column, 'v{}'.format(len(names)))
+   needed    = used + [c for c in names if c not in used]
+   readers   = []
+   body      = []
+   #the predicate's fields are read first, then those that are only projected
+   for stage, stage_columns in enumerate([used, needed[len(used):]]):
+      reads  = OrderedDict((c, pydecoder.py_read(c.layout)) for c in stage_columns if c.layout.kind != 'undecoded')
+      groups = pydecoder.py_read_groups(set(reads.values()))
+      refs   = dict((read, 'r{}_{}_{}'.format(stage, g, i)) for g, group in enumerate(groups) for i, read in enumerate(group))
+      for g, group in enumerate(groups):
+         readers.append(T['reader'](stage=stage, group=g, format=pydecoder.py_struct_format(group)))
+         body.append(T['read_group'](refs=', '.join(refs[read] for read in group), stage=stage, group=g))
+      for c in stage_columns:
+         if c in reads:
+            value = pydecoder.py_field_value(c.layout, reads[c], refs[reads[c]])
+         else:
+            value = pydecoder._py_templates['field_view'](start=c.layout.byteoffset, end=c.layout.byteoffset + c.layout.bytelength)
+         body.append(T['assign'](name=names[c], value=value))
+      if stage == 0 and expression is not None:
+         body.append(T['predicate'](expression=expression))
+   filename = '<transmute query {} {}>'.format(section.abbreviation, digest[:12])
+   source   = ''.join([T['query_open'](views        = T['views']() if any(c.layout.kind == 'undecoded' for c in needed) else '',
+                                       size         = max([c.layout.byteoffset + c.layout.bytelength for c in needed] + [0]),
+                                       abbreviation = section.abbreviation)] + body +
+                      [T['query_close'](values=''.join(names[c] + ', ' for c in projected)), '\n'] + readers)
+   namespace = {'__name__' : 'transmute.runtime.query'}
+   exec(builtins.compile(source, filename, 'exec'), namespace)
+   query          = namespace['query']
+   query.filename = filename
+   query.source   = source
+   _logger.debug('Compiled a query of {} fields of {} ({})'.format(len(needed), section.abbreviation, digest))
+   _remember(digest, query)
+   return query
+
+##
+# @brief The numpy type of each struct format code used by the Python decoder
+_batch_types = {'B' : 'u1', 'H' : 'u2', 'I' : 'u4', 'Q' : 'u8',
+                'b' : 'i1', 'h' : 'i2', 'i' : 'i4', 'q' : 'i8',
+                'f' : 'f4', 'd' : 'f8'}
+
+##
+# @brief One field of a section, as a column
+# @details name is the attribute name of the field, prefixed with 'header.' or 'trailer.' for the
+#          fields of a message's header and trailer.
+Column = namedtuple('Column', ['name', 'abbreviation', 'layout'])
+
+##
+# @name sectionColumns
+# @brief Lists the fields of a section, with those of its header and trailer
+# @param section [in] The validated message, header or trailer
+# @return list The Columns, header fields first and trailer fields last
+def sectionColumns(section, prefix=''):
+   columns = []
+   if getattr(section, 'header', None) is not None:
+      columns.extend(sectionColumns(section.header, prefix + 'header.'))
+   members = pydecoder.py_members(section)
+   columns.extend(Column(prefix + members[a], a, fieldLayout(f)) for a, f in section.fields.items())
+   if getattr(section, 'trailer', None) is not None:
+      columns.extend(sectionColumns(section.trailer, prefix + 'trailer.'))
+   return columns
+
+##
+# @brief The batch layout of a message, header or trailer
+# @details dtype is the numpy structured dtype of one record, with one (possibly overlapping) item
+#          per distinct read of the record. columns lists the Column of every field with the name
+#          of its dtype item.
+BatchLayout = namedtuple('BatchLayout', ['dtype', 'columns'])
+
+##
+# @name batchLayout
+# @brief Derives the numpy record layout of a section
+# @param section [in] The validated message, header or trailer
+# @param stride [in] The distance between records, in bytes (default is the section size)
+# @return BatchLayout The layout
+# @throws ImportError When numpy is not installed
+# @throws ValueError When stride is smaller than the section
+def batchLayout(section, stride=None):
+   if numpy is None:
+      raise ImportError("Batch decoding requires numpy")
+   size   = pydecoder.c_section_size(section)
+   stride = size if stride is None else stride
+   if stride < size:
+      raise ValueError("{} records are {} bytes, more than a stride of {}".format(section.abbreviation, size, stride))
+   items   = OrderedDict()
+   columns = []
+   for column in sectionColumns(section):
+      read  = pydecoder.py_read(column.layout)
+      key   = 'r{}_{}{}'.format(read.byteoffset, read.code, '>' if read.endian == 'big' else '<')
+      items.setdefault(key, (batchItem(read), read.byteoffset))
+      columns.append((column, key))
+   dtype = numpy.dtype({'names'    : list(items),
+                        'formats'  : [item for item, offset in items.values()],
+                        'offsets'  : [offset for item, offset in items.values()],
+                        'itemsize' : stride})
+   return BatchLayout(dtype, columns)
+
+##
+# @name batchItem
+# @brief Returns the numpy type of a read
+# @param read [in] The PyRead of a field
+# @return The dtype format of the read
+def batchItem(read):
+   if read.code.endswith('s'):
+      #undecoded fields, and integers of 3, 5, 6 or 7 bytes, are byte arrays
+      return ('u1', (read.bytelength,))
+   return ('>' if read.endian == 'big' else '<') + _batch_types[read.code]
+
+##
+# @name batchColumn
+# @brief Decodes one column from the records of its dtype item
+# @param raw [in] The array of the dtype item
+# @param layout [in] The FieldLayout of the field
+# @return numpy.ndarray The column
+def batchColumn(raw, layout):
+   if layout.kind in ('undecoded', 'float', 'double'):
+      return raw
+   if raw.ndim == 2:
+      #combine the bytes of an odd-sized integer, most significant byte first
+      order = range(raw.shape[1]) if layout.endian == 'big' else range(raw.shape[1] - 1, -1, -1)
+      value = numpy.zeros(raw.shape[0], dtype=numpy.uint64)
+      for i in order:
+         value = (value << numpy.uint64(8)) | raw[:, i]
+      if layout.full and layout.signed:
+         value = batchSign(value, layout.bits)
+   else:
+      value = raw
+   if not layout.full:
+      value = (value >> value.dtype.type(layout.shift)) & value.dtype.type(layout.mask >> layout.shift)
+      if layout.signed:
+         value = batchSign(value, layout.bits)
+   if layout.kind == 'weighted':
+      value = value * layout.lsb
+      if layout.offset:
+         value += layout.offset
+   elif layout.kind == 'bool':
+      value = value != 0
+   return value
+
+##
+# @name batchSign
+# @brief Sign extends the two's complement values held in the low bits of a column
+# @param value [in] The unsigned column
+# @param bits [in] The number of bits of each value
+# @return numpy.ndarray The signed column
+def batchSign(value, bits):
+   sign = numpy.int64(1 << (bits - 1))
+   return (value.astype(numpy.int64) ^ sign) - sign
+
+##
+# @name decodeBatch
+# @brief Decodes concatenated fixed-size records of one section into columns
+# @details The buffer is viewed with numpy.frombuffer, without a copy. Fields that fill their bytes,
+#          and undecoded fields, are returned as views of the buffer (undecoded fields as uint8
+#          arrays of one row per record). Bit fields are masked, shifted and sign extended, and
+#          weighted fields scaled, a column at a time.
+#
+#          With fields or where, only the columns of those fields are decoded. The predicate is
+#          evaluated on its columns first, and the projected columns are decoded from the bytes of
+#          the matching records only.
+# @param section [in] The validated message, header or trailer, or its BatchLayout
+# @param buf [in] The bytes, bytearray, memoryview or any other buffer holding the records
+# @param count [in] The number of records, or -1 for as many as the buffer holds
+# @param offset [in] The offset of the first record
+# @param stride [in] The distance between records, when section is not a BatchLayout
+# @param fields [in] The names or abbreviations of the fields to decode (default is all of them)
+# @param where [in] A predicate over field names or abbreviations, as a Python expression
+# @return OrderedDict The column of each field, keyed by column name or by the given field
+# @throws ImportError When numpy is not installed
+# @throws ValueError When a field is not in the section, or the predicate is invalid
+def decodeBatch(section, buf, count=-1, offset=0, stride=None, fields=None, where=None):
+   layout = section if isinstance(section, BatchLayout) else batchLayout(section, stride)
+   if count < 0:
+      count = (memoryview(buf).nbytes - offset) // layout.dtype.itemsize
+   records = numpy.frombuffer(buf, dtype=layout.dtype, count=count, offset=offset)
+   if fields is None and where is None:
+      return OrderedDict((column.name, batchColumn(records[key], column.layout)) for column, key in layout.columns)
+   known     = queryColumns(column for column, key in layout.columns)
+   keys      = dict((column.name, key) for column, key in layout.columns)
+   projected = [(f, queryColumn(known, f)) for f in (fields if fields is not None else [c.name for c, k in layout.columns])]
+   selected  = None
+   if where is not None:
+      expression, used = queryPredicate(where, known)
+      tree      = ast.fix_missing_locations(_Vectorize().visit(ast.parse(expression, mode='eval')))
+      arguments = dict(('v{}'.format(i), batchColumn(records[keys[column.name]], column.layout)) for i, column in enumerate(used))
+      selected  = numpy.broadcast_to(eval(builtins.compile(tree, '<where>', 'eval'), {}, arguments), (count,))
+   return OrderedDict((f, batchColumn(records[keys[column.name]] if selected is None else records[keys[column.name]][selected], column.layout))
+                      for f, column in projected)
+
+##
+# @brief The templates used to construct encoders
+_encoder_templates = dict((name, Template(text, indent=pydecoder._py_indent)) for name,text in {
+             'encode_open'  : '\n'.join(['',
+                                         'def encode(values, buf=None, offset=0):',
+                                         '{unpack}{indent}if buf is None:',
+                                         '{indent}{indent}buf = bytearray({size})',
+                                         '{indent}elif len(buf) - offset < {size}:',
+                                         "{indent}{indent}raise ValueError('{abbreviation} needs {size} bytes to encode, got {{}}'.format(len(buf) - offset))",
+                                         ''
+                                        ]),
+             'unpack'       : "{indent}{names}, = values\n",
+             'read_run'     : "{indent}{refs}, = _d{run}(buf, offset + {start})\n",
+             'assign'       : "{indent}{name} = {value}\n",
+             'write_run'    : "{indent}_e{run}(buf, offset + {start}, {refs})\n",
+             'encode_close' : "{indent}return buf\n",
+             'packer'       : "_e{run} = struct.Struct({format!r}).pack_into\n",
+             'unpacker'     : "_d{run} = struct.Struct({format!r}).unpack_from\n",
+             'value_bool'   : "(1 if {value} else 0)",
+             'value_offset' : "({value} - {offset!r})",
+             'value_scale'  : "round({value} / {lsb!r})",
+             'value_mask'   : "({value} & {mask})",
+             'value_shift'  : "({value} << {shift})",
+             'value_int'    : "int.from_bytes({ref}, {endian!r})",
+             'value_bytes'  : "({value}).to_bytes({length}, {endian!r})",
+             'value_merge'  : "({ref} & {keep}) | {value}",
+           }.items())
+
+##
+# @name encoderRuns
+# @brief Splits a group of reads into runs of adjacent reads
+# @details A run is written with one struct, from its first byte, so that the bytes between reads
+#          are left as they are.
+# @param group [in] The PyReads, in offset order
+# @return list Lists of PyReads
+def encoderRuns(group):
+   runs = []
+   for read in group:
+      if runs and runs[-1][-1].byteoffset + runs[-1][-1].bytelength == read.byteoffset:
+         runs[-1].append(read)
+      else:
+         runs.append([read])
+   return runs
+
+##
+# @name encoderFormat
+# @brief Returns the struct format string of a run of reads, from its first byte
+# @param run [in] The adjacent PyReads, in offset order
+# @return str The format
+def encoderFormat(run):
+   return ('>' if run[0].endian == 'big' else '<') + ''.join(read.code for read in run)
+
+##
+# @name encoderKeeps
+# @brief Returns the bits of a read that its fields do not write
+# @param read [in] The PyRead
+# @param fields [in] The (FieldLayout, local variable) of each field of the read
+# @return int The mask of the bits kept, 0 when the fields fill the read
+def encoderKeeps(read, fields):
+   if read.code.endswith('s') and fields[-1][0].kind == 'undecoded' or read.code in ('f', 'd'):
+      #fields that are not integers fill their read, and the last one given wins
+      return 0
+   width = read.bytelength * 8
+   used  = 0
+   for layout, name in fields:
+      used |= layout.mask
+   return ~used & ((1 << width) - 1)
+
+##
+# @name encoderValue
+# @brief Renders the expression encoding the fields of one read
+# @details The inverse of pydecoder.py_field_value: weighted values are unscaled and rounded,
+#          booleans become 0 or 1, and the values of bit fields are masked to their bits and
+#          shifted in place, then combined. With ref, the bits of other fields are kept from the
+#          read's current value.
+# @param read [in] The PyRead
+# @param fields [in] The (FieldLayout, local variable) of each field of the read
+# @param ref [in] The local variable holding the current value of the read, when merging
+# @return str The expression
+def encoderValue(read, fields, ref=None):
+   T = _encoder_templates
+   if read.code.endswith('s') and fields[-1][0].kind == 'undecoded' or read.code in ('f', 'd'):
+      return fields[-1][1]
+   values = []
+   for layout, name in fields:
+      value = name
+      if layout.kind == 'bool':
+         value = T['value_bool'](value=value)
+      elif layout.kind == 'weighted':
+         if layout.offset:
+            value = T['value_offset'](value=value, offset=layout.offset)
+         value = T['value_scale'](value=value, lsb=layout.lsb)
+      #full fields read with a struct code are range checked by struct itself
+      if not layout.full or read.code.endswith('s'):
+         value = T['value_mask'](value=value, mask=hex(layout.mask >> layout.shift))
+      if layout.shift:
+         value = T['value_shift'](value=value, shift=layout.shift)
+      values.append(value)
+   value = ' | '.join(values)
+   keep  = encoderKeeps(read, fields)
+   if ref is not None and keep:
+      current = T['value_int'](ref=ref, endian=read.endian) if read.code.endswith('s') else ref
+      value   = T['value_merge'](ref=current, keep=hex(keep), value=value)
+   if read.code.endswith('s'):
+      value = T['value_bytes'](value=value, length=read.bytelength, endian=read.endian)
+   return value
+
+##
+# @name compileEncoder
+# @brief Compiles the inverse of a section's decoder into a function
+# @details The function is encode(values, buf=None, offset=0). values holds the value of each
+#          field, in the order of fields (default is the order of sectionColumns), as the decoders
+#          return them: numbers, booleans, the integer value of enumerated fields, and bytes for
+#          undecoded fields. Each field is written in its byte order, at its bits, into buf at
+#          offset, or into a new zero-filled bytearray of the section's size, and buf is returned.
+#
+#          Every field is written; bit fields are masked to their bits, weighted values are rounded
+#          to the nearest multiple of their lsb, and undecoded fields are truncated or padded with
+#          zeros. Fields that fill their bytes are checked by struct, which raises struct.error for
+#          values out of range. With fields, only those fields are written, and the other bits of
+#          buf are kept as they are. Encoders are memoized like compiled protocols.
+# @param section [in] The validated message, header or trailer
+# @param fields [in] The names or abbreviations of the fields to write (default is all of them)
+# @return function The encoder
+# @throws ValueError When a field is not in the section
+def compileEncoder(section, fields=None):
+   T       = _encoder_templates
+   columns = sectionColumns(section)
+   fields  = tuple(fields) if fields is not None else None
+   digest  = hashlib.sha1(repr((pydecoder.version_string, 'encode', section.abbreviation, [tuple(c) for c in columns], fields)).encode()).hexdigest()
+   if digest in _cache:
+      _cache.move_to_end(digest)
+      return _cache[digest]
+   known   = queryColumns(columns)
+   given   = [queryColumn(known, f) for f in fields] if fields is not None else columns
+   names   = OrderedDict((column, 'v{}'.format(i)) for i, column in enumerate(given))
+   reads   = OrderedDict()
+   for column in names:
+      reads.setdefault(pydecoder.py_read(column.layout), []).append((column.layout, names[column]))
+   groups  = pydecoder.py_read_groups(set(reads))
+   packers = []
+   body    = []
+   run     = 0
+   for g, group in enumerate(groups):
+      if g == 0 and fields is None:
+         #the first group of a whole section is written over whatever buf held
+         packers.append(T['packer'](run=run, format=pydecoder.py_struct_format(group)))
+         refs = ['w{}_{}'.format(run, i) for i in range(len(group))]
+         body.extend(T['assign'](name=ref, value=encoderValue(read, reads[read])) for ref, read in zip(refs, group))
+         body.append(T['write_run'](run=run, start=0, refs=', '.join(refs)))
+         run += 1
+         continue
+      #reads that overlap others, or that leave out fields, keep the bits they do not write
+      for reads_run in encoderRuns(group):
+         current = ['r{}_{}'.format(run, i) for i in range(len(reads_run))]
+         refs    = ['w{}_{}'.format(run, i) for i in range(len(reads_run))]
+         if any(encoderKeeps(read, reads[read]) for read in reads_run):
+            packers.append(T['unpacker'](run=run, format=encoderFormat(reads_run)))
+            body.append(T['read_run'](run=run, start=reads_run[0].byteoffset, refs=', '.join(current)))
+         packers.append(T['packer'](run=run, format=encoderFormat(reads_run)))
+         body.extend(T['assign'](name=ref, value=encoderValue(read, reads[read], r)) for ref, r, read in zip(refs, current, reads_run))
+         body.append(T['write_run'](run=run, start=reads_run[0].byteoffset, refs=', '.join(refs)))
+         run += 1
+   size     = pydecoder.c_section_size(section) if fields is None else max([r.byteoffset + r.bytelength for r in reads] + [0])
+   filename = '<transmute encoder {} {}>'.format(section.abbreviation, digest[:12])
+   source   = ''.join(['import struct\n',
+                       T['encode_open'](unpack       = T['unpack'](names=', '.join(names.values())) if names else '',
+                                        size         = size,
+                                        abbreviation = section.abbreviation)] + body + [T['encode_close'](), '\n'] + packers)
+   namespace = {'__name__' : 'transmute.runtime.encoder'}
+   exec(builtins.compile(source, filename, 'exec'), namespace)
+   encode          = namespace['encode']
+   encode.filename = filename
+   encode.source   = source
+   _logger.debug('Compiled an encoder of {} fields of {} ({})'.format(len(names), section.abbreviation, digest))
+   _remember(digest, encode)
+   return encode
+
+##
+# @name encodeBatch
+# @brief Encodes columns into concatenated fixed-size records of one section
+# @details The inverse of decodeBatch. The records are viewed with numpy, without a copy, and each
+#          read of the section is written a column at a time: values are unscaled, masked and
+#          shifted like compileEncoder does, and combined with the bits of the fields that are not
+#          given, which keep the value buf held. Columns are arrays of one value per record, or
+#          scalars given to every record; undecoded columns are uint8 arrays of one row per record,
+#          or arrays of bytes.
+# @param section [in] The validated message, header or trailer, or its BatchLayout
+# @param columns [in] The column of each field to write, keyed by name or abbreviation
+# @param buf [in] A writable buffer holding the records (default is a new zero-filled bytearray)
+# @param count [in] The number of records, or -1 for the length of the columns
+# @param offset [in] The offset of the first record in buf
+# @param stride [in] The distance between records (default is the size of the section)
+# @return bytearray buf, or the new buffer
+# @throws ImportError When numpy is not installed
+# @throws ValueError When a field is not in the section, or the columns and count disagree
+def encodeBatch(section, columns, buf=None, count=-1, offset=0, stride=None):
+   layout = section if isinstance(section, BatchLayout) else batchLayout(section)
+   stride = layout.dtype.itemsize if stride is None else stride
+   known  = queryColumns(column for column, key in layout.columns)
+   keys   = dict((column.name, key) for column, key in layout.columns)
+   given  = [(queryColumn(known, f), numpy.asarray(values)) for f, values in columns.items()]
+   if count < 0:
+      count = max([len(values) for column, values in given if values.ndim] + [0])
+   if buf is None:
+      buf = bytearray(offset + count * stride)
+   records = numpy.ndarray(shape=(count,), dtype=layout.dtype, buffer=buf, offset=offset, strides=(stride,))
+   reads   = OrderedDict()
+   for column, values in given:
+      reads.setdefault(keys[column.name], []).append((column.layout, values))
+   for key, fields in reads.items():
+      item = records[key]
+      if fields[-1][0].kind in ('undecoded', 'float', 'double'):
+         layout, values = fields[-1]
+         if values.dtype.kind == 'S':
+            values = values.astype('S{}'.format(layout.bytelength)).view(numpy.uint8).reshape(-1, layout.bytelength)
+         item[...] = values
+         continue
+      used  = 0
+      value = numpy.zeros(count, dtype=numpy.uint64)
+      for layout, values in fields:
+         if layout.kind == 'weighted':
+            values = numpy.rint((values - layout.offset) / layout.lsb) if layout.offset else numpy.rint(values / layout.lsb)
+         elif layout.kind == 'bool':
+            values = values != 0
+         #negative values wrap to their two's complement
+         values = numpy.broadcast_to(numpy.asarray(values).astype(numpy.int64).astype(numpy.uint64), (count,))
+         value |= (values & numpy.uint64(layout.mask >> layout.shift)) << numpy.uint64(layout.shift)
+         used  |= layout.mask
+      width = fields[0][0].bytelength * 8
+      keep  = numpy.uint64(~used & ((1 << width) - 1))
+      if item.ndim == 2:
+         #split the value of an odd-sized integer into its bytes
+         order   = range(item.shape[1]) if fields[0][0].endian == 'big' else range(item.shape[1] - 1, -1, -1)
+         current = numpy.zeros(count, dtype=numpy.uint64)
+         for i in order:
+            current = (current << numpy.uint64(8)) | item[:, i]
+         value = (current & keep) | value
+         for i in reversed(order):
+            item[:, i] = value & numpy.uint64(0xFF)
+            value      = value >> numpy.uint64(8)
+      else:
+         item[...] = ((item.astype(numpy.uint64) & keep) | value).astype(item.dtype)
+   return buf
+
+##
+# @brief How a node of a protocol routes what follows it
+# @details node is the protocol or one of its messages, and section is what is decoded at the
+#          node: the protocol header, the message, or None for a protocol without a header. advance
+#          is the number of bytes from the start of the node to the bytes its tables route, the
+#          length of its header, as in the wireshark dissectors. exposed lists the Column of each
+#          field the node exposes, with the nodes registered for its values, keyed by value.
+Route = namedtuple('Route', ['node', 'section', 'advance', 'exposed'])
+
+##
+# @name routeGraph
+# @brief Derives the routes of a protocol from its <ws:expose> and <ws:register> elements
+# @param protocol [in] The validated Protocol
+# @return OrderedDict The Route of the protocol and of every message, keyed by node
+# @throws DispatchError When a registered value is not an integer
+def routeGraph(protocol):
+   graph = OrderedDict()
+   for node in ws_route_nodes(protocol):
+      section = protocol.header if node is protocol else node
+      header  = protocol.header if node is protocol else getattr(node, 'header', None)
+      known   = queryColumns(sectionColumns(section)) if section is not None else {}
+      graph[node] = Route(node    = node,
+                          section = section,
+                          advance = pydecoder.c_section_size(header) if header is not None else 0,
+                          exposed = [(known[c.field], ws_routes(protocol, c.field)) for c in node.children if isinstance(c, Expose) and c.field in known])
+   return graph
+
+##
+# @brief The templates used to construct classifiers
+_classifier_templates = dict((name, Template(text, indent=pydecoder._py_indent)) for name,text in {
+             'step_open'  : '\n'.join(['',
+                                       'def _s{step}(buf, offset=0, hops={hops}):',
+                                       ''
+                                      ]),
+             'size_check' : '\n'.join(['{indent}if len(buf) - offset < {size}:',
+                                       "{indent}{indent}raise ValueError('{abbreviation} needs {size} bytes to classify, got {{}}'.format(len(buf) - offset))",
+                                       ''
+                                      ]),
+             'read_group' : "{indent}{refs}, = _c{step}_{group}(buf, offset)\n",
+             'lookup'     : '\n'.join(['{indent}step = _t{step}_{table}.get({value})',
+                                       '{indent}if step.__class__ is str:',
+                                       '{indent}{indent}return {found}',
+                                       '{indent}if step is not None and hops:',
+                                       '{indent}{indent}return step(buf, offset + {advance}, hops - 1)',
+                                       ''
+                                      ]),
+             'step_close' : "{indent}return {result}\n",
+             'found_at'   : "(step, offset + {advance})",
+             'result_at'  : "({abbreviation!r}, offset)",
+             'reader'     : "_c{step}_{group} = struct.Struct({format!r}).unpack_from\n",
+             'table'      : "_t{step}_{table} = {{{entries}}}\n",
+             'classify'   : "classify = _s{step}\n",
+           }.items())
+
+##
+# @name compileClassifier
+# @brief Compiles the routes of a protocol into a function that names the message of a buffer
+# @details The function is classify(buf, offset=0). It reads the fields the protocol header exposes,
+#          looks their values up in the tables of registered messages, and goes on with the fields
+#          exposed by the message it finds, past the header of the node before. Only the bytes of
+#          exposed fields are read. It returns the abbreviation of the last message found, or None
+#          when the protocol routes the buffer to no message, and raises ValueError when the buffer
+#          is too short for a field it reads. With offsets, it returns the abbreviation with the
+#          offset in buf of the message. Classifiers are memoized like compiled protocols.
+# @param protocol [in] The validated Protocol
+# @param entry [in] The abbreviation of the message buffers start with, such as one registered on a port (default is the protocol)
+# @param offsets [in] True to return the offset of the message along with its abbreviation
+# @return function The classifier
+# @throws KeyError When entry is not a message of the protocol
+def compileClassifier(protocol, entry=None, offsets=False):
+   T      = _classifier_templates
+   graph  = routeGraph(protocol)
+   start  = protocol if entry is None else protocol.messages[entry]
+   steps  = dict((node, i) for i, node in enumerate(graph))
+   digest = hashlib.sha1(repr((specDigest(protocol), 'classify', entry, offsets,
+                               [(steps[r.node], r.advance, [(c.abbreviation, [(v, steps[n]) for v, n in t.items()]) for c, t in r.exposed]) for r in graph.values()])).encode()).hexdigest()
+   if digest in _cache:
+      _cache.move_to_end(digest)
+      return _cache[digest]
+   body    = []
+   readers = []
+   tables  = []
+   for route in graph.values():
+      step   = steps[route.node]
+      reads  = OrderedDict((c, pydecoder.py_read(c.layout)) for c, table in route.exposed)
+      groups = pydecoder.py_read_groups(set(reads.values()))
+      refs   = dict((read, 'r{}_{}'.format(g, i)) for g, group in enumerate(groups) for i, read in enumerate(group))
+      name   = route.node.abbreviation if route.node is not protocol else None
+      body.append(T['step_open'](step=step, hops=len(graph)))
+      if reads:
+         body.append(T['size_check'](abbreviation=route.node.abbreviation, size=max(r.byteoffset + r.bytelength for r in reads.values())))
+      for g, group in enumerate(groups):
+         readers.append(T['reader'](step=step, group=g, format=pydecoder.py_struct_format(group)))
+         body.append(T['read_group'](refs=', '.join(refs[read] for read in group), step=step, group=g))
+      for t, (column, table) in enumerate(route.exposed):
+         #messages that expose nothing are classified without a call
+         entries = ', '.join('{}: {}'.format(v, repr(n.abbreviation) if not graph[n].exposed else '_s{}'.format(steps[n])) for v, n in table.items())
+         tables.append(T['table'](step=step, table=t, entries=entries))
+         body.append(T['lookup'](step=step, table=t, advance=route.advance,
+                                 found=T['found_at'](advance=route.advance) if offsets else 'step',
+                                 value=pydecoder.py_field_value(column.layout, reads[column], refs[reads[column]])))
+      body.append(T['step_close'](result=T['result_at'](abbreviation=name) if offsets else repr(name)))
+   filename = '<transmute classifier {} {}>'.format(protocol.abbreviation, digest[:12])
+   source   = ''.join(['import struct\n'] + body + ['\n'] + readers + tables + [T['classify'](step=steps[start])])
+   namespace = {'__name__' : 'transmute.runtime.classifier'}
+   exec(builtins.compile(source, filename, 'exec'), namespace)
+   classify          = namespace['classify']
+   classify.filename = filename
+   classify.source   = source
+   _logger.debug('Compiled a classifier of {} routes of {} ({})'.format(sum(len(r.exposed) for r in graph.values()), protocol.abbreviation, digest))
+   _remember(digest, classify)
+   return classify
+
+##
+# @name classifyBatch
+# @brief Classifies fixed-size records by message type, a table lookup at a time
+# @details Records are classified like compileClassifier does, one route at a time: the exposed
+#          field is read from the records still at that route with a strided numpy view of the
+#          buffer, and looked up in the sorted values of its table with numpy.searchsorted.
+# @param protocol [in] The validated Protocol
+# @param buf [in] The bytes, bytearray, memoryview or any other buffer holding the records
+# @param count [in] The number of records, or -1 for as many as the buffer holds
+# @param offset [in] The offset of the first record
+# @param stride [in] The distance between records (default is the size of the protocol header plus the largest message)
+# @param entry [in] The abbreviation of the message records start with (default is the protocol)
+# @return (numpy.ndarray, tuple) The message of each record, as an index in the tuple of message abbreviations, or -1 for none
+# @throws ImportError When numpy is not installed
+# @throws ValueError When an exposed field reaches past the end of a record
+def classifyBatch(protocol, buf, count=-1, offset=0, stride=None, entry=None):
+   if numpy is None:
+      raise ImportError("Batch decoding requires numpy")
+   graph = routeGraph(protocol)
+   names = tuple(protocol.messages.keys())
+   codes = dict((m, i) for i, m in enumerate(protocol.messages.values()))
+   if stride is None:
+      stride = graph[protocol].advance + max([pydecoder.c_section_size(m) for m in protocol.messages.values()] + [0])
+   if count < 0:
+      count = (memoryview(buf).nbytes - offset) // stride
+   start    = protocol if entry is None else protocol.messages[entry]
+   classes  = numpy.full(count, codes.get(start, -1), dtype=numpy.int32)
+   frontier = [(start, numpy.arange(count), 0)]
+   for hop in range(len(graph)):
+      reached = []
+      for node, rows, base in frontier:
+         route = graph[node]
+         for column, table in route.exposed:
+            if not len(rows):
+               break
+            if not table:
+               continue
+            read  = pydecoder.py_read(column.layout)
+            if base + read.byteoffset + read.bytelength > stride:
+               raise ValueError("{} reaches past the end of {} byte records".format(column.abbreviation, stride))
+            dtype   = numpy.dtype({'names' : ['v'], 'formats' : [batchItem(read)], 'offsets' : [base + read.byteoffset], 'itemsize' : stride})
+            value   = batchColumn(numpy.frombuffer(buf, dtype=dtype, count=count, offset=offset)['v'][rows], column.layout)
+            keys    = numpy.array(list(table.keys()))
+            targets = list(table.values())
+            found   = numpy.minimum(numpy.searchsorted(keys, value), len(keys) - 1)
+            hit     = keys[found] == value
+            classes[rows[hit]] = numpy.array([codes.get(n, -1) for n in targets], dtype=numpy.int32)[found[hit]]
+            #only the records of messages that expose fields go on
+            for i in numpy.unique(found[hit]):
+               if graph[targets[i]].exposed:
+                  reached.append((targets[i], rows[hit & (found == i)], base + route.advance))
+            rows    = rows[~hit]
+      if not reached:
+         break
+      frontier = reached
+   return (classes, names)
@@ -0,0 +1,299 @@
+##
+# @file transmute/stats.py
+# @brief Accumulates the distribution of every field over batches of records.
+# @details Records are copied into a fixed-size batch per section, and each full batch is decoded
+#          with @ref transmute.runtime.decodeBatch "runtime.decodeBatch". Every column then updates
+#          running aggregates, so memory stays bounded by the batch size and the number of fields,
+#          whatever the number of records:
+#          - The count, minimum, maximum, mean and standard deviation of numeric fields, with
+#            moments merged a batch at a time. Weighted fields are aggregated scaled.
+#          - A histogram of the values of enumerated fields, by value name, counted with
+#            numpy.bincount. Values are named by the range of the enumeration holding them.
+#          - The frequency of each bit of unsigned integer fields, and of true booleans.
+#          numpy is required.
+#
+import json
+import logging
+import math
+from   collections       import OrderedDict
+from   .                 import runtime
+from   .plugins.base     import fieldValues
+
+try:
+   import numpy
+except ImportError:
+   numpy = None
+
+##
+# @brief All of the items exported by this module
+__all__ = ["FieldStats", "SectionStats", "Collector", "textReport", "jsonReport", "reportFormats"]
+
+##
+# @brief The module's top-level logger
+_logger = logging.getLogger('transmute.stats')
+
+##
+# @brief The widest enumerated field counted in an array, in bits; wider fields are counted in a dict
+histogram_bits = 16
+
+##
+# @class FieldStats
+# @brief The running aggregates of one field
+class FieldStats(object):
+   ##
+   # @name __init__
+   # @brief Start the aggregates of a field
+   # @param column [in] The runtime.Column of the field
+   # @param names [in] The value names of an enumerated field, as (first, last, name) ranges
+   def __init__(self, column, names=None):
+      self.column  = column
+      self.names   = sorted(names) if names else None
+      self.count   = 0
+      self.moments = None
+      self.minimum = None
+      self.maximum = None
+      self.true    = 0
+      self.bits    = None
+      self.values  = None
+      layout = column.layout
+      if layout.kind == 'enum':
+         self.values = numpy.zeros(1 << layout.bits, dtype=numpy.int64) if layout.bits <= histogram_bits else {}
+      elif layout.kind == 'int' and not layout.signed:
+         self.bits = numpy.zeros(layout.bits, dtype=numpy.int64)
+
+   ##
+   # @name update
+   # @brief Add a batch of values
+   # @param values [in] The numpy column of the field, from runtime.decodeBatch
+   def update(self, values):
+      kind        = self.column.layout.kind
+      self.count += len(values)
+      if kind == 'undecoded' or not len(values):
+         return
+      if kind == 'bool':
+         self.true += int(numpy.count_nonzero(values))
+         return
+      if kind == 'enum':
+         if isinstance(self.values, dict):
+            for value, count in zip(*numpy.unique(values, return_counts=True)):
+               self.values[int(value)] = self.values.get(int(value), 0) + int(count)
+         else:
+            self.values += numpy.bincount(values.astype(numpy.intp), minlength=len(self.values))
+      if self.bits is not None:
+         #little-endian bytes, unpacked least significant bit first, give the bits in column order
+         unpacked   = numpy.unpackbits(values.astype('<u8').view(numpy.uint8).reshape(-1, 8), axis=1, bitorder='little')
+         self.bits += unpacked[:, :len(self.bits)].sum(axis=0, dtype=numpy.int64)
+      values = values.astype(numpy.float64)
+      if kind in ('float', 'double'):
+         values = values[numpy.isfinite(values)]
+         if not len(values):
+            return
+      self._moments(values)
+
+   ##
+   # @name _moments
+   # @brief Merges the moments of a batch into the running moments
+   # @details The count, mean and sum of squared deviations of the batch are combined with the
+   #          running ones with the pairwise update of Chan et al., which stays accurate over any
+   #          number of batches.
+   def _moments(self, values):
+      count, mean = len(values), float(values.mean())
+      squares     = float(((values - mean) ** 2).sum())
+      low, high   = float(values.min()), float(values.max())
+      if self.moments is None:
+         self.moments = (count, mean, squares)
+         self.minimum, self.maximum = low, high
+         return
+      total, running, deviations = self.moments
+      delta        = mean - running
+      merged       = total + count
+      self.moments = (merged, running + delta * count / merged, deviations + squares + delta * delta * total * count / merged)
+      self.minimum, self.maximum = min(self.minimum, low), max(self.maximum, high)
+
+   ##
+   # @name report
+   # @brief Summarizes the aggregates
+   # @return OrderedDict The kind and count of the field, with its moments, histogram or bit frequencies
+   def report(self):
+      rv = OrderedDict([('kind', self.column.layout.kind), ('count', self.count)])
+      if self.moments is not None:
+         count, mean, squares = self.moments
+         rv.update([('min', self.minimum), ('max', self.maximum), ('mean', mean), ('std', math.sqrt(squares / count))])
+      if self.column.layout.kind == 'bool':
+         rv['true'] = self.true
+      if self.values is not None:
+         counted = sorted(self.values.items()) if isinstance(self.values, dict) else [(v, int(c)) for v, c in enumerate(self.values) if c]
+         rv['values'] = OrderedDict()
+         for name, (v, c) in zip(self._name([v for v, c in counted]), counted):
+            rv['values'][name] = rv['values'].get(name, 0) + c
+      if self.bits is not None:
+         rv['bits'] = [int(c) for c in self.bits]
+      return rv
+
+   ##
+   # @name _name
+   # @brief Names values by the ranges of the enumeration
+   # @details The range starting at or before each value is found with numpy.searchsorted. Values
+   #          past the end of that range, or without names, keep their number.
+   # @param values [in] The values, in increasing order
+   # @return list The name of each value
+   def _name(self, values):
+      if not self.names or not values:
+         return [str(v) for v in values]
+      starts = numpy.array([first for first, last, name in self.names], dtype=numpy.uint64)
+      lasts  = numpy.array([last  for first, last, name in self.names], dtype=numpy.uint64)
+      values = numpy.array(values, dtype=numpy.uint64)
+      index  = numpy.searchsorted(starts, values, side='right') - 1
+      inside = (index >= 0) & (values <= lasts[numpy.maximum(index, 0)])
+      return [self.names[i][2] if ok else str(v) for v, i, ok in zip(values.tolist(), index.tolist(), inside.tolist())]
+
+##
+# @name _section_fields
+# @brief Indexes the fields of a section, its header and its trailer by abbreviation
+def _section_fields(section):
+   fields = OrderedDict()
+   for part in (getattr(section, 'header', None), section, getattr(section, 'trailer', None)):
+      if part is not None:
+         fields.update(part.fields)
+   return fields
+
+##
+# @class SectionStats
+# @brief The aggregates of every field of a message, header or trailer
+class SectionStats(object):
+   ##
+   # @name __init__
+   # @brief Start the aggregates of a section
+   # @param section [in] The validated message, header or trailer
+   # @param batch [in] The number of records decoded at a time
+   def __init__(self, section, batch):
+      fields       = _section_fields(section)
+      self.section = section
+      self.layout  = runtime.batchLayout(section)
+      self.size    = self.layout.dtype.itemsize
+      self.batch   = batch
+      self.pending = bytearray()
+      self.records = 0
+      self.fields  = OrderedDict()
+      for column, key in self.layout.columns:
+         names = None
+         if column.layout.kind == 'enum':
+            values = fieldValues(fields[column.abbreviation])
+            names  = [(int(v.ival, 0), int(v.last, 0), name) for name, v in values.values.items()]
+         self.fields[column.name] = FieldStats(column, names)
+
+   ##
+   # @name add
+   # @brief Add a record
+   # @param data [in] The buffer holding the record
+   # @param offset [in] The offset of the record in data
+   # @return bool False when data is too short for the section, and the record is left out
+   def add(self, data, offset=0):
+      if len(data) - offset < self.size:
+         return False
+      self.pending += data[offset:offset + self.size]
+      self.records += 1
+      if len(self.pending) >= self.batch * self.size:
+         self.flush()
+      return True
+
+   ##
+   # @name flush
+   # @brief Decode the pending records and update the aggregates
+   def flush(self):
+      if not self.pending:
+         return
+      for name, values in runtime.decodeBatch(self.layout, self.pending).items():
+         self.fields[name].update(values)
+      self.pending = bytearray()
+
+   ##
+   # @name report
+   # @brief Summarizes the aggregates
+   # @return OrderedDict The number of records, and the report of each field, by abbreviation
+   def report(self):
+      self.flush()
+      return OrderedDict([('records', self.records),
+                          ('fields',  OrderedDict((s.column.abbreviation, s.report()) for s in self.fields.values()))])
+
+##
+# @class Collector
+# @brief The aggregates of every section of a protocol that records are added to
+class Collector(object):
+   ##
+   # @name __init__
+   # @brief Start collecting the statistics of a protocol
+   # @param protocol [in] The validated Protocol
+   # @param batch [in] The number of records of a section decoded at a time
+   # @throws ImportError When numpy is not installed
+   def __init__(self, protocol, batch=4096):
+      if numpy is None:
+         raise ImportError("Field statistics require numpy")
+      self.protocol = protocol
+      self.batch    = batch
+      self.sections = OrderedDict()
+
+   ##
+   # @name add
+   # @brief Add a record of a section
+   # @param section [in] The message, header or trailer
+   # @param data [in] The buffer holding the record
+   # @param offset [in] The offset of the record in data
+   # @return bool False when data is too short for the section
+   def add(self, section, data, offset=0):
+      stats = self.sections.get(section.abbreviation)
+      if stats is None:
+         stats = self.sections[section.abbreviation] = SectionStats(section, self.batch)
+      return stats.add(data, offset)
+
+   ##
+   # @name report
+   # @brief Summarizes the aggregates of every section
+   # @return OrderedDict The report of each section, by abbreviation, in the order first seen
+   def report(self):
+      return OrderedDict((a, s.report()) for a, s in self.sections.items())
+
+##
+# @brief The number of the most common values of an enumerated field listed in the text report
+text_values = 8
+
+##
+# @name _number
+# @brief Formats a statistic for the text report
+def _number(value):
+   return '{:.6g}'.format(value) if isinstance(value, float) else str(value)
+
+##
+# @name textReport
+# @brief Writes a report as text, a section at a time and a line per field
+# @param report [in] The report, as returned by Collector.report
+# @param stream [in] The text stream
+def textReport(report, stream):
+   for abbreviation, section in report.items():
+      stream.write('{}: {} records\n'.format(abbreviation, section['records']))
+      width = max([len(a) for a in section['fields']] + [0])
+      for field, stats in section['fields'].items():
+         items = ['{} {}'.format(k, _number(stats[k])) for k in ('min', 'max', 'mean', 'std') if k in stats]
+         if 'true' in stats:
+            items.append('true {:.1%}'.format(stats['true'] / stats['count']) if stats['count'] else 'true -')
+         if 'values' in stats:
+            common = sorted(stats['values'].items(), key=lambda item: -item[1])
+            items.extend('{} {} ({:.1%})'.format(name, count, count / stats['count']) for name, count in common[:text_values])
+            if len(common) > text_values:
+               items.append('and {} other values'.format(len(common) - text_values))
+         if 'bits' in stats and stats['count']:
+            items.append('bits ' + ' '.join('{}:{:.1%}'.format(b, c / stats['count']) for b, c in enumerate(stats['bits']) if c))
+         stream.write('   {:<{width}} {:<9} {}\n'.format(field, stats['kind'], '  '.join(items), width=width))
+
+##
+# @name jsonReport
+# @brief Writes a report as a JSON document
+# @param report [in] The report, as returned by Collector.report
+# @param stream [in] The text stream
+def jsonReport(report, stream):
+   json.dump(report, stream, indent=1)
+   stream.write('\n')
+
+##
+# @brief The report formats, by name
+reportFormats = OrderedDict([('text', textReport), ('json', jsonReport)])
@@ -0,0 +1,368 @@
+##
+# @file transmute/traffic.py
+# @brief Generates random, valid traffic of a protocol.
+# @details Each message is generated along its route from the protocol: the protocol header, the
+#          messages that route to it and the message itself are filled with random values, and
+#          the fields they expose are then set to the values registered for the next message, so
+#          that the records decode and classify as that message. Enumerated fields take one of
+#          their <values>, bit fields any value of their bits, weighted fields any multiple of
+#          their lsb, and floats a finite value. Fields with a meaning the specification does not
+#          describe, such as lengths, are random as well.
+#
+#          With numpy, records are generated a batch at a time, a column at a time, with
+#          @ref transmute.runtime.encodeBatch "runtime.encodeBatch". Without it, each record is
+#          written with the encoders of @ref transmute.runtime.compileEncoder "runtime.compileEncoder".
+#          Records are written back to back (raw), or as the UDP or TCP payloads of a pcap capture
+#          that @ref transmute.capture "transmute.capture" decodes.
+#
+import itertools
+import logging
+import random
+import struct
+import time
+from   collections       import OrderedDict, deque, namedtuple
+from   .                 import runtime
+from   .capture          import portEntries
+from   .plugins          import pydecoder
+from   .plugins.base     import fieldLayout, fieldValues
+
+try:
+   import numpy
+except ImportError:
+   numpy = None
+
+##
+# @brief All of the items exported by this module
+__all__ = ["Plan", "messagePlans", "Generator", "writeRaw", "writePcap", "formats", "generateTraffic"]
+
+##
+# @brief The module's top-level logger
+_logger = logging.getLogger('transmute.traffic')
+
+##
+# @brief The bound of the random values of float and double fields
+float_range = 1e6
+
+##
+# @brief How one message is generated
+# @details message is the abbreviation of the message, and size the size of its records. sections
+#          lists each header and message of the route with its offset in the record, in route order.
+#          routes lists each section that routes to the next with its offset, the runtime.Column of
+#          the exposed field and the value registered for the next node.
+Plan = namedtuple('Plan', ['message', 'size', 'sections', 'routes'])
+
+##
+# @name messagePlans
+# @brief Finds the shortest route from the protocol, or from a message, to every message it reaches
+# @param protocol [in] The validated Protocol
+# @param entry [in] The abbreviation of the message records start with (default is the protocol)
+# @return OrderedDict The Plan of each message reached, keyed by abbreviation
+# @throws KeyError When entry is not a message of the protocol
+def messagePlans(protocol, entry=None):
+   graph = runtime.routeGraph(protocol)
+   start = protocol if entry is None else protocol.messages[entry]
+   first = [(graph[protocol].section, 0)] if start is protocol and graph[protocol].section is not None else []
+   plans = OrderedDict()
+   if start is not protocol:
+      plans[start.abbreviation] = _plan(start, first + [(start, 0)], [])
+   queue = deque([(start, 0, first + ([(start, 0)] if start is not protocol else []), [])])
+   while queue:
+      node, base, sections, routes = queue.popleft()
+      route = graph[node]
+      for column, table in route.exposed:
+         for value, target in table.items():
+            if target is start or target.abbreviation in plans:
+               continue
+            path  = (sections + [(target, base + route.advance)], routes + [(route.section, base, column, value)])
+            plans[target.abbreviation] = _plan(target, *path)
+            queue.append((target, base + route.advance) + path)
+   return OrderedDict((m, plans[m]) for m in protocol.messages if m in plans)
+
+def _plan(message, sections, routes):
+   return Plan(message  = message.abbreviation,
+               size     = max(offset + pydecoder.c_section_size(section) for section, offset in sections),
+               sections = sections,
+               routes   = routes)
+
+##
+# @class Generator
+# @brief Generates the records of some messages of a protocol, in random order
+class Generator(object):
+   ##
+   # @name __init__
+   # @brief Prepare the generation of messages
+   # @param protocol [in] The validated Protocol
+   # @param messages [in] The abbreviations of the messages to generate (default is every message entry reaches)
+   # @param entry [in] The abbreviation of the message records start with (default is the protocol)
+   # @param seed [in] The seed of the random values (default is a random seed)
+   # @param batch [in] The number of records generated at a time
+   # @throws ValueError When a message is not reached from entry, or no message is
+   def __init__(self, protocol, messages=None, entry=None, seed=None, batch=65536):
+      plans = messagePlans(protocol, entry)
+      start = entry if entry is not None else protocol.abbreviation
+      for m in messages or []:
+         if m not in plans:
+            raise ValueError("{} is not routed from {}".format(m, start))
+      self.plans = [plans[m] for m in messages] if messages else list(plans.values())
+      if not self.plans:
+         raise ValueError("{} routes to no message".format(start))
+      self.seed     = seed
+      self.batch    = batch
+      self.columns  = {}
+      self.names    = {}
+      for plan in self.plans:
+         for section, offset in plan.sections:
+            if section.abbreviation not in self.columns:
+               self.columns[section.abbreviation] = runtime.sectionColumns(section)
+               self.names.update(_enum_values(section))
+
+   ##
+   # @name blocks
+   # @brief Generates records, a batch at a time
+   # @param count [in] The number of records
+   # @return iterator Sequences of records, as bytes-like objects, each a message chosen at random
+   def blocks(self, count):
+      return self._numpy_blocks(count) if numpy is not None else self._python_blocks(count)
+
+   ##
+   # @name records
+   # @brief Generates records
+   # @param count [in] The number of records
+   # @return iterator The records, as bytes-like objects, each a message chosen at random
+   def records(self, count):
+      return itertools.chain.from_iterable(self.blocks(count))
+
+   def _python_blocks(self, count):
+      rng      = random.Random(self.seed)
+      encoders = []
+      for plan in self.plans:
+         sections = [(runtime.compileEncoder(s), [_python_value(c, self.names.get(c.abbreviation)) for c in self.columns[s.abbreviation]], o)
+                     for s, o in plan.sections]
+         routes   = [(runtime.compileEncoder(s, [c.name]), [v], o) for s, o, c, v in plan.routes]
+         encoders.append((plan.size, sections, routes))
+      for done in range(0, count, self.batch):
+         block = []
+         for i in range(min(self.batch, count - done)):
+            size, sections, routes = rng.choice(encoders)
+            buf = bytearray(size)
+            for encode, values, offset in sections:
+               encode([value(rng) for value in values], buf, offset)
+            for encode, values, offset in routes:
+               encode(values, buf, offset)
+            block.append(buf)
+         yield block
+
+   def _numpy_blocks(self, count):
+      rng     = numpy.random.default_rng(self.seed)
+      layouts = dict((s.abbreviation, runtime.batchLayout(s)) for plan in self.plans for s, o in plan.sections)
+      for done in range(0, count, self.batch):
+         kinds   = rng.integers(0, len(self.plans), min(self.batch, count - done))
+         records = []
+         for i, plan in enumerate(self.plans):
+            n   = int(numpy.count_nonzero(kinds == i))
+            buf = bytearray(n * plan.size)
+            if not n:
+               continue
+            for section, offset in plan.sections:
+               columns = OrderedDict((c.name, _numpy_column(rng, c, self.names.get(c.abbreviation), n)) for c in self.columns[section.abbreviation])
+               runtime.encodeBatch(layouts[section.abbreviation], columns, buf, n, offset, plan.size)
+            #the routing fields are written last, over any section that shares their bytes
+            for section, offset, column, value in plan.routes:
+               runtime.encodeBatch(layouts[section.abbreviation], {column.name : value}, buf, n, offset, plan.size)
+            view = memoryview(buf)
+            records.extend([view[j:j + plan.size] for j in range(0, len(buf), plan.size)])
+         #records are grouped by message; put each back where its kind was drawn
+         order    = numpy.argsort(kinds, kind='stable')
+         position = numpy.empty_like(order)
+         position[order] = numpy.arange(len(order))
+         yield [records[j] for j in position.tolist()]
+
+##
+# @name _enum_values
+# @brief Lists the values of the enumerated fields of a section
+# @details Each named value is a (first, last) range; a value without last is a range of one.
+# @return dict The ranges of each field, keyed by abbreviation
+def _enum_values(section):
+   fields = {}
+   for part in (getattr(section, 'header', None), section, getattr(section, 'trailer', None)):
+      if part is not None:
+         fields.update(part.fields)
+   rv = {}
+   for abbreviation, field in fields.items():
+      if fieldLayout(field).kind == 'enum':
+         values = fieldValues(field)
+         rv[abbreviation] = sorted((int(v.ival, 0), int(v.last, 0)) for v in values.values.values())
+   return rv
+
+##
+# @name _raw_range
+# @brief Returns the smallest and largest integers the bits of a field hold
+def _raw_range(layout):
+   if layout.signed:
+      return (-(1 << (layout.bits - 1)), (1 << (layout.bits - 1)) - 1)
+   return (0, (1 << layout.bits) - 1)
+
+##
+# @name _python_value
+# @brief Returns a function drawing random values of a field from a random.Random
+def _python_value(column, names):
+   layout = column.layout
+   if layout.kind == 'enum':
+      #a named value is chosen, then a value within its range
+      return lambda rng: rng.randint(*rng.choice(names))
+   if layout.kind == 'bool':
+      return lambda rng: rng.getrandbits(1)
+   if layout.kind in ('float', 'double'):
+      return lambda rng: rng.uniform(-float_range, float_range)
+   if layout.kind == 'undecoded':
+      return lambda rng: rng.getrandbits(8 * layout.bytelength).to_bytes(layout.bytelength, 'little')
+   low, high = _raw_range(layout)
+   if layout.kind == 'weighted':
+      return lambda rng: rng.randint(low, high) * layout.lsb + (layout.offset or 0)
+   return lambda rng: rng.randint(low, high)
+
+##
+# @name _numpy_column
+# @brief Draws a column of random values of a field from a numpy.random.Generator
+def _numpy_column(rng, column, names, count):
+   layout = column.layout
+   if layout.kind == 'enum':
+      #a named value is chosen, then a value within its range
+      ranges = numpy.array(names, dtype=numpy.int64)[rng.integers(0, len(names), count)]
+      return rng.integers(ranges[:, 0], ranges[:, 1], endpoint=True)
+   if layout.kind == 'bool':
+      return rng.integers(0, 2, count)
+   if layout.kind in ('float', 'double'):
+      return rng.uniform(-float_range, float_range, count)
+   if layout.kind == 'undecoded':
+      return rng.integers(0, 256, (count, layout.bytelength), dtype=numpy.uint8)
+   low, high = _raw_range(layout)
+   raw = rng.integers(low, high, count, dtype=numpy.int64 if layout.signed else numpy.uint64, endpoint=True)
+   if layout.kind == 'weighted':
+      return raw * layout.lsb + (layout.offset or 0)
+   return raw
+
+##
+# @name writeRaw
+# @brief Writes records back to back
+# @param stream [in] The binary stream
+# @param blocks [in] Sequences of records, each joined into one write
+# @return dict The number of records and of bytes written
+def writeRaw(stream, blocks):
+   stats = {'records' : 0, 'bytes' : 0}
+   for block in blocks:
+      stats['bytes']   += stream.write(b''.join(block))
+      stats['records'] += len(block)
+   return stats
+
+##
+# @name _checksum
+# @brief Computes the Internet checksum of an IPv4 header
+def _checksum(header):
+   total = sum(struct.unpack('>{}H'.format(len(header) // 2), header))
+   while total >> 16:
+      total = (total & 0xFFFF) + (total >> 16)
+   return ~total & 0xFFFF
+
+##
+# @brief The Ethernet header of the generated packets, from 00:00:5e:00:53:02 to 00:00:5e:00:53:01
+_ethernet = b'\x00\x00\x5e\x00\x53\x01\x00\x00\x5e\x00\x53\x02\x08\x00'
+
+##
+# @brief The source and destination addresses of the generated packets, 10.0.0.1 and 10.0.0.2
+_addresses = b'\x0a\x00\x00\x01\x0a\x00\x00\x02'
+
+##
+# @brief The source port of the generated packets
+source_port = 49152
+
+##
+# @name writePcap
+# @brief Writes records as the payloads of a pcap capture, one Ethernet/IPv4 packet per record
+# @details The headers of each payload size are built once. TCP segments carry increasing
+#          sequence numbers, as one stream without a handshake; UDP datagrams have no checksum.
+# @param stream [in] The binary stream
+# @param blocks [in] Sequences of records, the packets of each joined into one write
+# @param port [in] The destination port
+# @param transport [in] 'udp' or 'tcp'
+# @param start [in] The timestamp of the first packet, in seconds since the epoch (default is now)
+# @param interval [in] The time between packets, in seconds, at microsecond resolution
+# @return dict The number of records and of bytes written
+def writePcap(stream, blocks, port, transport='udp', start=None, interval=1e-6):
+   protocol = {'udp' : 17, 'tcp' : 6}[transport]
+   layer    = 8 if transport == 'udp' else 20
+   step     = max(int(round(interval * 1e6)), 0)
+   clock    = int((time.time() if start is None else start) * 1e6)
+   headers  = {}
+   sequence = 0
+   stats    = {'records' : 0, 'bytes' : stream.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))}
+   stamp    = struct.Struct('<II').pack
+   segment  = struct.Struct('>HHIIBBHHH').pack
+   for block in blocks:
+      chunk = []
+      for record in block:
+         size   = len(record)
+         header = headers.get(size)
+         if header is None:
+            ip     = struct.pack('>BBHHHBBH8s', 0x45, 0, 20 + layer + size, 0, 0x4000, 64, protocol, 0, _addresses)
+            ip     = ip[:10] + struct.pack('>H', _checksum(ip)) + ip[12:]
+            header = struct.pack('<II', 14 + 20 + layer + size, 14 + 20 + layer + size) + _ethernet + ip
+            #the UDP header only depends on the size
+            if transport == 'udp':
+               header += struct.pack('>HHHH', source_port, port, 8 + size, 0)
+            headers[size] = header
+         chunk.append(stamp(clock // 1000000, clock % 1000000))
+         chunk.append(header)
+         if transport == 'tcp':
+            chunk.append(segment(source_port, port, sequence, 0, 0x50, 0x18, 65535, 0, 0))
+            sequence = (sequence + size) & 0xFFFFFFFF
+         chunk.append(record)
+         clock += step
+      stats['bytes']   += stream.write(b''.join(chunk))
+      stats['records'] += len(block)
+   return stats
+
+##
+# @brief The output formats, by name
+formats = OrderedDict([('raw', writeRaw), ('pcap', writePcap)])
+
+##
+# @name generateTraffic
+# @brief Writes random records of a protocol
+# @details pcap captures are sent to port, or to the port the protocol is registered on. Records
+#          start at the node registered on that port, or at the protocol, which is also where
+#          transmute.capture starts decoding them. raw records start at the protocol.
+# @param protocol [in] The validated Protocol
+# @param stream [in] The binary stream, or the path of a file, which is only created once the
+#                   arguments are checked
+# @param count [in] The number of records
+# @param fmt [in] The output format, one of formats
+# @param messages [in] The abbreviations of the messages to generate (default is every message)
+# @param seed [in] The seed of the random values (default is a random seed)
+# @param port [in] The UDP or TCP destination port of pcap captures
+# @return dict The number of records and of bytes written, and the elapsed time
+# @throws ValueError When a message is not routed, or a pcap capture has no port
+# @throws IOError When the file cannot be created
+def generateTraffic(protocol, stream, count, fmt='pcap', messages=None, seed=None, port=None):
+   begin   = time.perf_counter()
+   entry   = None
+   options = {}
+   if fmt == 'pcap':
+      entries = portEntries(protocol)
+      if port is None:
+         port = next((p for (t, p), node in sorted(entries.items()) if node is protocol), None)
+         if port is None:
+            raise ValueError("{} is not registered on a port; a pcap capture needs one".format(protocol.abbreviation))
+      transport = next((t for (t, p), node in sorted(entries.items()) if p == port), 'udp')
+      node      = entries.get((transport, port), protocol)
+      entry     = node.abbreviation if node is not protocol else None
+      options   = {'port' : port, 'transport' : transport}
+   generator = Generator(protocol, messages, entry, seed)
+   if isinstance(stream, str):
+      with open(stream, 'wb') as out:
+         stats = formats[fmt](out, generator.blocks(count), **options)
+   else:
+      stats = formats[fmt](stream, generator.blocks(count), **options)
+   stats['elapsed'] = time.perf_counter() - begin
+   _logger.info("Generated {records} records of {bytes} bytes in {elapsed:.3f} s".format(**stats))
+   return stats